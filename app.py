@@ -1,15 +1,35 @@
 import os
 import json
+import logging
 import sqlite3
 import time
 import hashlib
 import secrets
-from datetime import datetime
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 from functools import wraps
-from flask import Flask, request, jsonify, render_template, render_template_string, redirect, url_for, flash, session
-from PIL import Image, ExifTags
+from flask import Flask, Response, request, jsonify, render_template, render_template_string, redirect, url_for, flash, session, send_file
+from flask.json.provider import DefaultJSONProvider
 from dotenv import load_dotenv
-import google.generativeai as genai
+import assets
+import cache
+import compression
+import conditional
+import dedup
+import events
+import geo
+import heatmap
+import ids
+import idempotency
+import media
+import metrics
+import profiling
+import rollups
+import search
+import sla
+import uploads
+from logging_config import get_logger
 
 # Compatibility shim: some Werkzeug/Flask versions do not accept a
 # 'partitioned' keyword when calling Response.set_cookie. Newer
@@ -54,9 +74,31 @@ except Exception:
 # ==================== 1. INITIALIZATION & CONFIG ====================
 
 load_dotenv()
+logger = get_logger('app')
+
+class FixMyHydJSONProvider(DefaultJSONProvider):
+    """Timestamps in API responses as 'YYYY-MM-DD HH:MM:SS' from either database"""
+    @staticmethod
+    def default(o):
+        if isinstance(o, datetime):
+            return o.isoformat(' ', timespec='seconds')
+        return DefaultJSONProvider.default(o)
+
 app = Flask(__name__)
+app.json = FixMyHydJSONProvider(app)
 app.config['JSON_SORT_KEYS'] = False
 app.secret_key = os.getenv('SECRET_KEY', secrets.token_hex(32))
+metrics.init_app(app)
+profiling.init_app(app)
+cache.init_app(app)
+assets.init_app(app)
+compression.init_app(app)
+uploads.init_app(app)
+
+# Shared-cache lifetimes, in seconds
+STATS_CACHE_TTL = int(os.getenv('STATS_CACHE_TTL', '30'))
+GEOCODE_CACHE_TTL = int(os.getenv('GEOCODE_CACHE_TTL', str(30 * 86400)))
+GEMINI_CACHE_TTL = int(os.getenv('GEMINI_CACHE_TTL', str(7 * 86400)))
 
 COMPLAINT_CATEGORIES = [
     "Open Garbage Dump", "Sewage Leak/Overflow", "Pothole/Damaged Road",
@@ -66,10 +108,6 @@ COMPLAINT_CATEGORIES = [
 
 def check_api_keys():
     """Check if API keys are properly configured"""
-    print("\n" + "="*60)
-    print("API KEY CONFIGURATION CHECK")
-    print("="*60)
-    
     keys = {
         'GOOGLE_API_KEY_IMAGE': os.getenv('GOOGLE_API_KEY_IMAGE'),
         'GOOGLE_API_KEY_AUDIO': os.getenv('GOOGLE_API_KEY_AUDIO'),
@@ -80,83 +118,301 @@ def check_api_keys():
     all_set = True
     for key_name, key_value in keys.items():
         if key_value and len(key_value) > 10:
-            print(f"✅ {key_name}: Set (length: {len(key_value)})")
+            logger.info("API key %s: set (length: %d)", key_name, len(key_value))
         else:
-            print(f"❌ {key_name}: NOT SET or INVALID")
+            logger.warning("API key %s: NOT SET or INVALID", key_name)
             all_set = False
     
-    print("="*60)
     if not all_set:
-        print("⚠️  WARNING: Some API keys are missing!")
-        print("AI features will return placeholder data.")
-        print("Please set your Google API keys in .env file")
+        logger.warning("Some API keys are missing; AI features will return placeholder data. "
+                       "Please set your Google API keys in .env file")
     else:
-        print("✅ All API keys configured")
-    print("="*60 + "\n")
+        logger.info("All API keys configured")
     
     return all_set
 
-check_api_keys()
+_genai = None
+
+def get_genai():
+    """Import the Gemini SDK on first use; it takes ~0.5s to import and most requests never need it"""
+    global _genai
+    if _genai is None:
+        import google.generativeai as genai
+        _genai = genai
+    return _genai
+
+# One client per API key: genai.configure() is process-global, so with several gthread threads per
+# worker a submission could otherwise run with the key another one just configured
+_gemini_clients = {}
+_gemini_clients_lock = threading.Lock()
+
+def gemini_client(api_key):
+    """Synchronous Gemini client for api_key, created once per process"""
+    with _gemini_clients_lock:
+        client = _gemini_clients.get(api_key)
+        if client is None:
+            get_genai()
+            from google.ai import generativelanguage as glm
+            client = _gemini_clients[api_key] = glm.GenerativeServiceClient(client_options={'api_key': api_key})
+        return client
+
+def gemini_request(contents):
+    """GenerateContentRequest for GEMINI_MODEL from prompt strings and {'mime_type', 'data'} parts"""
+    genai = get_genai()
+    from google.ai import generativelanguage as glm
+    return glm.GenerateContentRequest(model=f'models/{GEMINI_MODEL}',
+                                      contents=genai.types.content_types.to_contents(contents))
+
+def gemini_generate(api_key, contents):
+    """Text of Gemini's reply to contents, called with api_key"""
+    response = gemini_client(api_key).generate_content(gemini_request(contents))
+    return get_genai().types.GenerateContentResponse.from_response(response).text
 
 # ==================== 2. DATABASE SETUP ====================
 
+class TimedSQLiteCursor(sqlite3.Cursor):
+    """SQLite cursor that records statement counts and timings in metrics"""
+    def execute(self, sql, parameters=()):
+        with metrics.DB_QUERY_DURATION.time(backend='sqlite'), profiling.span('db.execute', sql=sql.strip()[:120]):
+            return super().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        with metrics.DB_QUERY_DURATION.time(backend='sqlite'), profiling.span('db.executemany', sql=sql.strip()[:120]):
+            return super().executemany(sql, seq_of_parameters)
+
+
+class TimedSQLiteConnection(sqlite3.Connection):
+    """SQLite connection whose cursors (including conn.execute shortcuts) are timed"""
+    def cursor(self, factory=TimedSQLiteCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+_timed_postgres_cursor = None
+
+def _timed_postgres_cursor_class():
+    """RealDictCursor subclass that records statement counts and timings in metrics"""
+    global _timed_postgres_cursor
+    if _timed_postgres_cursor is not None:
+        return _timed_postgres_cursor
+    from psycopg2.extras import RealDictCursor
+
+    class TimedRealDictCursor(RealDictCursor):
+        def execute(self, query, vars=None):
+            with metrics.DB_QUERY_DURATION.time(backend='postgresql'), profiling.span('db.execute', sql=query.strip()[:120]):
+                return super().execute(query, vars)
+
+        def executemany(self, query, vars_list):
+            with metrics.DB_QUERY_DURATION.time(backend='postgresql'), profiling.span('db.executemany', sql=query.strip()[:120]):
+                return super().executemany(query, vars_list)
+
+    _timed_postgres_cursor = TimedRealDictCursor
+    return TimedRealDictCursor
+
+
+class PooledPostgresConnection:
+    """psycopg2 connection borrowed from the per-process pool; close() hands it back"""
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self.raw = raw
+
+    def close(self):
+        if self.raw is None:
+            return
+        raw, self.raw = self.raw, None
+        try:
+            # Never return a connection with an open transaction to the pool
+            raw.rollback()
+            self._pool.putconn(raw)
+        except Exception:
+            self._pool.putconn(raw, close=True)
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+
+_pg_pool = None
+_pg_pool_lock = threading.Lock()
+
+def _get_postgres_pool(database_url):
+    """Create this process's connection pool on first use (never in the gunicorn master)"""
+    global _pg_pool
+    if _pg_pool is None:
+        with _pg_pool_lock:
+            if _pg_pool is None:
+                from psycopg2.pool import ThreadedConnectionPool
+                _pg_pool = ThreadedConnectionPool(
+                    int(os.getenv('DB_POOL_MIN', '1')), int(os.getenv('DB_POOL_MAX', '10')),
+                    database_url, cursor_factory=_timed_postgres_cursor_class())
+    return _pg_pool
+
+
+def is_postgres_connection(conn):
+    """True for raw or pooled psycopg2 connections"""
+    if isinstance(conn, PooledPostgresConnection):
+        return True
+    try:
+        import psycopg2
+        return isinstance(conn, psycopg2.extensions.connection)
+    except ImportError:
+        return False
+
+
+# SQLite engine profile. WAL lets readers proceed while a writer commits; the
+# busy timeout makes concurrent writers wait for the lock instead of failing
+# with "database is locked".
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+SQLITE_PRAGMAS = (
+    ('synchronous', 'NORMAL'),  # durable in WAL mode except on power loss; no fsync per commit
+    ('foreign_keys', 'ON'),
+    ('mmap_size', int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))),
+    ('cache_size', -int(os.getenv('SQLITE_CACHE_KB', '16384'))),
+    ('temp_store', 'MEMORY'),
+)
+SQLITE_MAINTENANCE_INTERVAL = int(os.getenv('SQLITE_MAINTENANCE_INTERVAL', '3600'))
+
+# TIMESTAMP columns come back from SQLite as datetimes, as psycopg2 already does for PostgreSQL
+def _convert_timestamp(value):
+    try:
+        return datetime.fromisoformat(value.decode())
+    except ValueError:
+        logger.warning("Unreadable timestamp in database: %r", value)
+        return None
+
+sqlite3.register_converter('TIMESTAMP', _convert_timestamp)
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(' '))
+
+_wal_enabled = set()
+_last_sqlite_maintenance = time.monotonic()
+_sqlite_maintenance_lock = threading.Lock()
+
+def sqlite_database_path():
+    db_path = os.getenv('DATABASE_PATH', 'fixmyhyd.db')
+    # For Render, try a writable location
+    if '/opt/render' in os.getcwd():
+        db_path = '/tmp/fixmyhyd.db'
+    return db_path
+
+def configure_sqlite_connection(conn, db_path):
+    """Apply the engine profile to a new SQLite connection"""
+    if db_path != ':memory:' and db_path not in _wal_enabled:
+        # journal_mode is stored in the database file; once per process is enough
+        conn.execute('PRAGMA journal_mode=WAL')
+        _wal_enabled.add(db_path)
+    conn.execute(f'PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}')
+    for name, value in SQLITE_PRAGMAS:
+        conn.execute(f'PRAGMA {name} = {value}')
+
+def sqlite_maintenance(db_path):
+    """Checkpoint the WAL back into the database file and refresh planner statistics"""
+    conn = sqlite3.connect(db_path, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000)
+    try:
+        configure_sqlite_connection(conn, db_path)
+        busy, wal_pages, checkpointed = conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchone()
+        conn.execute('ANALYZE')
+        logger.info("SQLite maintenance: checkpointed %s/%s WAL pages%s", checkpointed, wal_pages,
+                    " (readers active, WAL not truncated)" if busy else "")
+        return {'wal_pages': wal_pages, 'checkpointed': checkpointed, 'busy': bool(busy)}
+    finally:
+        conn.close()
+
+def _maybe_run_sqlite_maintenance(db_path):
+    """Run sqlite_maintenance() in the background at most once per interval across all workers"""
+    global _last_sqlite_maintenance
+    if SQLITE_MAINTENANCE_INTERVAL <= 0 or time.monotonic() - _last_sqlite_maintenance < SQLITE_MAINTENANCE_INTERVAL:
+        return
+    if not _sqlite_maintenance_lock.acquire(blocking=False):
+        return
+    try:
+        _last_sqlite_maintenance = time.monotonic()
+        # The first worker to claim this interval does the work
+        if cache.get_cache().incr('sqlite:maintenance', ttl=SQLITE_MAINTENANCE_INTERVAL) != 1:
+            return
+    except Exception:
+        logger.exception("Could not claim SQLite maintenance slot")
+        return
+    finally:
+        _sqlite_maintenance_lock.release()
+
+    def run():
+        try:
+            sqlite_maintenance(db_path)
+        except sqlite3.Error:
+            logger.exception("SQLite maintenance failed")
+    threading.Thread(target=run, name='fixmyhyd-sqlite-maintenance', daemon=True).start()
+
+def reset_after_fork():
+    """Drop per-process state inherited from the gunicorn master (called from post_fork)"""
+    global _pg_pool
+    # Sockets opened by the master must not be shared with workers; just forget them
+    _pg_pool = None
+    # gRPC channels do not survive fork either
+    _gemini_clients.clear()
+    metrics.reset_after_fork()
+    cache.reset_after_fork()
+    ids.reset_after_fork()
+    import logging_config
+    logging_config.reset_after_fork()
+
+
 def get_db_connection():
     """Establishes database connection - PostgreSQL for production, SQLite for development."""
     database_url = os.getenv('DATABASE_URL')
     
-    print(f"🔗 Database URL present: {bool(database_url)}")
-    if database_url:
-        print(f"🔗 Database URL starts with: {database_url[:20]}...")
-    
     if database_url and ('postgresql' in database_url or 'postgres' in database_url):
         # Production: Use PostgreSQL
         try:
             import psycopg2
-            from psycopg2.extras import RealDictCursor
+            import psycopg2.pool
             
             # Fix Render's internal URL format if needed
             if database_url.startswith('postgres://'):
                 database_url = database_url.replace('postgres://', 'postgresql://', 1)
-                print("🔄 Fixed postgres:// to postgresql://")
             
-            print("🔗 Attempting PostgreSQL connection...")
-            conn = psycopg2.connect(database_url, cursor_factory=RealDictCursor)
-            print("✅ PostgreSQL connection successful")
+            if os.getenv('DB_POOL_ENABLED', '1') == '1':
+                pool = _get_postgres_pool(database_url)
+                try:
+                    return PooledPostgresConnection(pool, pool.getconn())
+                except psycopg2.pool.PoolError:
+                    logger.warning("PostgreSQL pool exhausted, opening a direct connection")
+            
+            conn = psycopg2.connect(database_url, cursor_factory=_timed_postgres_cursor_class())
+            metrics.DB_CONNECTIONS.inc(backend='postgresql')
+            logger.debug("PostgreSQL connection opened")
             return conn
             
         except ImportError as e:
-            print(f"❌ psycopg2 not installed: {e}")
-            print("📥 Install with: pip install psycopg2-binary")
             # Fall back to SQLite
-            print("🔄 Falling back to SQLite...")
+            logger.error("psycopg2 not installed (pip install psycopg2-binary), falling back to SQLite: %s", e)
             
         except Exception as e:
-            print(f"❌ PostgreSQL connection failed: {e}")
-            print(f"🔗 Database URL: {database_url[:50]}...")
             # Fall back to SQLite
-            print("🔄 Falling back to SQLite...")
+            logger.error("PostgreSQL connection failed, falling back to SQLite: %s", e)
     
     # Development: Use SQLite or fallback
-    print("🗄️ Using SQLite database...")
     try:
-        db_path = os.getenv('DATABASE_PATH', 'fixmyhyd.db')
-        
-        # For Render, try a writable location
-        if '/opt/render' in os.getcwd():
-            db_path = '/tmp/fixmyhyd.db'
-            print(f"🔗 Render detected, using temp path: {db_path}")
-        
-        conn = sqlite3.connect(db_path)
+        db_path = sqlite_database_path()
+        conn = sqlite3.connect(db_path, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000, factory=TimedSQLiteConnection,
+                               detect_types=sqlite3.PARSE_DECLTYPES)
         conn.row_factory = sqlite3.Row
-        print(f"✅ SQLite connection successful: {db_path}")
+        configure_sqlite_connection(conn, db_path)
+        metrics.DB_CONNECTIONS.inc(backend='sqlite')
+        logger.debug("SQLite connection opened: %s", db_path)
+        _maybe_run_sqlite_maintenance(db_path)
         return conn
         
     except Exception as e:
-        print(f"❌ SQLite connection also failed: {e}")
         # Last resort: in-memory database
-        print("🔄 Using in-memory database (data will not persist)")
-        conn = sqlite3.connect(':memory:')
+        logger.error("SQLite connection failed, using in-memory database (data will not persist): %s", e)
+        conn = sqlite3.connect(':memory:', factory=TimedSQLiteConnection,
+                               detect_types=sqlite3.PARSE_DECLTYPES)
         conn.row_factory = sqlite3.Row
+        metrics.DB_CONNECTIONS.inc(backend='sqlite')
         return conn
 
 def hash_password(password):
@@ -173,6 +429,26 @@ def verify_password(password, stored_hash):
     except:
         return False
 
+# Columns added to complaints after the first release; created on existing databases too
+COMPLAINT_COLUMNS = [
+    ('image_phash', 'TEXT'),         # perceptual hash of the photo, for duplicate detection
+    ('report_text', 'TEXT'),         # the citizen's own words, before AI rewriting
+    ('duplicate_of', 'INTEGER'),     # original complaint when this report was linked as a duplicate
+    ('report_count', 'INTEGER DEFAULT 1'),  # citizens who reported this issue (original + duplicates)
+    ('image_sha256', 'TEXT'),        # the photo in the media store (media.py)
+]
+
+def ensure_complaint_columns(cursor, postgres):
+    if postgres:
+        for name, definition in COMPLAINT_COLUMNS:
+            cursor.execute(f'ALTER TABLE complaints ADD COLUMN IF NOT EXISTS {name} {definition}')
+    else:
+        existing = {row[1] for row in cursor.execute('PRAGMA table_info(complaints)').fetchall()}
+        for name, definition in COMPLAINT_COLUMNS:
+            if name not in existing:
+                cursor.execute(f'ALTER TABLE complaints ADD COLUMN {name} {definition}')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_complaints_duplicate_of ON complaints (duplicate_of)')
+
 def init_database():
     """Initializes database tables and creates the default admin user."""
     try:
@@ -185,19 +461,15 @@ def init_database():
         is_postgres_url = database_url and ('postgresql' in database_url or 'postgres' in database_url)
         
         # Test if we're actually using PostgreSQL by checking connection type
-        is_actual_postgres = False
-        try:
-            import psycopg2
-            is_actual_postgres = isinstance(conn, psycopg2.extensions.connection)
-        except:
-            is_actual_postgres = False
+        is_actual_postgres = is_postgres_connection(conn)
         
-        print(f"🔗 Database URL Type: {'PostgreSQL' if is_postgres_url else 'SQLite'}")
-        print(f"🔗 Actual Connection: {'PostgreSQL' if is_actual_postgres else 'SQLite'}")
+        logger.info("Database URL type: %s, actual connection: %s",
+                    'PostgreSQL' if is_postgres_url else 'SQLite',
+                    'PostgreSQL' if is_actual_postgres else 'SQLite')
         
         if is_actual_postgres:
             # PostgreSQL syntax
-            print("📊 Creating PostgreSQL tables...")
+            logger.info("Creating PostgreSQL tables")
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS complaints (
                     id SERIAL PRIMARY KEY,
@@ -251,6 +523,11 @@ def init_database():
                 )
             ''')
             
+            ensure_complaint_columns(cursor, postgres=True)
+            for statement in (geo.POSTGRES_SPATIAL_SCHEMA + heatmap.POSTGRES_HEATMAP_SCHEMA + search.POSTGRES_SEARCH_SCHEMA
+                              + rollups.POSTGRES_ROLLUP_SCHEMA + sla.POSTGRES_SLA_SCHEMA):
+                cursor.execute(statement)
+            
             # Check for existing admin
             cursor.execute('SELECT COUNT(*) FROM admins')
             result = cursor.fetchone()
@@ -258,7 +535,7 @@ def init_database():
             
         else:
             # SQLite syntax
-            print("📊 Creating SQLite tables...")
+            logger.info("Creating SQLite tables")
             
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS complaints (
@@ -315,6 +592,11 @@ def init_database():
                 )
             ''')
             
+            ensure_complaint_columns(cursor, postgres=False)
+            for statement in (geo.SQLITE_SPATIAL_SCHEMA + heatmap.SQLITE_HEATMAP_SCHEMA + search.SQLITE_SEARCH_SCHEMA
+                              + rollups.SQLITE_ROLLUP_SCHEMA + sla.SQLITE_SLA_SCHEMA):
+                cursor.execute(statement)
+            
             # Check for existing admin
             cursor.execute('SELECT COUNT(*) FROM admins')
             result = cursor.fetchone()
@@ -322,7 +604,7 @@ def init_database():
         
         # Create default admin if none exists
         if admin_count == 0:
-            print("👤 Creating default admin user...")
+            logger.info("Creating default admin user")
             admin_password = hash_password('admin123')
             
             if is_actual_postgres:
@@ -339,116 +621,197 @@ def init_database():
         conn.commit()
         cursor.close()
         conn.close()
-        print("✅ Database initialized successfully")
+        logger.info("Database initialized successfully")
         
-    except Exception as e:
-        print(f"❌ Database initialization error: {e}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        logger.exception("Database initialization error")
         raise
 
-# Initialize database immediately when app starts (for production deployment)
-try:
-    print("🚀 Initializing database on app startup...")
-    init_database()
-    print("✅ App startup database initialization completed")
-except Exception as e:
-    print(f"❌ App startup database initialization failed: {e}")
-    import traceback
-    traceback.print_exc()
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+def ensure_database():
+    """Run init_database() once per process, on first use rather than at import time"""
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if not _schema_ready:
+            init_database()
+            _schema_ready = True
+
+@app.before_request
+def _ensure_database_before_request():
+    # Deployments that run `python manage.py init-db` as a release step can set AUTO_INIT_DB=0
+    if _schema_ready or os.getenv('AUTO_INIT_DB', '1') == '0':
+        return
+    try:
+        ensure_database()
+    except Exception:
+        logger.exception("Lazy database initialization failed")
+
+_started = False
+
+def create_app():
+    """Application factory for gunicorn ("app:create_app()"), run.py and manage.py.
+
+    Importing this module does no I/O: the API key check runs here once, the
+    schema is created on the first request (or by `python manage.py init-db`),
+    and the Gemini, Pillow and geopy SDKs are imported when first used.
+    """
+    global _started
+    if not _started:
+        _started = True
+        check_api_keys()
+    return app
 
 # ==================== 3. AI HELPER FUNCTIONS (PLACEHOLDERS) ====================
 # NOTE: Actual Gemini API integration logic is complex and requires proper API keys.
 # These functions are placeholders to ensure the app logic can proceed.
+# The prompt builders and response parser are shared with async_pipeline.py.
+GEMINI_MODEL = 'gemini-2.5-flash-lite'
+
+AUDIO_PROMPT = """
+        You are an audio transcription service for GHMC. Transcribe the following audio complaint.
+        Return ONLY the transcribed text.
+        """
+
+def build_image_prompt():
+    return f"""
+        Analyze the image of a civic issue in Hyderabad, India. Provide a response in a valid JSON object with two keys:
+        1. "summary": A brief, one-sentence summary of the scene.
+        2. "category": Classify the issue into one of these exact categories: {', '.join(COMPLAINT_CATEGORIES)}.
+        """
+
+def build_text_prompt(description):
+    return f"""
+        Analyze the following user-submitted civic complaint. Provide a response in a valid JSON object with four keys:
+        1. "category": Classify the issue into one of these exact categories: {', '.join(COMPLAINT_CATEGORIES)}.
+        2. "priority": Assess the priority as 'Low', 'Medium', or 'High'.
+        3. "summary": Create a succinct, one-sentence summary of the core problem.
+        4. "actionable_steps": Suggest 2-3 brief, actionable steps.
+        Complaint: "{description}"
+        """
+
+def build_report_prompt(data):
+    return f"""
+        You are an AI assistant for the GHMC. Synthesize the provided information into a structured, formal complaint.
+        The final output must be a single, valid JSON object with the keys: "subject", "description", and "zone".
+        Contextual Information:
+        - Image Analysis: {data.get('image_analysis')}
+        - Voice Transcription: {data.get('voice_transcription')}
+        - Text Analysis: {data.get('text_analysis')}
+        - Location Text: {data.get('location_text', 'Not provided')}
+        """
+
+def parse_gemini_json(response_text):
+    """Strip markdown code fences from a Gemini reply and parse it as JSON"""
+    return json.loads(response_text.strip().replace("```json", "").replace("```", ""))
+
+def gemini_cache_key(api, *parts):
+    """Cache key for a Gemini call: API name plus a hash of the model and every prompt part"""
+    digest = hashlib.sha256(GEMINI_MODEL.encode())
+    for part in parts:
+        if isinstance(part, dict):
+            part = part['data']
+        if isinstance(part, str):
+            part = part.encode()
+        digest.update(b'\0')
+        digest.update(part)
+    return f"{api}:{digest.hexdigest()}"
+
+def is_quota_error(error):
+    error_str = str(error)
+    return "429" in error_str or "quota" in error_str.lower()
+
+def quota_retry_delay(attempt):
+    return (2 ** attempt) * 2 + 7
+
 def analyze_image_with_gemini(image_stream, max_retries=3):
     try:
         api_key = os.getenv("GOOGLE_API_KEY_IMAGE")
         if not api_key: 
-            print("❌ ERROR: GOOGLE_API_KEY_IMAGE is not set!")
             raise ValueError("GOOGLE_API_KEY_IMAGE is not set!")
         
-        print(f"📸 Calling Gemini Image API (key length: {len(api_key)})")
-        genai.configure(api_key=api_key)
+        logger.debug("Calling Gemini Image API")
         
-        image_bytes = image_stream.read()
-        print(f"📸 Image size: {len(image_bytes)} bytes")
+        with profiling.span('image.read'):
+            image_bytes = image_stream.read()
+        logger.debug("Image size: %d bytes", len(image_bytes))
         image_part = {"mime_type": "image/jpeg", "data": image_bytes}
-        prompt = f"""
-        Analyze the image of a civic issue in Hyderabad, India. Provide a response in a valid JSON object with two keys:
-        1. "summary": A brief, one-sentence summary of the scene.
-        2. "category": Classify the issue into one of these exact categories: {', '.join(COMPLAINT_CATEGORIES)}.
-        """
-        
-        # Use gemini-1.5-flash for better rate limits
-        model = genai.GenerativeModel('gemini-2.5-flash-lite')
+        prompt = build_image_prompt()
+        cache_key = gemini_cache_key('image', prompt, image_part)
+        cached = cache.lookup('gemini', cache_key)
+        if cached is not None:
+            return cached
         
         # Retry logic for quota errors
         for attempt in range(max_retries):
             try:
-                print(f"📸 Attempt {attempt + 1}/{max_retries}...")
-                response = model.generate_content([prompt, image_part])
-                response_text = response.text.strip().replace("```json", "").replace("```", "")
-                print(f"📸 API Response: {response_text[:200]}...")
-                result = json.loads(response_text)
-                print(f"✅ Image analysis successful: {result}")
+                logger.debug("Gemini Image API attempt %d/%d", attempt + 1, max_retries)
+                with profiling.span('gemini.generate', api='image', attempt=attempt + 1):
+                    response_text = gemini_generate(api_key, [prompt, image_part])
+                logger.debug("Gemini Image API response: %.200s", response_text)
+                result = parse_gemini_json(response_text)
+                logger.debug("Image analysis successful: %s", result)
+                metrics.record_gemini_call('image', 'success')
+                cache.store('gemini', cache_key, result, GEMINI_CACHE_TTL)
                 return result
             except Exception as e:
                 error_str = str(e)
-                print(f"❌ Image API error (attempt {attempt + 1}): {error_str}")
-                if "429" in error_str or "quota" in error_str.lower():
+                logger.warning("Gemini Image API error (attempt %d): %s", attempt + 1, error_str)
+                if is_quota_error(error_str):
+                    metrics.GEMINI_RATE_LIMITED.inc(api='image')
                     if attempt < max_retries - 1:
-                        wait_time = (2 ** attempt) * 2 + 7
-                        print(f"⏳ Quota exceeded, retrying in {wait_time}s...")
-                        time.sleep(wait_time)
+                        wait_time = quota_retry_delay(attempt)
+                        logger.warning("Gemini quota exceeded, retrying in %ss", wait_time)
+                        metrics.GEMINI_RETRIES.inc(api='image')
+                        with profiling.span('gemini.retry_sleep', api='image', seconds=wait_time):
+                            time.sleep(wait_time)
                         continue
+                metrics.record_gemini_call('image', 'error')
                 raise e
                 
-    except Exception as e:
-        print(f"❌ FATAL ERROR in analyze_image_with_gemini: {e}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        logger.exception("Fatal error in analyze_image_with_gemini")
         return None
 
 
-def transcribe_audio_with_gemini(audio_file, max_retries=3):
+def transcribe_audio_with_gemini(audio_bytes, mimetype, max_retries=3):
     try:
         api_key = os.getenv("GOOGLE_API_KEY_AUDIO")
         if not api_key: 
-            print("❌ ERROR: GOOGLE_API_KEY_AUDIO is not set!")
             raise ValueError("GOOGLE_API_KEY_AUDIO is not set!")
         
-        print(f"🎤 Calling Gemini Audio API")
-        genai.configure(api_key=api_key)
-
-        prompt = """
-        You are an audio transcription service for GHMC. Transcribe the following audio complaint.
-        Return ONLY the transcribed text.
-        """
+        logger.debug("Calling Gemini Audio API")
+        # Sent inline: voice notes are capped well below Gemini's inline size limit
+        audio_part = {"mime_type": mimetype, "data": audio_bytes}
+        prompt = AUDIO_PROMPT
         
         for attempt in range(max_retries):
             try:
-                print(f"🎤 Uploading audio file: {audio_file}")
-                uploaded_file = genai.upload_file(path=audio_file, display_name="user_complaint_audio")
-                model = genai.GenerativeModel('gemini-2.5-flash-lite')
-                response = model.generate_content([prompt, uploaded_file])
-                genai.delete_file(uploaded_file.name)
-                print(f"✅ Audio transcription successful")
-                return {"transcription": response.text}
+                with profiling.span('gemini.generate', api='audio', attempt=attempt + 1):
+                    transcription = gemini_generate(api_key, [prompt, audio_part])
+                logger.debug("Audio transcription successful")
+                metrics.record_gemini_call('audio', 'success')
+                return {"transcription": transcription}
             except Exception as e:
                 error_str = str(e)
-                print(f"❌ Audio API error (attempt {attempt + 1}): {error_str}")
-                if "429" in error_str or "quota" in error_str.lower():
+                logger.warning("Gemini Audio API error (attempt %d): %s", attempt + 1, error_str)
+                if is_quota_error(error_str):
+                    metrics.GEMINI_RATE_LIMITED.inc(api='audio')
                     if attempt < max_retries - 1:
-                        wait_time = (2 ** attempt) * 2 + 7
-                        print(f"⏳ Quota exceeded, retrying in {wait_time}s...")
-                        time.sleep(wait_time)
+                        wait_time = quota_retry_delay(attempt)
+                        logger.warning("Gemini quota exceeded, retrying in %ss", wait_time)
+                        metrics.GEMINI_RETRIES.inc(api='audio')
+                        with profiling.span('gemini.retry_sleep', api='audio', seconds=wait_time):
+                            time.sleep(wait_time)
                         continue
+                metrics.record_gemini_call('audio', 'error')
                 raise e
                 
-    except Exception as e:
-        print(f"❌ FATAL ERROR in transcribe_audio_with_gemini: {e}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        logger.exception("Fatal error in transcribe_audio_with_gemini")
         return {"transcription": "Demonstration fallback: Could not process audio file via API."}
 
 
@@ -456,46 +819,43 @@ def analyze_text_with_gemini(description, max_retries=3):
     try:
         api_key = os.getenv("GOOGLE_API_KEY_TEXT")
         if not api_key: 
-            print("❌ ERROR: GOOGLE_API_KEY_TEXT is not set!")
             raise ValueError("GOOGLE_API_KEY_TEXT is not set!")
         
-        print(f"📝 Calling Gemini Text API for description: {description[:100]}...")
-        genai.configure(api_key=api_key)
-
-        prompt = f"""
-        Analyze the following user-submitted civic complaint. Provide a response in a valid JSON object with four keys:
-        1. "category": Classify the issue into one of these exact categories: {', '.join(COMPLAINT_CATEGORIES)}.
-        2. "priority": Assess the priority as 'Low', 'Medium', or 'High'.
-        3. "summary": Create a succinct, one-sentence summary of the core problem.
-        4. "actionable_steps": Suggest 2-3 brief, actionable steps.
-        Complaint: "{description}"
-        """
+        logger.debug("Calling Gemini Text API for description: %.100s", description)
+        prompt = build_text_prompt(description)
+        cache_key = gemini_cache_key('text', prompt)
+        cached = cache.lookup('gemini', cache_key)
+        if cached is not None:
+            return cached
         
         for attempt in range(max_retries):
             try:
-                print(f"📝 Attempt {attempt + 1}/{max_retries}...")
-                model = genai.GenerativeModel('gemini-2.5-flash-lite')
-                response = model.generate_content(prompt)
-                response_text = response.text.strip().replace("```json", "").replace("```", "")
-                print(f"📝 API Response: {response_text[:200]}...")
-                result = json.loads(response_text)
-                print(f"✅ Text analysis successful: {result}")
+                logger.debug("Gemini Text API attempt %d/%d", attempt + 1, max_retries)
+                with profiling.span('gemini.generate', api='text', attempt=attempt + 1):
+                    response_text = gemini_generate(api_key, prompt)
+                logger.debug("Gemini Text API response: %.200s", response_text)
+                result = parse_gemini_json(response_text)
+                logger.debug("Text analysis successful: %s", result)
+                metrics.record_gemini_call('text', 'success')
+                cache.store('gemini', cache_key, result, GEMINI_CACHE_TTL)
                 return result
             except Exception as e:
                 error_str = str(e)
-                print(f"❌ Text API error (attempt {attempt + 1}): {error_str}")
-                if "429" in error_str or "quota" in error_str.lower():
+                logger.warning("Gemini Text API error (attempt %d): %s", attempt + 1, error_str)
+                if is_quota_error(error_str):
+                    metrics.GEMINI_RATE_LIMITED.inc(api='text')
                     if attempt < max_retries - 1:
-                        wait_time = (2 ** attempt) * 2 + 7
-                        print(f"⏳ Quota exceeded, retrying in {wait_time}s...")
-                        time.sleep(wait_time)
+                        wait_time = quota_retry_delay(attempt)
+                        logger.warning("Gemini quota exceeded, retrying in %ss", wait_time)
+                        metrics.GEMINI_RETRIES.inc(api='text')
+                        with profiling.span('gemini.retry_sleep', api='text', seconds=wait_time):
+                            time.sleep(wait_time)
                         continue
+                metrics.record_gemini_call('text', 'error')
                 raise e
                 
-    except Exception as e:
-        print(f"❌ FATAL ERROR in analyze_text_with_gemini: {e}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        logger.exception("Fatal error in analyze_text_with_gemini")
         return None
 
 
@@ -503,60 +863,58 @@ def generate_formal_report_with_gemini(data, max_retries=3):
     try:
         api_key = os.getenv("GOOGLE_API_KEY_REPORT")
         if not api_key: 
-            print("❌ ERROR: GOOGLE_API_KEY_REPORT is not set!")
             raise ValueError("GOOGLE_API_KEY_REPORT is not set!")
         
-        print(f"📋 Calling Gemini Report Generation API")
-        print(f"📋 Input data: {json.dumps(data, indent=2)}")
-        genai.configure(api_key=api_key)
-
-        prompt = f"""
-        You are an AI assistant for the GHMC. Synthesize the provided information into a structured, formal complaint.
-        The final output must be a single, valid JSON object with the keys: "subject", "description", and "zone".
-        Contextual Information:
-        - Image Analysis: {data.get('image_analysis')}
-        - Voice Transcription: {data.get('voice_transcription')}
-        - Text Analysis: {data.get('text_analysis')}
-        - Location Text: {data.get('location_text', 'Not provided')}
-        """
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Calling Gemini Report Generation API with input: %s", json.dumps(data))
+        prompt = build_report_prompt(data)
+        cache_key = gemini_cache_key('report', prompt)
+        cached = cache.lookup('gemini', cache_key)
+        if cached is not None:
+            return cached
         
         for attempt in range(max_retries):
             try:
-                print(f"📋 Attempt {attempt + 1}/{max_retries}...")
-                model = genai.GenerativeModel('gemini-2.5-flash-lite')
-                response = model.generate_content(prompt)
-                response_text = response.text.strip().replace("```json", "").replace("```", "")
-                print(f"📋 API Response: {response_text[:200]}...")
-                result = json.loads(response_text)
-                print(f"✅ Report generation successful: {result}")
+                logger.debug("Gemini Report API attempt %d/%d", attempt + 1, max_retries)
+                with profiling.span('gemini.generate', api='report', attempt=attempt + 1):
+                    response_text = gemini_generate(api_key, prompt)
+                logger.debug("Gemini Report API response: %.200s", response_text)
+                result = parse_gemini_json(response_text)
+                logger.debug("Report generation successful: %s", result)
+                metrics.record_gemini_call('report', 'success')
+                cache.store('gemini', cache_key, result, GEMINI_CACHE_TTL)
                 return result
             except Exception as e:
                 error_str = str(e)
-                print(f"❌ Report API error (attempt {attempt + 1}): {error_str}")
-                if "429" in error_str or "quota" in error_str.lower():
+                logger.warning("Gemini Report API error (attempt %d): %s", attempt + 1, error_str)
+                if is_quota_error(error_str):
+                    metrics.GEMINI_RATE_LIMITED.inc(api='report')
                     if attempt < max_retries - 1:
-                        wait_time = (2 ** attempt) * 2 + 7
-                        print(f"⏳ Quota exceeded, retrying in {wait_time}s...")
-                        time.sleep(wait_time)
+                        wait_time = quota_retry_delay(attempt)
+                        logger.warning("Gemini quota exceeded, retrying in %ss", wait_time)
+                        metrics.GEMINI_RETRIES.inc(api='report')
+                        with profiling.span('gemini.retry_sleep', api='report', seconds=wait_time):
+                            time.sleep(wait_time)
                         continue
+                metrics.record_gemini_call('report', 'error')
                 raise e
                 
-    except Exception as e:
-        print(f"❌ FATAL ERROR in generate_formal_report_with_gemini: {e}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        logger.exception("Fatal error in generate_formal_report_with_gemini")
         return None
 
-import os
-import time
-import google.generativeai as genai
-import traceback
+def _nominatim_reverse(latitude, longitude):
+    from geopy.geocoders import Nominatim
 
-# Add this new import at the top of app.py
-from geopy.geocoders import Nominatim
-from geopy.exc import GeocoderUnavailable
+    # The user_agent is important for Nominatim's usage policy
+    geolocator = Nominatim(user_agent="fixmyhyd_app")
+    with profiling.span('nominatim.reverse'):
+        location = geolocator.reverse((latitude, longitude), exactly_one=True, timeout=10)
+    if location:
+        logger.debug("Nominatim (OSM) geocoding successful: %s", location.address)
+        return location.address
+    return None
 
-# Replace your reverse_geocode_coordinates function with this one
 def reverse_geocode_coordinates(latitude, longitude):
     """
     Converts GPS coordinates to a human-readable address using OpenStreetMap's Nominatim service.
@@ -564,27 +922,23 @@ def reverse_geocode_coordinates(latitude, longitude):
     if latitude is None or longitude is None:
         return "Location not available"
 
-    try:
-        # The user_agent is important for Nominatim's usage policy
-        geolocator = Nominatim(user_agent="fixmyhyd_app")
-        
-        # Make the API call
-        location = geolocator.reverse((latitude, longitude), exactly_one=True, timeout=10)
+    from geopy.exc import GeocoderUnavailable
 
-        # Check if we got a result and return the address
-        if location:
-            address = location.address
-            print(f"🌍 Nominatim (OSM) Geocoding successful: {address}")
+    try:
+        # ~1 m precision; Nominatim results are shared by all workers
+        address = cache.memoize('geocode', f"{latitude:.5f},{longitude:.5f}",
+                                lambda: _nominatim_reverse(latitude, longitude), GEOCODE_CACHE_TTL)
+        if address:
             return address
         else:
             return "Could not determine address from coordinates via Nominatim."
             
     except GeocoderUnavailable as e:
-        print(f"❌ Nominatim service is unavailable: {e}")
+        logger.warning("Nominatim service is unavailable: %s", e)
         return f"Geocoding service is temporarily down. Lat/Lng: ({latitude:.4f}, {longitude:.4f})"
         
     except Exception as e:
-        print(f"❌ FATAL ERROR in reverse_geocode_coordinates (Nominatim): {e}")
+        logger.exception("Fatal error in reverse_geocode_coordinates (Nominatim)")
         return f"Geocoding failed due to an error. Lat/Lng: ({latitude:.4f}, {longitude:.4f})"
     
     
@@ -625,13 +979,8 @@ def execute_query(conn, query, params=None, fetch_one=False, fetch_all=False):
             return []
         else:
             return cursor
-    except Exception as e:
-        print(f"❌ Database query error: {e}")
-        print(f"Query: {query}")
-        print(f"Params: {params}")
-        print(f"Is PostgreSQL: {is_postgres}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        logger.exception("Database query error (postgres=%s): %s", bool(is_postgres), query)
         raise
 
 def login_required(f):
@@ -661,34 +1010,77 @@ def user_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
-# ==================== 5. UTILITY FUNCTIONS (INCLUDING TIMESTAMP PARSING) ====================
+# Per-worker cap on concurrent AI submissions. With threaded workers this keeps
+# some threads free for fast dashboard requests while slow Gemini calls are in flight.
+AI_MAX_CONCURRENCY = int(os.getenv('AI_MAX_CONCURRENCY', '4'))
+AI_QUEUE_TIMEOUT = float(os.getenv('AI_QUEUE_TIMEOUT', '2'))
+_ai_slots = threading.BoundedSemaphore(AI_MAX_CONCURRENCY) if AI_MAX_CONCURRENCY > 0 else None
+
+def ai_concurrency_limited(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if _ai_slots is None:
+            return f(*args, **kwargs)
+        if not _ai_slots.acquire(timeout=AI_QUEUE_TIMEOUT):
+            logger.warning("AI submission rejected: %d submissions already in progress", AI_MAX_CONCURRENCY)
+            response = jsonify({"error": "The server is busy processing other reports. Please try again shortly."})
+            response.headers['Retry-After'] = '10'
+            return response, 503
+        try:
+            return f(*args, **kwargs)
+        finally:
+            _ai_slots.release()
+    return decorated_function
+
+def idempotent_submission(f):
+    """Answer retried report submissions from the first attempt instead of re-running the pipeline.
+
+    Runs before ai_concurrency_limited so that retries never take an AI slot.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        image_file = request.files.get('image')
+        client_key = request.headers.get('Idempotency-Key') or request.form.get('idempotency_key')
+        if image_file is None and not client_key:
+            return f(*args, **kwargs)
+        key = idempotency.submission_key(
+            session['user_id'], client_key,
+            None if client_key else idempotency.image_digest(image_file.stream))
+
+        state, ack = idempotency.claim(key)
+        if state == idempotency.IN_FLIGHT:
+            response = jsonify({"error": "This report is still being processed. Please check your dashboard shortly."})
+            response.headers['Retry-After'] = '10'
+            return response, 409
+        if state == idempotency.DONE:
+            logger.info("Replaying acknowledgement for a duplicate submission")
+            response = jsonify(ack)
+            response.headers[idempotency.REPLAY_HEADER] = 'true'
+            return response, 201
+
+        try:
+            result = f(*args, **kwargs)
+        except BaseException:
+            idempotency.abandon(key)
+            raise
+        response, status = result if isinstance(result, tuple) else (result, result.status_code)
+        if status == 201:
+            idempotency.complete(key, response.get_json())
+        else:
+            idempotency.abandon(key)
+        return result
+    return decorated_function
+
+# ==================== 5. UTILITY FUNCTIONS (INCLUDING TIMESTAMP FORMATTING) ====================
 
 def get_gps_coordinates(image_stream):
     # This function is now unused as device GPS is primary.
     return {"latitude": None, "longitude": None} 
 
-def parse_timestamp(timestamp_str):
-    """Convert string timestamp (from SQLite) to datetime object"""
-    if isinstance(timestamp_str, datetime):
-        return timestamp_str
-    if timestamp_str is None:
-        return None
-    try:
-        # Try parsing ISO format
-        return datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
-    except:
-        try:
-            # Try common SQLite format
-            return datetime.strptime(timestamp_str, '%Y-%m-%d %H:%M:%S')
-        except:
-            return None
-
 # Add Jinja2 template filters for safe timestamp formatting
 @app.template_filter('format_date')
 def format_date(timestamp):
     """Format timestamp for display (Date only)"""
-    if isinstance(timestamp, str):
-        timestamp = parse_timestamp(timestamp)
     if timestamp is None:
         return 'N/A'
     return timestamp.strftime('%d %b %Y')
@@ -696,8 +1088,6 @@ def format_date(timestamp):
 @app.template_filter('format_datetime')
 def format_datetime(timestamp):
     """Format timestamp with time for display"""
-    if isinstance(timestamp, str):
-        timestamp = parse_timestamp(timestamp)
     if timestamp is None:
         return 'N/A'
     return timestamp.strftime('%d %b %Y %I:%M %p')
@@ -710,6 +1100,11 @@ def format_datetime(timestamp):
 #     return render_template('home.html')
 @app.route('/')
 def home():
+    # Site-wide numbers are the same for every visitor; share them across workers
+    admin_stats = cache.memoize('stats', 'home', compute_home_stats, STATS_CACHE_TTL)
+    return render_template('home.html', admin_stats=admin_stats)
+
+def compute_home_stats():
     conn = get_db_connection()
     cursor = conn.cursor()
 
@@ -723,32 +1118,19 @@ def home():
     total_users = cursor.execute('SELECT COUNT(*) FROM users').fetchone()[0]
     resolution_rate = round((resolved_complaints / total_complaints * 100) if total_complaints > 0 else 0)
 
-    # --- Average days to resolve ---
-    if is_postgres:
-        cursor.execute("""
-            SELECT AVG(EXTRACT(EPOCH FROM (updated_at - created_at)) / 86400.0)
-            FROM complaints WHERE status = 'Resolved'
-        """)
-    else:
-        cursor.execute("""
-            SELECT AVG(JULIANDAY(updated_at) - JULIANDAY(created_at))
-            FROM complaints WHERE status = "Resolved"
-        """)
-
-    avg_days_result = cursor.fetchone()[0]
-    avg_days = round(avg_days_result or 0, 1)
+    # --- Average days to resolve (from the status history, not updated_at) ---
+    resolve = compute_sla_summaries(conn, sla.RESOLVE)[0]
+    avg_days = round((resolve['mean'] or 0) / 86400, 1)
 
     conn.close()
 
-    admin_stats = {
+    return {
         "total_complaints": total_complaints,
         "resolution_rate": resolution_rate,
         "avg_days": avg_days,
         "total_users": total_users
     }
 
-    return render_template('home.html', admin_stats=admin_stats)
-
 
 
 @app.route('/user/login', methods=['GET', 'POST'])
@@ -806,6 +1188,7 @@ def user_register():
                 VALUES (?, ?, ?, ?)
             ''', (name, email, password_hash, phone))
             conn.commit()
+            invalidate_stats()
             flash('Registration successful! Please log in.', 'success')
             return redirect(url_for('user_login'))
         except sqlite3.Error as e:
@@ -834,12 +1217,7 @@ def admin_login():
             cursor = conn.cursor()
             
             # Determine actual database type by testing connection
-            is_actual_postgres = False
-            try:
-                import psycopg2
-                is_actual_postgres = isinstance(conn, psycopg2.extensions.connection)
-            except:
-                is_actual_postgres = False
+            is_actual_postgres = is_postgres_connection(conn)
             
             if is_actual_postgres:
                 cursor.execute('SELECT * FROM admins WHERE username = %s', (username,))
@@ -864,46 +1242,87 @@ def admin_login():
                 flash('Invalid username or password.', 'error')
                 
         except Exception as e:
-            print(f"❌ Admin login database error: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Admin login database error")
             flash('Database connection error. Please try again.', 'error')
     
     return render_template('admin_login.html')
 
+def compute_user_stats(conn, user_id):
+    total_complaints = conn.execute('SELECT COUNT(*) FROM complaints WHERE user_id = ?', (user_id,)).fetchone()[0]
+    pending_complaints = conn.execute('SELECT COUNT(*) FROM complaints WHERE user_id = ? AND status IN ("Submitted", "In Progress")', (user_id,)).fetchone()[0]
+    resolved_complaints = conn.execute('SELECT COUNT(*) FROM complaints WHERE user_id = ? AND status = "Resolved"', (user_id,)).fetchone()[0]
+    resolution_rate = round((resolved_complaints / total_complaints * 100) if total_complaints > 0 else 0)
+    return {
+        'total_complaints': total_complaints,
+        'pending_complaints': pending_complaints,
+        'resolved_complaints': resolved_complaints,
+        'resolution_rate': resolution_rate
+    }
+
+def compute_admin_stats(conn):
+    total_complaints = conn.execute('SELECT COUNT(*) FROM complaints').fetchone()[0]
+    pending_complaints = conn.execute('SELECT COUNT(*) FROM complaints WHERE status IN ("Submitted", "In Progress")').fetchone()[0]
+    resolved_complaints = conn.execute('SELECT COUNT(*) FROM complaints WHERE status = "Resolved"').fetchone()[0]
+    resolution_rate = round((resolved_complaints / total_complaints * 100) if total_complaints > 0 else 0)
+    resolve = compute_sla_summaries(conn, sla.RESOLVE)[0]
+    return {
+        'total_complaints': total_complaints,
+        'pending_complaints': pending_complaints,
+        'resolved_complaints': resolved_complaints,
+        'resolution_rate': resolution_rate,
+        'resolve_p50_hours': _hours(resolve['p50']),
+        'resolve_p90_hours': _hours(resolve['p90'])
+    }
+
+SLA_GROUP_BY = ('zone', 'category')
+
+def _hours(seconds):
+    return None if seconds is None else round(seconds / 3600, 1)
+
+def compute_sla_summaries(conn, metric, group_by=()):
+    """Count, mean and p50/p90/p99 (seconds) of an SLA metric from the merged sla_sketches.
+
+    Returns one dict per zone/category group (a single dict when group_by is empty).
+    """
+    keys = ''.join(f'{column}, ' for column in group_by)
+    rows = execute_query(conn, f"""
+        SELECT {keys}bucket, SUM(count) AS count FROM sla_sketches WHERE metric = ?
+        GROUP BY {keys}bucket ORDER BY {keys}bucket
+    """, (metric,), fetch_all=True)
+    groups = {}
+    for row in rows:
+        groups.setdefault(tuple(row[column] for column in group_by), []).append((row['bucket'], row['count']))
+    if not group_by:
+        groups.setdefault((), [])
+    return [{**dict(zip(group_by, key)), **sla.summarize(buckets)} for key, buckets in groups.items()]
+
+def invalidate_stats():
+    """Drop cached dashboard numbers in every worker after complaints or users change"""
+    cache.invalidate('stats:')
+
+def complaints_changed(event_type=None, data=None):
+    """Invalidate everything derived from complaints (dashboard stats, API ETags) and tell live dashboards"""
+    invalidate_stats()
+    conditional.touch()
+    if event_type:
+        events.publish(event_type, data)
+
 @app.route('/user/dashboard')
 @user_required
 def user_dashboard():
     conn = get_db_connection()
     
-    # Get user's complaints
-    complaints_raw = conn.execute('''
+    # Get user's complaints (timestamps arrive as datetimes)
+    user_complaints = conn.execute('''
         SELECT * FROM complaints WHERE user_id = ? ORDER BY created_at DESC LIMIT 10
     ''', (session['user_id'],)).fetchall()
     
-    # Convert to dicts and parse timestamps (REQUIRED for SQLite TIMESTAMP columns in Jinja2)
-    user_complaints = []
-    for complaint in complaints_raw:
-        complaint_dict = dict(complaint)
-        complaint_dict['created_at'] = parse_timestamp(complaint_dict['created_at'])
-        complaint_dict['updated_at'] = parse_timestamp(complaint_dict['updated_at'])
-        user_complaints.append(complaint_dict)
-    
     # Get user stats
-    total_complaints = conn.execute('SELECT COUNT(*) FROM complaints WHERE user_id = ?', (session['user_id'],)).fetchone()[0]
-    pending_complaints = conn.execute('SELECT COUNT(*) FROM complaints WHERE user_id = ? AND status IN ("Submitted", "In Progress")', (session['user_id'],)).fetchone()[0]
-    resolved_complaints = conn.execute('SELECT COUNT(*) FROM complaints WHERE user_id = ? AND status = "Resolved"', (session['user_id'],)).fetchone()[0]
-    resolution_rate = round((resolved_complaints / total_complaints * 100) if total_complaints > 0 else 0)
+    user_stats = cache.memoize('stats', f"user:{session['user_id']}",
+                               lambda: compute_user_stats(conn, session['user_id']), STATS_CACHE_TTL)
     
     conn.close()
     
-    user_stats = {
-        'total_complaints': total_complaints,
-        'pending_complaints': pending_complaints,
-        'resolved_complaints': resolved_complaints,
-        'resolution_rate': resolution_rate
-    }
-    
     return render_template('user_dashboard.html', 
                          user_complaints=user_complaints, 
                          user_stats=user_stats)
@@ -911,37 +1330,22 @@ def user_dashboard():
 @app.route('/admin/dashboard')
 @admin_required
 def admin_dashboard():
+    # Read before the complaints, so the live stream resumes from no later than what the page shows
+    last_event_id = events.latest_id()
     conn = get_db_connection()
     
-    # Get all complaints
-    complaints_raw = conn.execute('SELECT * FROM complaints ORDER BY created_at DESC').fetchall()
-    
-    # Convert to dicts and parse timestamps (REQUIRED for SQLite TIMESTAMP columns in Jinja2)
-    all_complaints = []
-    for complaint in complaints_raw:
-        complaint_dict = dict(complaint)
-        complaint_dict['created_at'] = parse_timestamp(complaint_dict['created_at'])
-        complaint_dict['updated_at'] = parse_timestamp(complaint_dict['updated_at'])
-        all_complaints.append(complaint_dict)
+    # Get all complaints (timestamps arrive as datetimes)
+    all_complaints = conn.execute('SELECT * FROM complaints ORDER BY created_at DESC').fetchall()
     
     # Get admin stats
-    total_complaints = conn.execute('SELECT COUNT(*) FROM complaints').fetchone()[0]
-    pending_complaints = conn.execute('SELECT COUNT(*) FROM complaints WHERE status IN ("Submitted", "In Progress")').fetchone()[0]
-    resolved_complaints = conn.execute('SELECT COUNT(*) FROM complaints WHERE status = "Resolved"').fetchone()[0]
-    resolution_rate = round((resolved_complaints / total_complaints * 100) if total_complaints > 0 else 0)
+    admin_stats = cache.memoize('stats', 'admin', lambda: compute_admin_stats(conn), STATS_CACHE_TTL)
     
     conn.close()
     
-    admin_stats = {
-        'total_complaints': total_complaints,
-        'pending_complaints': pending_complaints,
-        'resolved_complaints': resolved_complaints,
-        'resolution_rate': resolution_rate
-    }
-    
     return render_template('admin_dashboard.html', 
                          all_complaints=all_complaints, 
-                         admin_stats=admin_stats)
+                         admin_stats=admin_stats,
+                         last_event_id=last_event_id)
 
 @app.route('/report-issue')
 @user_required
@@ -956,17 +1360,185 @@ def logout():
 
 # ==================== 7. API ROUTES ====================
 
+def resolve_report_location(device_lat, device_lng, manual_address):
+    """Pick the report location: device GPS first, then the typed address.
+
+    Returns (lat, lng, location_text) - location_text is filled in later by reverse
+    geocoding when GPS is used - or None when neither was provided.
+    """
+    if device_lat and device_lng:
+        logger.debug("Using device GPS for coordinates (primary source)")
+        return float(device_lat), float(device_lng), None
+    if manual_address:
+        logger.debug("Using manual address string (fallback source)")
+        return None, None, manual_address
+    return None
+
+GHMC_ID_ATTEMPTS = 3
+
+def _is_duplicate_ghmc_id(error):
+    """A unique-constraint failure on complaints.ghmc_id, from SQLite or PostgreSQL"""
+    unique_violation = isinstance(error, sqlite3.IntegrityError) or getattr(error, 'pgcode', None) == '23505'
+    return unique_violation and 'ghmc_id' in str(error)
+
+def insert_with_fresh_ghmc_id(conn, insert):
+    """Run insert(ghmc_id) with a new complaint ID, retrying with another if that ID is already taken.
+
+    Returns (ghmc_id, insert's result). IDs only collide if two workers ever share a process slot.
+    """
+    for attempt in range(GHMC_ID_ATTEMPTS):
+        ghmc_id = ids.new_complaint_id()
+        try:
+            return ghmc_id, insert(ghmc_id)
+        except Exception as e:
+            if attempt == GHMC_ID_ATTEMPTS - 1 or not _is_duplicate_ghmc_id(e):
+                raise
+            conn.rollback()
+            logger.error("Complaint ID %s is already taken; retrying with a new one", ghmc_id)
+
+def save_complaint(category, priority, subject, description, location, zone, gps_lat, gps_lng, user_id,
+                   image_phash=None, report_text=None, image_sha256=None):
+    """Insert a processed complaint; returns (complaint_id, ghmc_id)"""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        ghmc_id, _ = insert_with_fresh_ghmc_id(conn, lambda ghmc_id: cursor.execute(
+            """
+            INSERT INTO complaints (ghmc_id, category, priority, subject, description, location, zone, gps_lat, gps_lng, user_id,
+                                    image_phash, report_text, image_sha256)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (ghmc_id, category, priority, subject, description, location, zone, gps_lat, gps_lng, user_id,
+             image_phash, report_text, image_sha256)
+        ))
+        complaint_id = cursor.lastrowid
+        conn.commit()
+        complaints_changed('complaint.created', {
+            'id': complaint_id, 'ghmc_id': ghmc_id, 'subject': subject, 'category': category,
+            'priority': priority, 'status': 'Submitted', 'zone': zone, 'duplicate_of': None,
+            'created_at': datetime.utcnow().isoformat(' ', timespec='seconds')})
+        logger.info("Complaint %s inserted (id=%s)", ghmc_id, complaint_id,
+                    extra={'complaint_id': complaint_id, 'category': category, 'priority': priority})
+        return complaint_id, ghmc_id
+    except sqlite3.Error:
+        conn.rollback()
+        logger.exception("Database error while inserting complaint")
+        raise
+    finally:
+        conn.close()
+
+def find_duplicate_complaint(conn, lat, lng, image_phash, text):
+    """Closest open complaint nearby that the new report duplicates; returns (row, evidence) or None"""
+    postgres = is_postgres_connection(conn)
+    join, where = geo.bbox_filter(postgres)
+    since = datetime.utcnow() - timedelta(days=dedup.WINDOW_DAYS)
+    candidates = execute_query(conn, f"""
+        SELECT c.id, c.ghmc_id, c.category, c.priority, c.subject, c.description, c.location, c.zone,
+               c.status, c.gps_lat, c.gps_lng, c.image_phash, c.report_text
+        FROM complaints c {join}
+        WHERE {where} AND c.duplicate_of IS NULL AND c.status IN (?, ?) AND c.created_at >= ?
+        ORDER BY c.id DESC LIMIT 100
+    """, geo.bbox_params(postgres, *geo.radius_bbox(lat, lng, dedup.RADIUS_M)) + list(dedup.OPEN_STATUSES) + [since],
+        fetch_all=True)
+    best = None
+    for candidate in candidates:
+        distance = geo.haversine_m(lat, lng, float(candidate['gps_lat']), float(candidate['gps_lng']))
+        if distance > dedup.RADIUS_M:
+            continue
+        evidence = dedup.match(candidate, image_phash, text)
+        if evidence and (best is None or distance < best[1]['distance_m']):
+            evidence['distance_m'] = round(distance, 1)
+            best = (candidate, evidence)
+    return best
+
+def detect_duplicate(lat, lng, image_bytes, text):
+    """Duplicate check run before the AI stages; returns (image_phash, (original, evidence) or None)"""
+    image_phash = dedup.image_hash(image_bytes)
+    if not dedup.ENABLED or lat is None or lng is None:
+        return image_phash, None
+    conn = get_db_connection()
+    try:
+        return image_phash, find_duplicate_complaint(conn, lat, lng, image_phash, text)
+    except Exception:
+        # Duplicate detection is an optimisation; never fail a submission because of it
+        logger.exception("Duplicate detection failed")
+        return image_phash, None
+    finally:
+        conn.close()
+
+def link_duplicate_complaint(original, user_id, gps_lat, gps_lng, image_phash, report_text, image_sha256=None):
+    """Record a duplicate report against its original without any AI work; returns (complaint_id, ghmc_id)"""
+    conn = get_db_connection()
+    try:
+        # The duplicate mirrors the original so the citizen sees its category and progress
+        ghmc_id, _ = insert_with_fresh_ghmc_id(conn, lambda ghmc_id: execute_query(conn, """
+            INSERT INTO complaints (ghmc_id, category, priority, subject, description, location, zone, gps_lat, gps_lng,
+                                    user_id, status, image_phash, report_text, duplicate_of, image_sha256)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (ghmc_id, original['category'], original['priority'], original['subject'], original['description'],
+              original['location'], original['zone'], gps_lat, gps_lng, user_id, original['status'],
+              image_phash, report_text, original['id'], image_sha256)))
+        row = execute_query(conn, 'SELECT id FROM complaints WHERE ghmc_id = ?', (ghmc_id,), fetch_one=True)
+        execute_query(conn, 'UPDATE complaints SET report_count = COALESCE(report_count, 1) + 1 WHERE id = ?',
+                      (original['id'],))
+        conn.commit()
+        complaints_changed('complaint.created', {
+            'id': row['id'], 'ghmc_id': ghmc_id, 'subject': original['subject'], 'category': original['category'],
+            'priority': original['priority'], 'status': original['status'], 'zone': original['zone'],
+            'duplicate_of': original['id'], 'created_at': datetime.utcnow().isoformat(' ', timespec='seconds')})
+        logger.info("Complaint %s linked as duplicate of %s", ghmc_id, original['ghmc_id'],
+                    extra={'complaint_id': row['id'], 'duplicate_of': original['id']})
+        return row['id'], ghmc_id
+    except Exception:
+        conn.rollback()
+        logger.exception("Database error while linking duplicate complaint")
+        raise
+    finally:
+        conn.close()
+
+def store_report_image(image_bytes):
+    """Keep the submitted photo in the media store; returns its digest, or None if it could not be written"""
+    try:
+        return media.save(image_bytes)
+    except OSError:
+        # The report is still worth filing without its photo
+        logger.exception("Could not store the report image")
+        return None
+
+def duplicate_acknowledgement(complaint_id, ghmc_id, original):
+    ack = submission_acknowledgement(complaint_id, ghmc_id, original['subject'], original['category'], original['priority'])
+    ack['message'] = "This issue has already been reported nearby. Your report was added to the existing complaint."
+    ack['acknowledgement']['duplicate_of'] = original['ghmc_id']
+    return ack
+
+def submission_acknowledgement(complaint_id, ghmc_id, subject, category, priority):
+    return {
+        "status": "success",
+        "message": "Your complaint has been successfully submitted.",
+        "acknowledgement": {
+            "complaint_id": complaint_id,
+            "ghmc_id": ghmc_id,
+            "subject": subject,
+            "category": category,
+            "priority": priority
+        }
+    }
+
+@contextmanager
+def pipeline_stage(stage):
+    """Time a report pipeline stage in metrics and, when profiling, as a trace span"""
+    with metrics.stage_timer(stage), profiling.span(f"stage.{stage}"):
+        yield
+
 @app.route('/api/report-issue', methods=['POST'])
 @user_required
+@uploads.report_upload
+@idempotent_submission
+@ai_concurrency_limited
 def report_issue_endpoint():
-    print("-" * 50)
-    print("START: Processing New Complaint Report")
-    print("-" * 50)
+    logger.debug("START: Processing new complaint report")
 
-    if 'image' not in request.files:
-        print("ERROR: Image file is missing.")
-        return jsonify({"error": "Validation failed: An image file is mandatory."}), 400
-    
+    # uploads.report_upload has already checked the fields and the files' sizes and types
     image_file = request.files['image']
     audio_file = request.files.get('audio')
     text_description = request.form.get('description')
@@ -976,47 +1548,40 @@ def report_issue_endpoint():
     device_lat = request.form.get('device_latitude')
     device_lng = request.form.get('device_longitude')
 
-    print(f"User Input - Text: {text_description[:50]}...")
-    print(f"User Input - Device GPS: Lat={device_lat}, Lng={device_lng}")
-    print(f"User Input - Manual Address: {manual_address}")
-
-    if not text_description and not audio_file:
-        print("ERROR: Text or voice description is missing.")
-        return jsonify({"error": "Validation failed: Either a text or voice description is mandatory."}), 400
+    logger.debug("User input - text: %.50s, device GPS: %s,%s, manual address: %s",
+                 text_description, device_lat, device_lng, manual_address)
 
     # 1. Location Extraction
-    
-    final_lat = None
-    final_lng = None
-    final_location_string = None
-    
-    # Priority: 1. Device GPS (if present), 2. Manual Address
-    if device_lat and device_lng:
-        final_lat = float(device_lat)
-        final_lng = float(device_lng)
-        print("-> Using DEVICE GPS for coordinates (Primary Source).")
-    elif manual_address:
-        final_location_string = manual_address
-        print("-> Using MANUAL ADDRESS string (Fallback Source).")
-    else:
-        # If no GPS and no manual address provided, fail.
-        print("ERROR: No location data found (GPS or manual).")
-        return jsonify({"status": "error", "error": "Location data is required but was not provided."}), 400
-
+    final_lat, final_lng, final_location_string = resolve_report_location(device_lat, device_lng, manual_address)
+
+    # 1b. Duplicate check: link reports of an already-open issue before any Gemini call
+    with pipeline_stage('dedup'):
+        image_bytes = image_file.stream.read()
+        image_file.stream.seek(0)
+        image_phash, duplicate = detect_duplicate(final_lat, final_lng, image_bytes, text_description)
+    with pipeline_stage('media'):
+        image_sha256 = store_report_image(image_bytes)
+    if duplicate:
+        original, evidence = duplicate
+        logger.info("Report matches open complaint %s: %s", original['ghmc_id'], evidence)
+        complaint_id, ghmc_id = link_duplicate_complaint(
+            original, session.get('user_id'), final_lat, final_lng, image_phash, text_description, image_sha256)
+        return jsonify(duplicate_acknowledgement(complaint_id, ghmc_id, original)), 201
 
     if final_lat and final_lng:
         # Convert coordinates to a full address string
-        final_location_string = reverse_geocode_coordinates(final_lat, final_lng)
+        with pipeline_stage('geocode'):
+            final_location_string = reverse_geocode_coordinates(final_lat, final_lng)
 
     gps_coords = {'latitude': final_lat, 'longitude': final_lng}
-    print(f"STAGE 1: Final GPS Coords: {gps_coords}")
-    print(f"STAGE 1: Final Address: {final_location_string}")
+    logger.debug("STAGE 1: final GPS coords: %s, address: %s", gps_coords, final_location_string)
     
     # 2. Image Analysis
-    image_analysis = analyze_image_with_gemini(image_file.stream)
-    print(f"STAGE 2: Image Analysis Result: {image_analysis}")
+    with pipeline_stage('image'):
+        image_analysis = analyze_image_with_gemini(image_file.stream)
+    logger.debug("STAGE 2: image analysis result: %s", image_analysis)
     if not image_analysis:
-        print("ERROR: Image analysis failed.")
+        logger.error("Report failed: image analysis failed")
         return jsonify({"error": "AI processing failed for the image."}), 500
 
     full_description = text_description or ""
@@ -1024,32 +1589,29 @@ def report_issue_endpoint():
     
     # 3. Voice Analysis (if audio present)
     if audio_file:
-        print("STAGE 3: Processing Audio...")
-        # Save audio temporarily for Gemini processing (required for file uploads)
-        # Use a more flexible temp directory approach for Render compatibility
-        temp_dir = os.path.join(os.getcwd(), 'temp') if not os.path.exists('/tmp') else '/tmp'
-        temp_path = os.path.join(temp_dir, audio_file.filename)
-        audio_file.save(temp_path)
-        transcription_result = transcribe_audio_with_gemini(temp_path)
-        os.remove(temp_path)
+        logger.debug("STAGE 3: processing audio")
+        # The type comes from the file's first bytes, never the client
+        with pipeline_stage('audio'):
+            transcription_result = transcribe_audio_with_gemini(audio_file.read(), audio_file.mimetype)
         
         if transcription_result and transcription_result.get("transcription"):
             voice_transcription = transcription_result["transcription"]
             full_description += f"\n\n(Voice Note Transcription: {voice_transcription})"
-            print(f"STAGE 3: Voice Transcription Result: {voice_transcription[:50]}...")
+            logger.debug("STAGE 3: voice transcription result: %.50s", voice_transcription)
     else:
-        print("STAGE 3: Audio file skipped.")
+        logger.debug("STAGE 3: audio file skipped")
     
     full_description = full_description.strip()
     if not full_description:
-         print("ERROR: Final description is empty.")
+         logger.error("Report failed: final description is empty")
          return jsonify({"error": "Processing failed: Could not generate a description from the provided input."}), 500
 
     # 4. Text Analysis
-    text_analysis = analyze_text_with_gemini(full_description)
-    print(f"STAGE 4: Text Analysis Result: {text_analysis}")
+    with pipeline_stage('text'):
+        text_analysis = analyze_text_with_gemini(full_description)
+    logger.debug("STAGE 4: text analysis result: %s", text_analysis)
     if not text_analysis:
-        print("ERROR: Text analysis failed.")
+        logger.error("Report failed: text analysis failed")
         return jsonify({"error": "AI processing failed for the text description."}), 500
 
     report_payload = {
@@ -1060,68 +1622,42 @@ def report_issue_endpoint():
     }
     
     # 5. Final Report Generation
-    formal_report = generate_formal_report_with_gemini(report_payload)
-    print(f"STAGE 5: Formal Report Result: {formal_report}")
+    with pipeline_stage('report'):
+        formal_report = generate_formal_report_with_gemini(report_payload)
+    logger.debug("STAGE 5: formal report result: %s", formal_report)
     if not formal_report:
-        print("ERROR: Final report generation failed.")
+        logger.error("Report failed: final report generation failed")
         return jsonify({"error": "AI failed to generate the final report."}), 500
 
     final_category = text_analysis.get("category", image_analysis.get("category", "Other"))
     final_priority = text_analysis.get("priority", "Medium")
 
-    print("-" * 50)
-    print(f"FINAL CLASSIFICATION: Category={final_category}, Priority={final_priority}")
-    print("-" * 50)
+    logger.debug("Final classification: category=%s, priority=%s", final_category, final_priority)
     
-    conn = get_db_connection()
     try:
-        cursor = conn.cursor()
-        ghmc_id = f"GHMC/HYD/{int(datetime.now().timestamp())}"
-        cursor.execute(
-            """
-            INSERT INTO complaints (ghmc_id, category, priority, subject, description, location, zone, gps_lat, gps_lng, user_id)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            (
-                ghmc_id, final_category, final_priority,
-                formal_report.get('subject', 'Untitled Complaint'),
-                formal_report.get('description', full_description),
-                final_location_string, # Full address string
-                formal_report.get('zone', 'Unknown'),
-                final_lat,
-                final_lng,
-                session.get('user_id')
-            )
-        )
-        complaint_id = cursor.lastrowid
-        conn.commit()
-        print(f"SUCCESS: Complaint {ghmc_id} inserted into DB (ID: {complaint_id}).")
+        with pipeline_stage('db_insert'):
+            complaint_id, ghmc_id = save_complaint(
+                category=final_category, priority=final_priority,
+                subject=formal_report.get('subject', 'Untitled Complaint'),
+                description=formal_report.get('description', full_description),
+                location=final_location_string, # Full address string
+                zone=formal_report.get('zone', 'Unknown'),
+                gps_lat=final_lat, gps_lng=final_lng,
+                user_id=session.get('user_id'),
+                image_phash=image_phash, report_text=full_description, image_sha256=image_sha256)
         
-        return jsonify({
-            "status": "success",
-            "message": "Your complaint has been successfully submitted.",
-            "acknowledgement": {
-                "complaint_id": complaint_id,
-                "ghmc_id": ghmc_id,
-                "subject": formal_report.get('subject'),
-                "category": final_category,
-                "priority": final_priority
-            }
-        }), 201
+        return jsonify(submission_acknowledgement(
+            complaint_id, ghmc_id, formal_report.get('subject'), final_category, final_priority)), 201
     except sqlite3.Error as e:
-        conn.rollback()
-        print(f"DATABASE ERROR: {e}")
         return jsonify({"error": "Database error", "details": str(e)}), 500
     finally:
-        conn.close()
-        print("-" * 50)
-        print("END: Processing Complaint Report")
-        print("-" * 50)
+        logger.debug("END: Processing complaint report")
 
 # ==================== 8. USER API ROUTES ====================
 
 @app.route('/api/user/complaints')
 @user_required
+@conditional.conditional_get
 def get_user_complaints():
     conn = get_db_connection()
     complaints = conn.execute('''
@@ -1132,6 +1668,7 @@ def get_user_complaints():
 
 @app.route('/api/user/complaints/<int:complaint_id>')
 @user_required
+@conditional.conditional_get
 def get_user_complaint_by_id(complaint_id):
     conn = get_db_connection()
     complaint = conn.execute('''
@@ -1142,10 +1679,149 @@ def get_user_complaint_by_id(complaint_id):
         return jsonify(dict(complaint))
     return jsonify({"error": "Complaint not found"}), 404
 
+MEDIA_MAX_AGE = 86400
+
+@app.route('/api/complaints/<int:complaint_id>/image')
+@login_required
+def get_complaint_image(complaint_id):
+    """The complaint's photo (?size=small|large for a JPEG thumbnail), for an admin or the reporting citizen"""
+    size = request.args.get('size', media.ORIGINAL)
+    if size != media.ORIGINAL and size not in media.THUMBNAIL_SIZES:
+        return jsonify({"error": f"size must be one of: {', '.join([media.ORIGINAL, *media.THUMBNAIL_SIZES])}"}), 400
+    conn = get_db_connection()
+    try:
+        if 'admin_id' in session:
+            complaint = execute_query(conn, 'SELECT image_sha256 FROM complaints WHERE id = ?',
+                                      (complaint_id,), fetch_one=True)
+        else:
+            complaint = execute_query(conn, 'SELECT image_sha256 FROM complaints WHERE id = ? AND user_id = ?',
+                                      (complaint_id, session['user_id']), fetch_one=True)
+    finally:
+        conn.close()
+    digest = complaint['image_sha256'] if complaint else None
+    located = media.locate(digest, size) if digest else None
+    if not located:
+        return jsonify({"error": "Image not found"}), 404
+    path, mimetype = located
+    if media.ACCEL_PREFIX:
+        # nginx sends the file from its internal location; no bytes pass through the worker
+        response = Response(mimetype=mimetype)
+        response.headers['X-Accel-Redirect'] = media.accel_path(digest, size)
+    else:
+        # Content-addressed, so the digest is a strong ETag; Range requests are honoured
+        response = send_file(path, mimetype=mimetype, conditional=True, etag=f'{digest}-{size}',
+                             max_age=MEDIA_MAX_AGE)
+    response.cache_control.private = True
+    response.cache_control.max_age = MEDIA_MAX_AGE
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    return response
+
 # ==================== 9. ADMIN & OTHER ENDPOINTS ====================
 
+# Allowed complaint status changes: current status -> statuses it may move to
+STATUS_TRANSITIONS = {
+    'Submitted': {'In Progress', 'Resolved', 'Closed'},
+    'In Progress': {'Resolved', 'Closed'},
+    'Resolved': {'In Progress', 'Closed'},
+    'Closed': {'In Progress'},
+}
+
+# Columns a bulk transition may filter on, e.g. {"zone": "Zone X", "status": "In Progress"}
+TRANSITION_FILTERS = ('zone', 'category', 'priority', 'status', 'user_id', 'duplicate_of')
+
+class InvalidTransition(ValueError):
+    pass
+
+def _transition_where(ids, filters, allowed_from, placeholder, postgres):
+    """WHERE clause selecting the complaints a transition applies to"""
+    clauses, params = [], []
+    if ids is not None:
+        if postgres:
+            clauses.append(f'id = ANY({placeholder})')
+            params.append(list(ids))
+        else:
+            clauses.append(f"id IN ({', '.join([placeholder] * len(ids))})")
+            params.extend(ids)
+    for column, value in (filters or {}).items():
+        if column not in TRANSITION_FILTERS:
+            raise InvalidTransition(f"Cannot filter on '{column}'")
+        clauses.append(f'{column} = {placeholder}')
+        params.append(value)
+    if postgres:
+        clauses.append(f'status = ANY({placeholder})')
+        params.append(sorted(allowed_from))
+    else:
+        clauses.append(f"status IN ({', '.join([placeholder] * len(allowed_from))})")
+        params.extend(sorted(allowed_from))
+    return ' AND '.join(clauses), params
+
+def transition_complaint_status(conn, new_status, changed_by, comments='', ids=None, filters=None):
+    """Move complaints to new_status and record status_history in one transaction.
+
+    Selects complaints by id list, by column filters, or both. Complaints whose
+    current status cannot move to new_status are left untouched. Returns
+    [{'complaint_id', 'old_status', 'new_status'}] for the complaints that changed.
+    Raises InvalidTransition for an unknown status or filter column.
+    """
+    if new_status not in STATUS_TRANSITIONS:
+        raise InvalidTransition(f"Unknown status '{new_status}'")
+    if ids is None and not filters:
+        raise InvalidTransition("Select complaints by id or by filter")
+    if ids is not None and not ids:
+        return []
+    allowed_from = {old for old, targets in STATUS_TRANSITIONS.items() if new_status in targets}
+    now = datetime.now()
+
+    if is_postgres_connection(conn):
+        where, params = _transition_where(ids, filters, allowed_from, '%s', postgres=True)
+        # One statement: lock the matching rows, update them and log the old
+        # status taken from the locked row versions
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            WITH old AS (
+                SELECT id, status FROM complaints WHERE {where} FOR UPDATE
+            ), updated AS (
+                UPDATE complaints c SET status = %s, updated_at = %s
+                FROM old WHERE c.id = old.id
+                RETURNING c.id, old.status AS old_status
+            )
+            INSERT INTO status_history (complaint_id, old_status, new_status, changed_by, comments)
+            SELECT id, old_status, %s, %s, %s FROM updated
+            RETURNING complaint_id, old_status
+        ''', params + [new_status, now, new_status, changed_by, comments])
+        rows = cursor.fetchall()
+    else:
+        where, params = _transition_where(ids, filters, allowed_from, '?', postgres=False)
+        # BEGIN IMMEDIATE takes the write lock up front, so both statements see
+        # the same rows and no other writer can change a status in between
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            rows = conn.execute(f'''
+                INSERT INTO status_history (complaint_id, old_status, new_status, changed_by, comments)
+                SELECT id, status, ?, ?, ? FROM complaints WHERE {where}
+                RETURNING complaint_id, old_status
+            ''', [new_status, changed_by, comments] + params).fetchall()
+            if rows:
+                conn.execute(f'UPDATE complaints SET status = ?, updated_at = ? WHERE {where}',
+                             [new_status, now] + params)
+        except Exception:
+            conn.rollback()
+            raise
+    conn.commit()
+
+    changed = [{'complaint_id': row['complaint_id'], 'old_status': row['old_status'], 'new_status': new_status}
+               for row in rows]
+    if changed:
+        complaints_changed('complaint.status_changed', {
+            'new_status': new_status, 'changed_by': changed_by,
+            'complaints': [{'id': c['complaint_id'], 'old_status': c['old_status']} for c in changed]})
+        logger.info("%d complaint(s) moved to %s by %s", len(changed), new_status, changed_by,
+                    extra={'new_status': new_status, 'count': len(changed)})
+    return changed
+
 @app.route('/api/admin/complaints', methods=['GET'])
 @admin_required
+@conditional.conditional_get
 def get_all_complaints_api():
     conn = get_db_connection()
     complaints = conn.execute('SELECT * FROM complaints ORDER BY created_at DESC').fetchall()
@@ -1154,6 +1830,7 @@ def get_all_complaints_api():
 
 @app.route('/api/admin/complaints/<int:complaint_id>', methods=['GET'])
 @admin_required
+@conditional.conditional_get
 def get_complaint_by_id(complaint_id):
     conn = get_db_connection()
     complaint = conn.execute('SELECT * FROM complaints WHERE id = ?', (complaint_id,)).fetchone()
@@ -1162,6 +1839,356 @@ def get_complaint_by_id(complaint_id):
         return jsonify(dict(complaint))
     return jsonify({"error": "Complaint not found"}), 404
 
+GEO_DEFAULT_LIMIT = 500
+GEO_MAX_LIMIT = 5000
+GEO_MAX_RADIUS_M = 50000
+GEO_FILTERS = ('status', 'category', 'priority', 'zone')
+GEO_COLUMNS = ('c.id, c.ghmc_id, c.subject, c.category, c.priority, c.status, c.zone, '
+               'c.gps_lat, c.gps_lng, c.report_count, c.duplicate_of, c.created_at')
+
+def query_complaints_in_bbox(conn, min_lat, max_lat, min_lng, max_lng, filters=None, limit=GEO_DEFAULT_LIMIT,
+                             near=None):
+    """Complaints inside a bounding box through the spatial index, newest first or nearest to near=(lat, lng)"""
+    postgres = is_postgres_connection(conn)
+    join, where = geo.bbox_filter(postgres)
+    params = geo.bbox_params(postgres, min_lat, max_lat, min_lng, max_lng)
+    for column, value in (filters or {}).items():
+        where += f' AND c.{column} = ?'
+        params.append(value)
+    order, order_params = geo.distance_order(*near) if near else ('c.id DESC', [])
+    rows = execute_query(conn, f"SELECT {GEO_COLUMNS} FROM complaints c {join} WHERE {where} ORDER BY {order} LIMIT ?",
+                         params + order_params + [limit], fetch_all=True)
+    for row in rows:
+        row['gps_lat'], row['gps_lng'] = float(row['gps_lat']), float(row['gps_lng'])
+    return rows
+
+def _geo_request_args():
+    """Shared filters and limit for the geospatial endpoints; raises ValueError on bad input"""
+    filters = {name: request.args[name] for name in GEO_FILTERS if request.args.get(name)}
+    limit = min(int(request.args.get('limit', GEO_DEFAULT_LIMIT)), GEO_MAX_LIMIT)
+    if limit < 1:
+        raise ValueError("limit must be positive")
+    return filters, limit
+
+def _coordinate(name, low, high):
+    value = float(request.args[name])
+    if not low <= value <= high:
+        raise ValueError(f"{name} must be between {low} and {high}")
+    return value
+
+@app.route('/api/admin/complaints/nearby', methods=['GET'])
+@admin_required
+@conditional.conditional_get
+def get_nearby_complaints():
+    """Complaints within radius_m metres of lat/lng, nearest first"""
+    try:
+        lat = _coordinate('lat', -90, 90)
+        lng = _coordinate('lng', -180, 180)
+        radius_m = float(request.args.get('radius_m', 500))
+        if not 0 < radius_m <= GEO_MAX_RADIUS_M:
+            raise ValueError(f"radius_m must be between 0 and {GEO_MAX_RADIUS_M}")
+        filters, limit = _geo_request_args()
+    except KeyError as e:
+        return jsonify({"error": f"Missing parameter: {e.args[0]}"}), 400
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    conn = get_db_connection()
+    try:
+        # Nearest candidates first, so the limit keeps the closest complaints; one extra row tells
+        # whether more are in range. The box is only a pre-filter: corners outside the circle are dropped below
+        candidates = query_complaints_in_bbox(conn, *geo.radius_bbox(lat, lng, radius_m), filters=filters,
+                                              limit=limit + 1, near=(lat, lng))
+    finally:
+        conn.close()
+    results = []
+    for row in candidates:
+        distance = geo.haversine_m(lat, lng, row['gps_lat'], row['gps_lng'])
+        if distance <= radius_m:
+            row['distance_m'] = round(distance, 1)
+            results.append(row)
+    results.sort(key=lambda row: row['distance_m'])
+    return jsonify({"center": {"lat": lat, "lng": lng}, "radius_m": radius_m, "count": min(len(results), limit),
+                    "truncated": len(results) > limit, "complaints": results[:limit]})
+
+@app.route('/api/admin/complaints/bbox', methods=['GET'])
+@admin_required
+@conditional.conditional_get
+def get_complaints_in_bbox():
+    """Complaints inside min_lat/max_lat/min_lng/max_lng (the visible map area), newest first"""
+    try:
+        min_lat, max_lat = _coordinate('min_lat', -90, 90), _coordinate('max_lat', -90, 90)
+        min_lng, max_lng = _coordinate('min_lng', -180, 180), _coordinate('max_lng', -180, 180)
+        if min_lat > max_lat or min_lng > max_lng:
+            raise ValueError("min_lat/min_lng must not exceed max_lat/max_lng")
+        filters, limit = _geo_request_args()
+    except KeyError as e:
+        return jsonify({"error": f"Missing parameter: {e.args[0]}"}), 400
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    conn = get_db_connection()
+    try:
+        # Fetch one extra row to tell the map view whether it is seeing everything
+        rows = query_complaints_in_bbox(conn, min_lat, max_lat, min_lng, max_lng, filters=filters, limit=limit + 1)
+    finally:
+        conn.close()
+    return jsonify({"bbox": [min_lat, min_lng, max_lat, max_lng], "count": min(len(rows), limit),
+                    "truncated": len(rows) > limit, "complaints": rows[:limit]})
+
+@app.route('/api/admin/sla', methods=['GET'])
+@admin_required
+@conditional.conditional_get
+def get_sla():
+    """p50/p90/p99 time to resolve (or time in a status), optionally per zone and/or category"""
+    status = request.args.get('status')
+    metric = f'state:{status}' if status else sla.RESOLVE
+    if status and status not in STATUS_TRANSITIONS:
+        return jsonify({"error": f"Unknown status: {status}"}), 400
+    group_by = list(dict.fromkeys(v for v in request.args.get('group_by', '').split(',') if v))
+    if any(column not in SLA_GROUP_BY for column in group_by):
+        return jsonify({"error": f"group_by may contain {', '.join(SLA_GROUP_BY)}"}), 400
+
+    def compute():
+        conn = get_db_connection()
+        try:
+            return compute_sla_summaries(conn, metric, group_by)
+        finally:
+            conn.close()
+
+    # Shares the stats cache, which status changes invalidate
+    summaries = cache.memoize('stats', f"sla:{metric}:{','.join(group_by)}", compute, STATS_CACHE_TTL)
+    groups = [{**{column: summary[column] for column in group_by}, "count": summary['count'],
+               **{f"{name}_hours": _hours(summary[name]) for name in ('mean', 'p50', 'p90', 'p99')}}
+              for summary in summaries]
+    return jsonify({"metric": metric, "group_by": group_by, "relative_accuracy": sla.RELATIVE_ACCURACY,
+                    "groups": groups})
+
+@app.route('/api/admin/complaints/<int:complaint_id>/sla', methods=['GET'])
+@admin_required
+def get_complaint_sla(complaint_id):
+    """Time the complaint spent in each status, from its status history"""
+    conn = get_db_connection()
+    try:
+        complaint = execute_query(conn, 'SELECT status, created_at FROM complaints WHERE id = ?',
+                                  (complaint_id,), fetch_one=True)
+        if not complaint:
+            return jsonify({"error": "Complaint not found"}), 404
+        history = execute_query(conn, 'SELECT old_status, new_status, created_at FROM status_history '
+                                      'WHERE complaint_id = ? ORDER BY id', (complaint_id,), fetch_all=True)
+    finally:
+        conn.close()
+    periods = sla.time_in_state(complaint['created_at'], complaint['status'], history, datetime.utcnow())
+    resolved_at = next((change['created_at'] for change in history if change['new_status'] == 'Resolved'), None)
+    return jsonify({
+        "complaint_id": complaint_id,
+        "status": complaint['status'],
+        "time_in_state": [{"status": p['status'], "entered_at": p['entered_at'], "left_at": p['left_at'],
+                           "hours": _hours(p['seconds'])} for p in periods],
+        "time_to_resolve_hours": (_hours((resolved_at - periods[0]['entered_at']).total_seconds())
+                                  if resolved_at else None),
+    })
+
+TRENDS_GROUP_BY = ('zone', 'category', 'status')
+# Longest range per interval, to keep responses a sensible size
+TRENDS_MAX_DAYS = {'hour': 31, 'day': 731, 'week': 1461}
+
+def query_trends(conn, interval, since, until, group_by=(), zones=None, categories=None):
+    """Complaint volumes and resolution times per period from the complaint_rollups table.
+
+    since/until are dates; until is inclusive.
+    """
+    period = rollups.period_expression(interval, is_postgres_connection(conn))
+    where = ['bucket >= ?', 'bucket < ?']
+    params = [since.strftime('%Y-%m-%d'), (until + timedelta(days=1)).strftime('%Y-%m-%d')]
+    for column, values in (('zone', zones), ('category', categories)):
+        if values:
+            where.append(f"{column} IN ({', '.join('?' * len(values))})")
+            params += values
+    keys = ', '.join(['period', *group_by])
+    rows = execute_query(conn, f"""
+        SELECT {period} AS period{''.join(', ' + column for column in group_by)},
+               SUM(opened) AS opened,
+               SUM(CASE WHEN status = 'Resolved' THEN entered ELSE 0 END) AS resolved,
+               SUM(entered) AS status_changes,
+               SUM(resolution_seconds) AS resolution_seconds
+        FROM complaint_rollups WHERE {' AND '.join(where)}
+        GROUP BY {keys} ORDER BY {keys}
+    """, params, fetch_all=True)
+    for row in rows:
+        seconds = row.pop('resolution_seconds')
+        row['avg_resolution_hours'] = round(seconds / row['resolved'] / 3600, 1) if row['resolved'] else None
+    return rows
+
+@app.route('/api/admin/trends', methods=['GET'])
+@admin_required
+def get_trends():
+    """Daily, weekly or hourly complaint volumes and resolution times, optionally split by zone/category/status"""
+    interval = request.args.get('interval', 'day')
+    if interval not in rollups.INTERVALS:
+        return jsonify({"error": f"interval must be one of {', '.join(rollups.INTERVALS)}"}), 400
+    group_by = list(dict.fromkeys(v for v in request.args.get('group_by', '').split(',') if v))
+    if any(column not in TRENDS_GROUP_BY for column in group_by):
+        return jsonify({"error": f"group_by may contain {', '.join(TRENDS_GROUP_BY)}"}), 400
+    try:
+        until = datetime.strptime(request.args['to'], '%Y-%m-%d') if request.args.get('to') else datetime.utcnow()
+        since = (datetime.strptime(request.args['from'], '%Y-%m-%d') if request.args.get('from')
+                 else until - timedelta(days=29 if interval != 'week' else 83))
+    except ValueError:
+        return jsonify({"error": "from and to must be dates (YYYY-MM-DD)"}), 400
+    if since > until or (until - since).days >= TRENDS_MAX_DAYS[interval]:
+        return jsonify({"error": f"The {interval} range must be under {TRENDS_MAX_DAYS[interval]} days"}), 400
+
+    zones = [v for v in request.args.get('zone', '').split(',') if v]
+    categories = [v for v in request.args.get('category', '').split(',') if v]
+    conn = get_db_connection()
+    try:
+        series = query_trends(conn, interval, since, until, group_by, zones, categories)
+    finally:
+        conn.close()
+    return jsonify({"interval": interval, "from": since.strftime('%Y-%m-%d'), "to": until.strftime('%Y-%m-%d'),
+                    "group_by": group_by, "series": series})
+
+SEARCH_PER_PAGE = 20
+SEARCH_MAX_PER_PAGE = 100
+SEARCH_COLUMNS = ('id', 'ghmc_id', 'subject', 'description', 'category', 'priority', 'status', 'zone',
+                  'location', 'report_count', 'duplicate_of', 'created_at')
+
+def search_complaints(conn, text, filters=None, page=1, per_page=SEARCH_PER_PAGE):
+    """Ranked full-text search; returns (matches that can be paged through, whether more matched than are
+    ranked, this page's complaints with highlights)"""
+    terms = search.query_terms(text)
+    if not terms:
+        return 0, False, []
+    postgres = is_postgres_connection(conn)
+    filters = filters or {}
+    where = ' AND '.join(f'c.{column} = ?' for column in filters)
+    params = [search.match_expression(terms, postgres), *filters.values()]
+    # Counted apart from the page, which is empty past the last one
+    total = execute_query(conn, search.count_sql(postgres, where), params, fetch_one=True)['total']
+    rows = execute_query(conn, search.search_sql(postgres, SEARCH_COLUMNS, where),
+                         params + [per_page, (page - 1) * per_page], fetch_all=True)
+    for row in rows:
+        row['subject_highlight'] = search.highlight(row['subject'], terms)
+        row['location_highlight'] = search.highlight(row['location'], terms)
+        row['description_highlight'] = search.snippet(row.pop('description'), terms)
+    return min(total, search.RANK_WINDOW), total > search.RANK_WINDOW, rows
+
+@app.route('/api/admin/complaints/search', methods=['GET'])
+@admin_required
+@conditional.conditional_get
+def search_complaints_api():
+    """Full-text search over subject, description and location, best matches first"""
+    text = request.args.get('q', '').strip()
+    try:
+        page = int(request.args.get('page', 1))
+        per_page = min(int(request.args.get('per_page', SEARCH_PER_PAGE)), SEARCH_MAX_PER_PAGE)
+        if page < 1 or per_page < 1:
+            raise ValueError
+    except ValueError:
+        return jsonify({"error": "page and per_page must be positive integers"}), 400
+    if not search.query_terms(text):
+        return jsonify({"error": "Missing search query: q"}), 400
+
+    filters = {name: request.args[name] for name in GEO_FILTERS if request.args.get(name)}
+    conn = get_db_connection()
+    try:
+        total, window_limited, results = search_complaints(conn, text, filters, page, per_page)
+    finally:
+        conn.close()
+    return jsonify({"query": text, "total": total, "window_limited": window_limited, "page": page,
+                    "per_page": per_page, "pages": (total + per_page - 1) // per_page, "complaints": results})
+
+HEATMAP_MAX_TILES = 10000
+
+def query_heatmap(conn, zoom, bbox=None, categories=None, statuses=None, since=None, until=None):
+    """Complaint counts per tile at zoom, summed from the pre-aggregated complaint_tiles table"""
+    stored = heatmap.storage_zoom(zoom)
+    shift = stored - zoom
+    where, params = ['zoom = ?'], [stored]
+    if bbox:
+        min_x, max_x, min_y, max_y = heatmap.tile_range(*bbox, stored)
+        where.append('x BETWEEN ? AND ? AND y BETWEEN ? AND ?')
+        params += [min_x, max_x, min_y, max_y]
+    for column, values in (('category', categories), ('status', statuses)):
+        if values:
+            where.append(f"{column} IN ({', '.join('?' * len(values))})")
+            params += values
+    if since:
+        where.append('day >= ?')
+        params.append(since)
+    if until:
+        where.append('day <= ?')
+        params.append(until)
+    rows = execute_query(conn, f"""
+        SELECT x >> {shift} AS tx, y >> {shift} AS ty, SUM(count) AS total
+        FROM complaint_tiles WHERE {' AND '.join(where)}
+        GROUP BY x >> {shift}, y >> {shift}
+        ORDER BY total DESC LIMIT ?
+    """, params + [HEATMAP_MAX_TILES + 1], fetch_all=True)
+    tiles = []
+    for row in rows:
+        lat, lng = heatmap.tile_center(row['tx'], row['ty'], zoom)
+        tiles.append({"x": row['tx'], "y": row['ty'], "count": int(row['total']),
+                      "lat": round(lat, 6), "lng": round(lng, 6)})
+    return tiles
+
+@app.route('/api/admin/heatmap', methods=['GET'])
+@admin_required
+@conditional.conditional_get
+def get_heatmap():
+    """Complaint density per slippy-map tile (z/x/y), optionally limited to the visible map area"""
+    try:
+        zoom = int(request.args.get('zoom', 12))
+        if not 0 <= zoom <= heatmap.MAX_ZOOM:
+            raise ValueError(f"zoom must be between 0 and {heatmap.MAX_ZOOM}")
+        bbox = None
+        if 'min_lat' in request.args:
+            bbox = (_coordinate('min_lat', -90, 90), _coordinate('max_lat', -90, 90),
+                    _coordinate('min_lng', -180, 180), _coordinate('max_lng', -180, 180))
+            if bbox[0] > bbox[1] or bbox[2] > bbox[3]:
+                raise ValueError("min_lat/min_lng must not exceed max_lat/max_lng")
+        since, until = request.args.get('from'), request.args.get('to')
+        for value in (since, until):
+            if value:
+                datetime.strptime(value, '%Y-%m-%d')
+    except KeyError as e:
+        return jsonify({"error": f"Missing parameter: {e.args[0]}"}), 400
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    categories = [v for v in request.args.get('category', '').split(',') if v]
+    statuses = [v for v in request.args.get('status', '').split(',') if v]
+    conn = get_db_connection()
+    try:
+        tiles = query_heatmap(conn, zoom, bbox, categories, statuses, since, until)
+    finally:
+        conn.close()
+    return jsonify({"zoom": zoom, "count": min(len(tiles), HEATMAP_MAX_TILES),
+                    "total": sum(t['count'] for t in tiles[:HEATMAP_MAX_TILES]),
+                    "truncated": len(tiles) > HEATMAP_MAX_TILES, "tiles": tiles[:HEATMAP_MAX_TILES]})
+
+@app.route('/api/admin/events', methods=['GET'])
+@admin_required
+def complaint_events():
+    """Server-Sent Events feed of new complaints, status changes and reassignments for the admin dashboard"""
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+    events.bus.listen()
+    if not events.bus.open_stream():
+        response = jsonify({"error": "Too many live dashboards are open. Please try again shortly."})
+        response.headers['Retry-After'] = '30'
+        return response, 503
+    response = Response(events.stream(last_event_id), mimetype='text/event-stream')
+    response.call_on_close(events.bus.close_stream)
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @app.route('/api/admin/complaints/<int:complaint_id>/status', methods=['PUT'])
 @admin_required
 def update_complaint_status(complaint_id):
@@ -1171,25 +2198,152 @@ def update_complaint_status(complaint_id):
     comments = data.get('comments', '')
     
     conn = get_db_connection()
-    complaint = conn.execute('SELECT * FROM complaints WHERE id = ?', (complaint_id,)).fetchone()
-    
-    if not complaint:
+    try:
+        changed = transition_complaint_status(conn, new_status, changed_by, comments, ids=[complaint_id])
+        if not changed:
+            # Nothing matched: find out whether the complaint is missing or the move is not allowed
+            complaint = execute_query(conn, 'SELECT status FROM complaints WHERE id = ?', (complaint_id,), fetch_one=True)
+            if not complaint:
+                return jsonify({"error": "Complaint not found"}), 404
+            return jsonify({"error": f"Cannot change status from {complaint['status']} to {new_status}",
+                            "current_status": complaint['status']}), 409
+    except InvalidTransition as e:
+        return jsonify({"error": str(e)}), 400
+    finally:
         conn.close()
-        return jsonify({"error": "Complaint not found"}), 404
-    
-    old_status = complaint['status']
-    # Update status and set updated_at to the current time
-    conn.execute('UPDATE complaints SET status = ?, updated_at = ? WHERE id = ?',
-                 (new_status, datetime.now(), complaint_id))
-    # Log the status change
-    conn.execute(
-        'INSERT INTO status_history (complaint_id, old_status, new_status, changed_by, comments) VALUES (?, ?, ?, ?, ?)',
-        (complaint_id, old_status, new_status, changed_by, comments)
-    )
-    conn.commit()
-    conn.close()
     
-    return jsonify({"status": "success", "message": "Status updated successfully"})
+    return jsonify({"status": "success", "message": "Status updated successfully",
+                    "old_status": changed[0]['old_status'], "new_status": new_status})
+
+BULK_BATCH_SIZE = int(os.getenv('BULK_BATCH_SIZE', '500'))
+BULK_MAX_ITEMS = int(os.getenv('BULK_MAX_ITEMS', '10000'))
+
+def _select_complaint_ids(conn, filters):
+    """Ids of complaints matching an equality filter on TRANSITION_FILTERS columns"""
+    clauses, params = [], []
+    for column, value in filters.items():
+        if column not in TRANSITION_FILTERS:
+            raise InvalidTransition(f"Cannot filter on '{column}'")
+        clauses.append(f'{column} = ?')
+        params.append(value)
+    rows = execute_query(conn, f"SELECT id FROM complaints WHERE {' AND '.join(clauses)} ORDER BY id LIMIT ?",
+                         params + [BULK_MAX_ITEMS + 1], fetch_all=True)
+    return [row['id'] for row in rows]
+
+def _current_statuses(conn, ids, lock=False):
+    if is_postgres_connection(conn):
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT id, status, zone FROM complaints WHERE id = ANY(%s){' FOR UPDATE' if lock else ''}",
+                       (list(ids),))
+        rows = cursor.fetchall()
+    else:
+        rows = conn.execute(f"SELECT id, status, zone FROM complaints WHERE id IN ({', '.join(['?'] * len(ids))})",
+                            list(ids)).fetchall()
+    return {row['id']: row for row in rows}
+
+def _bulk_transition_batch(conn, batch, new_status, changed_by, comments):
+    changed = {c['complaint_id']: c for c in
+               transition_complaint_status(conn, new_status, changed_by, comments, ids=batch)}
+    missed = [cid for cid in batch if cid not in changed]
+    current = _current_statuses(conn, missed) if missed else {}
+    results = []
+    for cid in batch:
+        if cid in changed:
+            results.append({'id': cid, 'result': 'updated', 'old_status': changed[cid]['old_status']})
+        elif cid not in current:
+            results.append({'id': cid, 'result': 'not_found'})
+        else:
+            results.append({'id': cid, 'result': 'invalid_transition', 'old_status': current[cid]['status']})
+    return results
+
+def _bulk_reassign_batch(conn, batch, zone, changed_by, comments):
+    postgres = is_postgres_connection(conn)
+    if not postgres:
+        conn.execute('BEGIN IMMEDIATE')
+    try:
+        current = _current_statuses(conn, batch, lock=True)
+        moved = [cid for cid in batch if cid in current and current[cid]['zone'] != zone]
+        if moved:
+            placeholder = '%s' if postgres else '?'
+            cursor = conn.cursor()
+            if postgres:
+                cursor.execute('UPDATE complaints SET zone = %s, updated_at = %s WHERE id = ANY(%s)',
+                               (zone, datetime.now(), moved))
+            else:
+                cursor.execute(f"UPDATE complaints SET zone = ?, updated_at = ? WHERE id IN ({', '.join(['?'] * len(moved))})",
+                               [zone, datetime.now()] + moved)
+            # Reassignment keeps the status; the history row records who moved it and from where
+            cursor.executemany(
+                f'INSERT INTO status_history (complaint_id, old_status, new_status, changed_by, comments) '
+                f'VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder})',
+                [(cid, current[cid]['status'], current[cid]['status'], changed_by,
+                  f"Reassigned from {current[cid]['zone']} to {zone}. {comments}".strip()) for cid in moved])
+        conn.commit()
+        if moved:
+            complaints_changed('complaint.reassigned', {
+                'zone': zone, 'complaints': [{'id': cid, 'old_zone': current[cid]['zone']} for cid in moved]})
+    except Exception:
+        conn.rollback()
+        raise
+    results = []
+    for cid in batch:
+        if cid not in current:
+            results.append({'id': cid, 'result': 'not_found'})
+        elif cid in moved:
+            results.append({'id': cid, 'result': 'updated', 'old_zone': current[cid]['zone']})
+        else:
+            results.append({'id': cid, 'result': 'unchanged'})
+    return results
+
+@app.route('/api/admin/complaints/bulk', methods=['POST'])
+@admin_required
+def bulk_update_complaints():
+    """Apply one action to many complaints, selected by id list or filter, in batched transactions.
+
+    Body: {"action": "status", "status": "Resolved"} or {"action": "reassign", "zone": "..."},
+    plus "ids": [...] or "filter": {"zone": ..., "status": ..., "category": ..., "priority": ...},
+    and optional "comments" / "changed_by".
+    """
+    data = request.get_json(silent=True) or {}
+    action = data.get('action', 'status')
+    ids, filters = data.get('ids'), data.get('filter')
+    changed_by = data.get('changed_by') or session.get('admin_name', 'Admin')
+    comments = data.get('comments', '')
+
+    if (ids is None) == (not filters):
+        return jsonify({"error": "Provide either 'ids' or 'filter'"}), 400
+    if action == 'status':
+        if data.get('status') not in STATUS_TRANSITIONS:
+            return jsonify({"error": f"Unknown status '{data.get('status')}'"}), 400
+        apply_batch = lambda conn, batch: _bulk_transition_batch(conn, batch, data['status'], changed_by, comments)
+    elif action == 'reassign':
+        if not data.get('zone'):
+            return jsonify({"error": "Reassignment needs a 'zone'"}), 400
+        apply_batch = lambda conn, batch: _bulk_reassign_batch(conn, batch, data['zone'], changed_by, comments)
+    else:
+        return jsonify({"error": f"Unknown action '{action}'"}), 400
+
+    conn = get_db_connection()
+    try:
+        if ids is None:
+            ids = _select_complaint_ids(conn, filters)
+        else:
+            ids = list(dict.fromkeys(int(i) for i in ids))
+        if len(ids) > BULK_MAX_ITEMS:
+            return jsonify({"error": f"At most {BULK_MAX_ITEMS} complaints per call"}), 413
+
+        results = []
+        for start in range(0, len(ids), BULK_BATCH_SIZE):
+            results.extend(apply_batch(conn, ids[start:start + BULK_BATCH_SIZE]))
+    except (InvalidTransition, TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    finally:
+        conn.close()
+
+    summary = {}
+    for item in results:
+        summary[item['result']] = summary.get(item['result'], 0) + 1
+    return jsonify({"status": "success", "action": action, "summary": summary, "results": results})
 
 @app.route('/request-location', methods=['GET'])
 def request_location_page():
@@ -1221,6 +2375,21 @@ def request_location_page():
     """
     return render_template_string(html_content)
 
+@app.route('/debug/traces')
+@admin_required
+def debug_traces():
+    """Recent profiling traces (newest first); see profiling.py for how to enable them"""
+    limit = min(request.args.get('limit', 50, type=int), profiling.BUFFER_SIZE)
+    return jsonify(profiling.recent_traces(limit=limit))
+
+@app.route('/debug/traces/<trace_id>')
+@admin_required
+def debug_trace_detail(trace_id):
+    trace = profiling.find_trace(trace_id)
+    if trace:
+        return jsonify(trace)
+    return jsonify({"error": "Trace not found"}), 404
+
 @app.route('/health')
 def health_check():
     """Health check endpoint for monitoring"""
@@ -1393,6 +2562,7 @@ if __name__ == '__main__':
         except:
             pass
     
+    create_app()
     init_database()
     
     # Use Render's PORT environment variable or default to 5001 for local development
@@ -0,0 +1,226 @@
+"""
+FixMyHyd ASGI Entry Point
+Serves POST /api/report-issue natively on asyncio and every other route
+through the regular Flask app.
+
+    uvicorn asgi:application --host 0.0.0.0 --port 5001
+    gunicorn -k uvicorn.workers.UvicornWorker asgi:application
+
+Report submissions spend 10-60s waiting on Gemini and Nominatim. Handling them
+as coroutines lets one process hold hundreds of them (bounded by
+ASYNC_MAX_INFLIGHT) instead of one per worker thread. If the client
+disconnects before the AI stages finish, the pipeline task is cancelled.
+"""
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+
+from asgiref.wsgi import WsgiToAsgi
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import HTTPException, RequestEntityTooLarge
+from werkzeug.http import parse_options_header
+from werkzeug.wrappers import Request
+
+import idempotency
+import metrics
+import uploads
+from app import create_app
+from async_pipeline import PipelineError, pending_commit, run_report_pipeline
+from logging_config import get_logger
+
+logger = get_logger('asgi')
+
+REPORT_PATH = '/api/report-issue'
+MAX_BODY_BYTES = int(os.getenv('ASYNC_MAX_BODY_BYTES', str(uploads.MAX_CONTENT_LENGTH)))
+
+flask_app = create_app()
+wsgi_application = WsgiToAsgi(flask_app)
+
+
+def _load_session(headers):
+    """Open the Flask session (cookie or shared-cache backed); returns {} when missing or invalid."""
+    environ = {'REQUEST_METHOD': 'GET', 'HTTP_COOKIE': headers.get(b'cookie', b'').decode('latin-1')}
+    try:
+        return flask_app.session_interface.open_session(flask_app, Request(environ)) or {}
+    except Exception:
+        return {}
+
+
+async def _send_json(send, status, body, extra_headers=()):
+    payload = json.dumps(body).encode()
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(payload)).encode()),
+                    *extra_headers],
+    })
+    await send({'type': 'http.response.body', 'body': payload})
+
+
+async def _read_form(headers, receive):
+    """Parse the body through the bounded multipart reader as it arrives; returns None if the client disconnected.
+
+    Raises an HTTPException as soon as a limit is broken, without reading the rest.
+    """
+    mimetype, options = parse_options_header(headers.get(b'content-type', b'').decode('latin-1'))
+    if mimetype != 'multipart/form-data' or not options.get('boundary'):
+        return MultiDict(), MultiDict()
+    reader = uploads.MultipartReader(options['boundary'].encode('ascii'), check_fields=uploads.check_report_fields)
+    size = 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            reader.close()
+            return None
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > MAX_BODY_BYTES:
+            reader.close()
+            raise RequestEntityTooLarge("Upload too large.")
+        reader.feed(chunk)
+        if not message.get('more_body'):
+            return reader.finish()
+
+
+async def _wait_for_disconnect(receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+
+async def report_issue(scope, receive, send):
+    headers = dict(scope['headers'])
+    user_id = _load_session(headers).get('user_id')
+    if user_id is None:
+        # Same behaviour as @user_required on the WSGI route
+        await send({'type': 'http.response.start', 'status': 302, 'headers': [(b'location', b'/user/login')]})
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+
+    declared = headers.get(b'content-length', b'')
+    if declared.isdigit() and int(declared) > MAX_BODY_BYTES:
+        # Refused before reading any of the body
+        await _send_json(send, 413, {"error": "Upload too large."})
+        return
+    try:
+        parsed = await _read_form(headers, receive)
+    except HTTPException as e:
+        logger.info("Upload rejected: %s", e.description)
+        await _send_json(send, e.code, {"error": e.description})
+        return
+    if parsed is None:
+        return
+    form, files = parsed
+    try:
+        error = uploads.validate_report(form, files)
+        if error:
+            await _send_json(send, 400, {"error": error})
+            return
+        await _submit_report(send, receive, headers, form, files, user_id)
+    finally:
+        for _, file in files.items(multi=True):
+            file.close()
+
+
+async def _submit_report(send, receive, headers, form, files, user_id):
+    image_bytes = files['image'].read()
+    client_key = headers.get(b'idempotency-key', b'').decode('latin-1') or form.get('idempotency_key')
+    idempotency_key = idempotency.submission_key(
+        user_id, client_key, None if client_key else hashlib.sha256(image_bytes).hexdigest())
+    state, ack = await idempotency.claim_async(idempotency_key)
+    if state == idempotency.IN_FLIGHT:
+        await _send_json(send, 409, {"error": "This report is still being processed. Please check your dashboard shortly."},
+                         [(b'retry-after', b'10')])
+        return
+    if state == idempotency.DONE:
+        await _send_json(send, 201, ack, [(idempotency.REPLAY_HEADER.lower().encode(), b'true')])
+        return
+
+    try:
+        await _process_report(send, receive, form, files, image_bytes, user_id, idempotency_key)
+    except BaseException:
+        idempotency.abandon(idempotency_key)
+        raise
+
+
+async def _process_report(send, receive, form, files, image_bytes, user_id, idempotency_key):
+    audio_file = files.get('audio')
+
+    pipeline = asyncio.ensure_future(run_report_pipeline(
+        image_bytes=image_bytes, audio_bytes=audio_file.read() if audio_file else None,
+        audio_mimetype=audio_file.mimetype if audio_file else None,
+        text_description=form.get('description'),
+        device_lat=form.get('device_latitude'), device_lng=form.get('device_longitude'),
+        manual_address=form.get('location_text'), user_id=user_id))
+    disconnect = asyncio.ensure_future(_wait_for_disconnect(receive))
+    try:
+        await asyncio.wait({pipeline, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+        if not pipeline.done():
+            pipeline.cancel()
+            saving = pending_commit(pipeline)
+            if saving is None:
+                logger.info("Client disconnected; cancelling report pipeline")
+                idempotency.abandon(idempotency_key)
+                return
+            # The complaint is being saved regardless; a retry must get it rather than run again
+            logger.info("Client disconnected while the complaint was being saved")
+            try:
+                ack = await saving
+            except Exception:
+                logger.exception("Report insert failed after the client disconnected")
+                idempotency.abandon(idempotency_key)
+                return
+            idempotency.complete(idempotency_key, ack)
+            return
+        try:
+            ack = pipeline.result()
+        except PipelineError as e:
+            logger.error("Report failed: %s", e)
+            idempotency.abandon(idempotency_key)
+            await _send_json(send, e.status, e.body)
+        except Exception as e:
+            logger.exception("Report pipeline error")
+            idempotency.abandon(idempotency_key)
+            await _send_json(send, 500, {"error": "Database error", "details": str(e)})
+        else:
+            # Stored before sending, so a client that never sees this response gets it on retry
+            idempotency.complete(idempotency_key, ack)
+            await _send_json(send, 201, ack)
+    finally:
+        disconnect.cancel()
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+    if scope['type'] == 'http' and scope['path'] == REPORT_PATH and scope['method'] == 'POST':
+        start = time.perf_counter()
+        status = {'code': 499}  # stays 499 if the client went away before a response
+
+        async def send_and_record(message):
+            if message['type'] == 'http.response.start':
+                status['code'] = message['status']
+            await send(message)
+
+        try:
+            await report_issue(scope, receive, send_and_record)
+        finally:
+            metrics.HTTP_REQUEST_DURATION.observe(
+                time.perf_counter() - start, method='POST', route=REPORT_PATH, status=status['code'])
+        return
+    await wsgi_application(scope, receive, send)
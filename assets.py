@@ -0,0 +1,246 @@
+"""
+FixMyHyd Static Assets
+Build step and serving for fingerprinted, precompressed CSS and JavaScript.
+
+`python manage.py build-assets` minifies every .css and .js file under
+static/, names each copy after a hash of its contents
+(css/style.3f9a1c0e7b2d.css) and writes it to static/dist/ together with
+.gz and .br variants and a manifest.json mapping source names to hashed ones.
+
+Templates keep calling url_for('static', filename='css/style.css'); once a
+manifest exists that resolves to /assets/css/style.<hash>.css. The /assets
+route picks the best precompressed variant for the client's Accept-Encoding
+and serves it as `public, max-age=31536000, immutable`, so browsers never
+ask for it again: a changed file gets a new name. Without a build (local
+development) url_for falls back to the plain /static files.
+
+Minification is deliberately conservative: comments go and whitespace
+collapses, but strings, template literals and regular expressions are
+copied verbatim and JavaScript line breaks are kept for semicolon insertion.
+"""
+
+import os
+import re
+import gzip
+import json
+import hashlib
+import mimetypes
+
+from logging_config import get_logger
+
+logger = get_logger('assets')
+
+SOURCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+BUILD_DIR = os.getenv('ASSET_BUILD_DIR', os.path.join(SOURCE_DIR, 'dist'))
+MANIFEST_NAME = 'manifest.json'
+EXTENSIONS = ('.css', '.js')
+
+MAX_AGE = 365 * 86400
+HASH_LENGTH = 12
+
+# Preferred first; brotli needs the `Brotli` package
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+_CSS_TOKENS = re.compile(r'''("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')|/\*.*?\*/''', re.S)
+_CSS_TIGHT = re.compile(r'\s*([{};,>])\s*')
+
+# A '/' after one of these starts a regular expression rather than a division
+_JS_REGEX_AFTER = set('(,=:[!&|?{};+-*%<>~^') | {''}
+_JS_REGEX_KEYWORDS = {'return', 'typeof', 'case', 'in', 'of', 'delete', 'void', 'throw', 'new', 'else', 'do'}
+
+
+def _tighten_css(segment, out):
+    segment = _CSS_TIGHT.sub(r'\1', re.sub(r'\s+', ' ', segment)).replace(': ', ':')
+    if out and (out[-1].endswith(' ') or out[-1][-1:] in '{};,>'):
+        segment = segment.lstrip()
+    out.append(segment)
+
+
+def minify_css(text):
+    out, last = [], 0
+    for found in _CSS_TOKENS.finditer(text):
+        _tighten_css(text[last:found.start()], out)
+        if found.group(1):
+            out.append(found.group(1))
+        last = found.end()
+    _tighten_css(text[last:], out)
+    return ''.join(out).replace(';}', '}').strip()
+
+
+def _js_space(out, space):
+    # Runs of whitespace and comments become one space, or one newline if they spanned lines
+    if out and out[-1] in (' ', '\n'):
+        out[-1] = '\n' if '\n' in (out[-1], space) else ' '
+    elif out:
+        out.append(space)
+
+
+def _string_end(text, i):
+    """Index just past the string or template literal that opens at text[i]."""
+    quote, end, n = text[i], i + 1, len(text)
+    while end < n and text[end] != quote:
+        if text[end] == '\\':
+            end += 2
+        elif quote == '`' and text.startswith('${', end):
+            # Skip the substitution, which may hold strings and template literals of its own
+            end, depth = end + 2, 1
+            while end < n and depth:
+                if text[end] in '\'"`':
+                    end = _string_end(text, end)
+                    continue
+                depth += {'{': 1, '}': -1}.get(text[end], 0)
+                end += 1
+        else:
+            end += 1
+    return end + 1
+
+
+def minify_js(text):
+    out, i, n = [], 0, len(text)
+    previous = ''  # last significant token, for telling regular expressions from division
+    while i < n:
+        c = text[i]
+        if c in '\'"`':
+            end = _string_end(text, i)
+            out.append(text[i:end])
+            previous, i = c, end
+        elif text.startswith('//', i):
+            i = text.find('\n', i)
+            i = n if i < 0 else i
+        elif text.startswith('/*', i):
+            end = text.find('*/', i + 2)
+            end = n if end < 0 else end + 2
+            _js_space(out, '\n' if '\n' in text[i:end] else ' ')
+            i = end
+        elif c == '/' and previous in _JS_REGEX_AFTER:
+            end, in_class = i + 1, False
+            while end < n and (in_class or text[end] != '/') and text[end] != '\n':
+                if text[end] == '\\':
+                    end += 1
+                elif text[end] == '[':
+                    in_class = True
+                elif text[end] == ']':
+                    in_class = False
+                end += 1
+            out.append(text[i:end + 1])
+            previous, i = '/', end + 1
+        elif c.isspace():
+            end = i
+            while end < n and text[end].isspace():
+                end += 1
+            _js_space(out, '\n' if '\n' in text[i:end] else ' ')
+            i = end
+        elif c.isalnum() or c in '_$':
+            end = i
+            while end < n and (text[end].isalnum() or text[end] in '_$'):
+                end += 1
+            word = text[i:end]
+            out.append(word)
+            previous, i = ('' if word in _JS_REGEX_KEYWORDS else 'a'), end
+        else:
+            out.append(c)
+            previous, i = c, i + 1
+    return ''.join(out).strip()
+
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+
+def _compressors():
+    compressors = {'.gz': lambda data: gzip.compress(data, 9, mtime=0)}
+    try:
+        import brotli
+    except ImportError:
+        logger.warning("Brotli is not installed; skipping .br variants")
+    else:
+        compressors['.br'] = lambda data: brotli.compress(data, quality=11)
+    return compressors
+
+
+def hashed_name(name, data):
+    root, ext = os.path.splitext(name)
+    return f'{root}.{hashlib.sha256(data).hexdigest()[:HASH_LENGTH]}{ext}'
+
+
+def build(source_dir=SOURCE_DIR, output_dir=BUILD_DIR):
+    """Minify, fingerprint and precompress every asset; returns the manifest {source: hashed}."""
+    compressors = _compressors()
+    manifest = {}
+    for root, dirs, files in os.walk(source_dir):
+        dirs[:] = sorted(d for d in dirs if os.path.join(root, d) != output_dir and not d.startswith(('.', '__')))
+        for filename in sorted(files):
+            ext = os.path.splitext(filename)[1]
+            if ext not in EXTENSIONS:
+                continue
+            path = os.path.join(root, filename)
+            name = os.path.relpath(path, source_dir).replace(os.sep, '/')
+            with open(path, encoding='utf-8') as f:
+                data = MINIFIERS[ext](f.read()).encode()
+            target = hashed_name(name, data)
+            manifest[name] = target
+            destination = os.path.join(output_dir, target)
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            with open(destination, 'wb') as f:
+                f.write(data)
+            for suffix, compress in compressors.items():
+                compressed = compress(data)
+                if len(compressed) < len(data):
+                    with open(destination + suffix, 'wb') as f:
+                        f.write(compressed)
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+_manifest = None
+
+
+def manifest():
+    """The current build's {source: hashed} map, read once per process ({} when not built)."""
+    global _manifest
+    if _manifest is None:
+        try:
+            with open(os.path.join(BUILD_DIR, MANIFEST_NAME)) as f:
+                _manifest = json.load(f)
+        except FileNotFoundError:
+            _manifest = {}
+        except (OSError, ValueError):
+            logger.exception("Unreadable asset manifest; serving unfingerprinted files")
+            _manifest = {}
+    return _manifest
+
+
+def reload():
+    global _manifest
+    _manifest = None
+
+
+def init_app(app):
+    """Serve built assets from /assets and make url_for('static', ...) point at them."""
+    from flask import abort, request, send_file, url_for
+    from werkzeug.security import safe_join
+
+    def asset_url_for(endpoint, **values):
+        if endpoint == 'static' and values.get('filename') in manifest():
+            values['filename'] = manifest()[values['filename']]
+            endpoint = 'assets'
+        return url_for(endpoint, **values)
+
+    app.jinja_env.globals['url_for'] = asset_url_for
+
+    @app.route('/assets/<path:filename>')
+    def assets(filename):
+        path = safe_join(BUILD_DIR, filename)
+        if path is None or os.path.basename(filename) == MANIFEST_NAME or not os.path.isfile(path):
+            abort(404)
+        encoding, suffix = next(((e, s) for e, s in ENCODINGS
+                                 if e in request.accept_encodings and os.path.isfile(path + s)), (None, ''))
+        response = send_file(path + suffix, mimetype=mimetypes.guess_type(filename)[0],
+                             conditional=True, max_age=MAX_AGE)
+        if encoding:
+            response.content_encoding = encoding
+        response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
@@ -0,0 +1,219 @@
+"""
+FixMyHyd Async Report Pipeline
+asyncio implementation of the /api/report-issue processing pipeline.
+
+The synchronous endpoint in app.py runs geocoding, image analysis, audio
+transcription, text analysis and report generation one after another on a
+worker thread. Here the independent stages (geocode, image, audio) run
+concurrently and Gemini is called through its native async client, so a single
+event loop can hold hundreds of in-flight submissions. Used by asgi.py.
+"""
+
+import os
+import asyncio
+import weakref
+
+import app as fixmyhyd
+import cache
+import metrics
+from logging_config import get_logger
+
+logger = get_logger('async_pipeline')
+
+ASYNC_MAX_INFLIGHT = int(os.getenv('ASYNC_MAX_INFLIGHT', '200'))
+
+_API_KEY_ENV = {
+    'image': 'GOOGLE_API_KEY_IMAGE',
+    'audio': 'GOOGLE_API_KEY_AUDIO',
+    'text': 'GOOGLE_API_KEY_TEXT',
+    'report': 'GOOGLE_API_KEY_REPORT',
+}
+
+# Async gRPC clients are bound to the event loop that created them
+_async_clients = {}
+_inflight = {}
+# Pipeline task -> its insert, which keeps running if the pipeline is cancelled
+_commits = weakref.WeakKeyDictionary()
+
+
+class PipelineError(Exception):
+    """A stage failed; carries the HTTP status and error body for the client."""
+
+    def __init__(self, status, body):
+        super().__init__(body.get('error'))
+        self.status = status
+        self.body = body
+
+
+def inflight_limiter():
+    """Per-event-loop semaphore bounding concurrent submissions."""
+    loop = asyncio.get_running_loop()
+    semaphore = _inflight.get(loop)
+    if semaphore is None:
+        semaphore = _inflight[loop] = asyncio.Semaphore(ASYNC_MAX_INFLIGHT)
+    return semaphore
+
+
+def _async_client(api_key):
+    # genai.configure() is process-global, which is unsafe when image, text and
+    # report calls with different keys are in flight at once. Give each key its
+    # own async client instead.
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get((api_key, loop))
+    if client is None:
+        from google.ai import generativelanguage as glm
+        client = glm.GenerativeServiceAsyncClient(client_options={'api_key': api_key}, transport='grpc_asyncio')
+        _async_clients[(api_key, loop)] = client
+    return client
+
+
+async def _generate(api, contents, parse, max_retries=3):
+    """Call Gemini asynchronously with the key for api; returns parse(reply text), or None on failure."""
+    api_key = os.getenv(_API_KEY_ENV[api])
+    if not api_key:
+        logger.error("%s is not set", _API_KEY_ENV[api])
+        return None
+    client = _async_client(api_key)
+    request = fixmyhyd.gemini_request(contents)
+    genai = fixmyhyd.get_genai()
+    for attempt in range(max_retries):
+        try:
+            response = genai.types.AsyncGenerateContentResponse.from_response(
+                await client.generate_content(request))
+            result = parse(response.text)
+            metrics.record_gemini_call(api, 'success')
+            return result
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Gemini %s API error (attempt %d): %s", api, attempt + 1, e)
+            if fixmyhyd.is_quota_error(e):
+                metrics.GEMINI_RATE_LIMITED.inc(api=api)
+                if attempt < max_retries - 1:
+                    metrics.GEMINI_RETRIES.inc(api=api)
+                    await asyncio.sleep(fixmyhyd.quota_retry_delay(attempt))
+                    continue
+            metrics.record_gemini_call(api, 'error')
+            logger.exception("Fatal error in async Gemini %s call", api)
+            return None
+
+
+async def generate_json(api, contents, max_retries=3):
+    """Call Gemini asynchronously and parse its JSON reply; returns None on failure."""
+    parts = contents if isinstance(contents, list) else [contents]
+    cache_key = fixmyhyd.gemini_cache_key(api, *parts)
+    cached = cache.lookup('gemini', cache_key)
+    if cached is not None:
+        return cached
+    result = await _generate(api, contents, fixmyhyd.parse_gemini_json, max_retries)
+    if result is not None:
+        cache.store('gemini', cache_key, result, fixmyhyd.GEMINI_CACHE_TTL)
+    return result
+
+
+async def _timed(stage, coro):
+    with metrics.stage_timer(stage):
+        return await coro
+
+
+async def _insert_and_acknowledge(insert, acknowledge):
+    complaint_id, ghmc_id = await insert
+    return acknowledge(complaint_id, ghmc_id)
+
+
+async def _commit(insert, acknowledge):
+    """Await the complaint insert, shielded: once the AI work is paid for, a client disconnect must not
+    lose the row. Returns acknowledge(complaint_id, ghmc_id)."""
+    pipeline = asyncio.current_task()
+    task = _commits[pipeline] = asyncio.ensure_future(_insert_and_acknowledge(insert, acknowledge))
+    # Cancelled here, the entry stays for pending_commit()
+    ack = await asyncio.shield(task)
+    _commits.pop(pipeline, None)
+    return ack
+
+
+def pending_commit(pipeline):
+    """The insert a cancelled pipeline task had started (resolving to its acknowledgement), or None."""
+    return _commits.pop(pipeline, None)
+
+
+async def _geocode(lat, lng, location_text):
+    if lat is None or lng is None:
+        return location_text
+    # geopy has no native asyncio adapter without aiohttp; keep it off the loop
+    return await _timed('geocode', asyncio.to_thread(fixmyhyd.reverse_geocode_coordinates, lat, lng))
+
+
+async def _analyze_image(image_bytes):
+    image_part = {"mime_type": "image/jpeg", "data": image_bytes}
+    return await _timed('image', generate_json('image', [fixmyhyd.build_image_prompt(), image_part]))
+
+
+async def _transcribe(audio_bytes, audio_mimetype):
+    if not audio_bytes:
+        return None
+    # Sent inline: voice notes are capped well below Gemini's inline size limit
+    audio_part = {"mime_type": audio_mimetype, "data": audio_bytes}
+    return await _timed('audio', _generate('audio', [fixmyhyd.AUDIO_PROMPT, audio_part], str.strip))
+
+
+async def run_report_pipeline(image_bytes, audio_bytes, audio_mimetype, text_description, device_lat,
+                              device_lng, manual_address, user_id):
+    """Process one submission; returns the acknowledgement body or raises PipelineError."""
+    location = fixmyhyd.resolve_report_location(device_lat, device_lng, manual_address)
+    if location is None:
+        raise PipelineError(400, {"status": "error", "error": "Location data is required but was not provided."})
+    lat, lng, location_text = location
+
+    # Link reports of an already-open issue before any Gemini call
+    image_phash, duplicate = await _timed('dedup', asyncio.to_thread(
+        fixmyhyd.detect_duplicate, lat, lng, image_bytes, text_description))
+    image_sha256 = await _timed('media', asyncio.to_thread(fixmyhyd.store_report_image, image_bytes))
+    if duplicate:
+        original, evidence = duplicate
+        logger.info("Report matches open complaint %s: %s", original['ghmc_id'], evidence)
+        return await _commit(
+            asyncio.to_thread(fixmyhyd.link_duplicate_complaint, original, user_id, lat, lng, image_phash,
+                              text_description, image_sha256),
+            lambda complaint_id, ghmc_id: fixmyhyd.duplicate_acknowledgement(complaint_id, ghmc_id, original))
+
+    async with inflight_limiter():
+        # Stages 1-3 are independent of each other
+        location_text, image_analysis, voice_transcription = await asyncio.gather(
+            _geocode(lat, lng, location_text), _analyze_image(image_bytes), _transcribe(audio_bytes, audio_mimetype))
+        if not image_analysis:
+            raise PipelineError(500, {"error": "AI processing failed for the image."})
+
+        full_description = text_description or ""
+        if voice_transcription:
+            full_description += f"\n\n(Voice Note Transcription: {voice_transcription})"
+        full_description = full_description.strip()
+        if not full_description:
+            raise PipelineError(500, {"error": "Processing failed: Could not generate a description from the provided input."})
+
+        text_analysis = await _timed('text', generate_json('text', fixmyhyd.build_text_prompt(full_description)))
+        if not text_analysis:
+            raise PipelineError(500, {"error": "AI processing failed for the text description."})
+
+        formal_report = await _timed('report', generate_json('report', fixmyhyd.build_report_prompt({
+            'image_analysis': image_analysis,
+            'voice_transcription': voice_transcription,
+            'text_analysis': text_analysis,
+            'location_text': location_text,
+        })))
+        if not formal_report:
+            raise PipelineError(500, {"error": "AI failed to generate the final report."})
+
+    category = text_analysis.get("category", image_analysis.get("category", "Other"))
+    priority = text_analysis.get("priority", "Medium")
+    return await _commit(
+        _timed('db_insert', asyncio.to_thread(
+            fixmyhyd.save_complaint,
+            category=category, priority=priority,
+            subject=formal_report.get('subject', 'Untitled Complaint'),
+            description=formal_report.get('description', full_description),
+            location=location_text, zone=formal_report.get('zone', 'Unknown'),
+            gps_lat=lat, gps_lng=lng, user_id=user_id,
+            image_phash=image_phash, report_text=full_description, image_sha256=image_sha256)),
+        lambda complaint_id, ghmc_id: fixmyhyd.submission_acknowledgement(
+            complaint_id, ghmc_id, formal_report.get('subject'), category, priority))
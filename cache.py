@@ -0,0 +1,576 @@
+"""
+FixMyHyd Shared Cache
+Cache shared by every gunicorn worker (and the ASGI server) on one host.
+
+Backends are picked with CACHE_URL:
+    sqlite:///path/to/cache.db   WAL-mode SQLite file (default: <tmpdir>/fixmyhyd-cache.db)
+    memory://                    per-process dict (shared = False; complaint IDs refuse it)
+    redis://host:6379/0          Redis (needs the `redis` package)
+
+Every backend implements the same interface: get/set with TTLs, atomic add
+(set if absent), delete and delete_prefix, atomic incr, LRU eviction once CACHE_MAX_ENTRIES is reached,
+and publish/subscribe for cross-worker invalidation messages. Values must be
+JSON-serializable.
+
+With SESSION_BACKEND=cache, Flask sessions are stored here as well, so the
+cookie holds only a signed session id.
+
+memoize() is the usual entry point: it wraps a lookup with hit/miss metrics
+and never caches None, so failed lookups are retried on the next call.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import secrets
+import tempfile
+import threading
+from collections import OrderedDict
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from werkzeug.datastructures import CallbackDict
+
+import metrics
+from logging_config import get_logger
+
+logger = get_logger('cache')
+
+MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', '10000'))
+POLL_INTERVAL = float(os.getenv('CACHE_POLL_INTERVAL', '0.5'))
+
+INVALIDATE_CHANNEL = 'invalidate'
+# Session keys that identify who is logged in; changing one gives the session a new id
+PRIVILEGE_KEYS = ('user_id', 'admin_id')
+
+
+class CacheBackend:
+    """Interface shared by all cache backends."""
+
+    # Whether other processes see the same data; state that must agree across workers checks it
+    shared = True
+
+    def get(self, key, default=None):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        raise NotImplementedError
+
+    def add(self, key, value, ttl=None):
+        """Store value only if key is missing or expired; returns whether it was stored (atomic)."""
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def delete_prefix(self, prefix):
+        raise NotImplementedError
+
+    def incr(self, key, amount=1, ttl=None):
+        """Atomically add `amount` to an integer (missing keys start at 0); returns the new value."""
+        raise NotImplementedError
+
+    def publish(self, channel, message):
+        raise NotImplementedError
+
+    def subscribe(self, channel, callback):
+        """Call callback(message) for every message published on channel, from any process."""
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def invalidate(self, prefix):
+        """Drop every key under prefix and tell subscribers in all workers."""
+        self.delete_prefix(prefix)
+        self.publish(INVALIDATE_CHANNEL, prefix)
+
+    def close(self):
+        pass
+
+
+class MemoryCache(CacheBackend):
+    """Per-process LRU dict. Not shared between workers."""
+
+    shared = False
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def _live(self, key, now):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        if item[1] is not None and item[1] <= now:
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return item
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._live(key, time.time())
+            return default if item is None else item[0]
+
+    def _store(self, key, value, ttl, now):
+        self._data[key] = (value, now + ttl if ttl else None)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._store(key, value, ttl, time.time())
+
+    def add(self, key, value, ttl=None):
+        now = time.time()
+        # Checked and stored under one lock, so only one caller can win
+        with self._lock:
+            if self._live(key, now) is not None:
+                return False
+            self._store(key, value, ttl, now)
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [k for k in self._data if k.startswith(prefix)]:
+                del self._data[key]
+
+    def incr(self, key, amount=1, ttl=None):
+        now = time.time()
+        with self._lock:
+            item = self._live(key, now)
+            if item is None:
+                item = (0, now + ttl if ttl else None)
+            value = int(item[0]) + amount
+            self._data[key] = (value, item[1])
+            self._data.move_to_end(key)
+            return value
+
+    def publish(self, channel, message):
+        for callback in list(self._subscribers.get(channel, ())):
+            _deliver(callback, message)
+
+    def subscribe(self, channel, callback):
+        self._subscribers.setdefault(channel, []).append(callback)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class SQLiteCache(CacheBackend):
+    """Cache stored in a WAL-mode SQLite file that all local processes open.
+
+    Reads never block on writers. Access times are refreshed at most once per
+    LRU_RESOLUTION seconds per key so that hot reads do not turn into writes.
+    Published messages go to an append-only table that a background thread in
+    each subscribing process polls every CACHE_POLL_INTERVAL seconds.
+    """
+
+    LRU_RESOLUTION = 30
+    EVICT_EVERY = 100
+    EVENT_RETENTION = 300
+
+    def __init__(self, path, max_entries=MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        self._subscribers = {}
+        self._poller = None
+        self._last_event_id = 0
+        self._own_events = set()
+        self._setup()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _setup(self):
+        conn = self._connect()
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL,
+                accessed_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_cache_accessed_at ON cache(accessed_at);
+            CREATE INDEX IF NOT EXISTS idx_cache_expires_at ON cache(expires_at);
+            CREATE TABLE IF NOT EXISTS cache_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                channel TEXT NOT NULL,
+                message TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+        ''')
+
+    def get(self, key, default=None):
+        now = time.time()
+        conn = self._connect()
+        row = conn.execute('SELECT value, expires_at, accessed_at FROM cache WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return default
+        value, expires_at, accessed_at = row
+        if expires_at is not None and expires_at <= now:
+            conn.execute('DELETE FROM cache WHERE key = ? AND expires_at <= ?', (key, now))
+            return default
+        if now - accessed_at > self.LRU_RESOLUTION:
+            conn.execute('UPDATE cache SET accessed_at = ? WHERE key = ?', (now, key))
+        return json.loads(value)
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        self._connect().execute(
+            'INSERT OR REPLACE INTO cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)',
+            (key, json.dumps(value), now + ttl if ttl else None, now))
+        self._after_write(now)
+
+    def add(self, key, value, ttl=None):
+        now = time.time()
+        # Replaces only an expired row, so two processes can never both succeed
+        cursor = self._connect().execute('''
+            INSERT INTO cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET
+                value = excluded.value, expires_at = excluded.expires_at, accessed_at = excluded.accessed_at
+            WHERE cache.expires_at IS NOT NULL AND cache.expires_at <= excluded.accessed_at
+        ''', (key, json.dumps(value), now + ttl if ttl else None, now))
+        self._after_write(now)
+        return cursor.rowcount == 1
+
+    def delete(self, key):
+        self._connect().execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def delete_prefix(self, prefix):
+        # Range scan on the primary key instead of LIKE, which would need escaping
+        self._connect().execute('DELETE FROM cache WHERE key >= ? AND key < ?', (prefix, prefix + '\U0010ffff'))
+
+    def incr(self, key, amount=1, ttl=None):
+        now = time.time()
+        conn = self._connect()
+        # Single statement, so concurrent increments from other processes are never lost
+        row = conn.execute('''
+            INSERT INTO cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET
+                value = CASE WHEN cache.expires_at IS NOT NULL AND cache.expires_at <= excluded.accessed_at
+                             THEN excluded.value ELSE CAST(cache.value AS INTEGER) + ? END,
+                expires_at = CASE WHEN cache.expires_at IS NOT NULL AND cache.expires_at <= excluded.accessed_at
+                                  THEN excluded.expires_at ELSE cache.expires_at END,
+                accessed_at = excluded.accessed_at
+            RETURNING value
+        ''', (key, str(amount), now + ttl if ttl else None, now, amount)).fetchone()
+        self._after_write(now)
+        return int(row[0])
+
+    def _after_write(self, now):
+        self._writes += 1
+        if self._writes % self.EVICT_EVERY:
+            return
+        conn = self._connect()
+        conn.execute('DELETE FROM cache WHERE expires_at <= ?', (now,))
+        excess = conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0] - self.max_entries
+        if excess > 0:
+            conn.execute('DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed_at LIMIT ?)',
+                         (excess,))
+            logger.debug("Evicted %d least recently used cache entries", excess)
+        conn.execute('DELETE FROM cache_events WHERE created_at < ?', (now - self.EVENT_RETENTION,))
+
+    def publish(self, channel, message):
+        cursor = self._connect().execute('INSERT INTO cache_events (channel, message, created_at) VALUES (?, ?, ?)',
+                                         (channel, json.dumps(message), time.time()))
+        # Local subscribers hear about it immediately; the poller skips our own rows. Without a
+        # poller there is nothing to skip, and the ids would pile up in every non-subscribing worker.
+        if self._poller is not None:
+            self._own_events.add(cursor.lastrowid)
+        for callback in list(self._subscribers.get(channel, ())):
+            _deliver(callback, message)
+
+    def subscribe(self, channel, callback):
+        self._subscribers.setdefault(channel, []).append(callback)
+        self._start_poller()
+
+    def _start_poller(self):
+        if self._poller is not None and self._poller.is_alive():
+            return
+        row = self._connect().execute('SELECT MAX(id) FROM cache_events').fetchone()
+        self._last_event_id = row[0] or 0
+        self._poller = threading.Thread(target=self._poll, name='fixmyhyd-cache-events', daemon=True)
+        self._poller.start()
+
+    def _poll(self):
+        pid = os.getpid()
+        while os.getpid() == pid:
+            time.sleep(POLL_INTERVAL)
+            try:
+                rows = self._connect().execute(
+                    'SELECT id, channel, message FROM cache_events WHERE id > ? ORDER BY id',
+                    (self._last_event_id,)).fetchall()
+            except sqlite3.Error:
+                logger.exception("Polling cache events failed")
+                continue
+            for event_id, channel, message in rows:
+                self._last_event_id = event_id
+                if event_id in self._own_events:
+                    self._own_events.discard(event_id)
+                    continue
+                for callback in list(self._subscribers.get(channel, ())):
+                    _deliver(callback, json.loads(message))
+
+    def clear(self):
+        self._connect().execute('DELETE FROM cache')
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def reset_after_fork(self):
+        # Threads do not survive fork; subscribers re-register in the worker
+        self._local = threading.local()
+        self._subscribers = {}
+        self._poller = None
+        self._own_events = set()
+
+
+class RedisCache(CacheBackend):
+    """Redis-backed cache. Configure `maxmemory-policy allkeys-lru` on the server for LRU eviction."""
+
+    def __init__(self, url, namespace='fixmyhyd:'):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+        self.namespace = namespace
+        self._pubsub = None
+        self._callbacks = {}
+
+    def _key(self, key):
+        return self.namespace + key
+
+    def get(self, key, default=None):
+        value = self._redis.get(self._key(key))
+        return default if value is None else json.loads(value)
+
+    def set(self, key, value, ttl=None):
+        self._redis.set(self._key(key), json.dumps(value), ex=int(ttl) if ttl else None)
+
+    def add(self, key, value, ttl=None):
+        return bool(self._redis.set(self._key(key), json.dumps(value), ex=int(ttl) if ttl else None, nx=True))
+
+    def delete(self, key):
+        self._redis.delete(self._key(key))
+
+    def delete_prefix(self, prefix):
+        keys = list(self._redis.scan_iter(match=self._key(prefix) + '*', count=500))
+        if keys:
+            self._redis.delete(*keys)
+
+    def incr(self, key, amount=1, ttl=None):
+        if not ttl:
+            return int(self._redis.incrby(self._key(key), amount))
+        # Create the counter with its expiry first (SET NX EX, unlike EXPIRE NX, predates Redis 7)
+        pipe = self._redis.pipeline()
+        pipe.set(self._key(key), 0, ex=int(ttl), nx=True)
+        pipe.incrby(self._key(key), amount)
+        return int(pipe.execute()[1])
+
+    def publish(self, channel, message):
+        self._redis.publish(self._key(channel), json.dumps(message))
+
+    def subscribe(self, channel, callback):
+        self._callbacks.setdefault(channel, []).append(callback)
+        if self._pubsub is None:
+            self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(**{self._key(channel): self._dispatch})
+        if not getattr(self, '_thread', None):
+            self._thread = self._pubsub.run_in_thread(sleep_time=POLL_INTERVAL, daemon=True)
+
+    def _dispatch(self, message):
+        channel = message['channel'].decode()[len(self.namespace):]
+        for callback in list(self._callbacks.get(channel, ())):
+            _deliver(callback, json.loads(message['data']))
+
+    def clear(self):
+        self.delete_prefix('')
+
+    def reset_after_fork(self):
+        self._redis.connection_pool.reset()
+        self._pubsub = None
+        self._thread = None
+        self._callbacks = {}
+
+
+def _deliver(callback, message):
+    try:
+        callback(message)
+    except Exception:
+        logger.exception("Cache subscriber failed")
+
+
+def default_path():
+    return os.path.join(tempfile.gettempdir(), 'fixmyhyd-cache.db')
+
+
+def create_cache(url=None):
+    """Build the backend described by a CACHE_URL."""
+    url = url or os.getenv('CACHE_URL') or f'sqlite:///{default_path()}'
+    if url.startswith('memory://'):
+        return MemoryCache()
+    if url.startswith('redis://') or url.startswith('rediss://'):
+        return RedisCache(url)
+    if url.startswith('sqlite:///'):
+        return SQLiteCache(url[len('sqlite:///'):])
+    raise ValueError(f"Unsupported CACHE_URL: {url}")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """This process's cache backend, created on first use."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                try:
+                    _cache = create_cache()
+                except Exception:
+                    # A broken shared cache must not take the site down
+                    logger.exception("Shared cache unavailable, falling back to a per-process cache")
+                    _cache = MemoryCache()
+    return _cache
+
+
+def reset_after_fork():
+    if _cache is not None and hasattr(_cache, 'reset_after_fork'):
+        _cache.reset_after_fork()
+
+
+def lookup(namespace, key):
+    """Cached value for namespace:key or None; records a hit/miss and never raises."""
+    try:
+        value = get_cache().get(f"{namespace}:{key}")
+    except Exception:
+        logger.exception("Cache read failed for %s:%s", namespace, key)
+        return None
+    metrics.record_cache_lookup(namespace, value is not None)
+    return value
+
+
+def store(namespace, key, value, ttl=None):
+    """Cache value under namespace:key; None is never stored and errors are logged, not raised."""
+    if value is None:
+        return
+    try:
+        get_cache().set(f"{namespace}:{key}", value, ttl)
+    except Exception:
+        logger.exception("Cache write failed for %s:%s", namespace, key)
+
+
+def memoize(namespace, key, compute, ttl=None):
+    """Return the cached value for namespace:key, computing and storing it on a miss."""
+    value = lookup(namespace, key)
+    if value is None:
+        value = compute()
+        store(namespace, key, value, ttl)
+    return value
+
+
+class CacheSessionInterface(SessionInterface):
+    """Server-side sessions: the cookie carries a signed random id, the data lives in the shared cache.
+
+    The id is replaced whenever a privilege key (PRIVILEGE_KEYS) changes, so an id planted before
+    login is worthless after it.
+    """
+
+    serializer = TaggedJSONSerializer()
+
+    def _signer(self, app):
+        return URLSafeTimedSerializer(app.secret_key, salt='fixmyhyd-session-id')
+
+    def open_session(self, app, request):
+        sid = None
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if cookie:
+            try:
+                sid = self._signer(app).loads(cookie, max_age=int(app.permanent_session_lifetime.total_seconds()))
+            except BadSignature:
+                sid = None
+        if sid:
+            try:
+                data = get_cache().get(f"session:{sid}")
+            except Exception:
+                logger.exception("Session read failed")
+                data = None
+            if data is not None:
+                return ServerSideSession(self.serializer.loads(data), sid=sid)
+        return ServerSideSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        key = f"session:{session.sid}"
+        if not session:
+            if session.modified:
+                get_cache().delete(key)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+        if not self.should_set_cookie(app, session):
+            return
+        if session.privileges != session.current_privileges():
+            # Login, logout or a switch of account: issue a new id and forget the old one
+            if not session.new:
+                get_cache().delete(key)
+            session.sid = secrets.token_urlsafe(32)
+            key = f"session:{session.sid}"
+        ttl = int(app.permanent_session_lifetime.total_seconds())
+        get_cache().set(key, self.serializer.dumps(dict(session)), ttl)
+        response.set_cookie(
+            name, self._signer(app).dumps(session.sid), expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+            secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app))
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        self.privileges = self.current_privileges()
+
+    def current_privileges(self):
+        return tuple(self.get(key) for key in PRIVILEGE_KEYS)
+
+
+def init_app(app):
+    """Keep sessions in the shared cache when SESSION_BACKEND=cache (default: signed cookies)."""
+    if os.getenv('SESSION_BACKEND', 'cookie') == 'cache':
+        app.session_interface = CacheSessionInterface()
+
+
+def invalidate(prefix):
+    """Drop cached entries under prefix in every worker; errors are logged, not raised."""
+    try:
+        get_cache().invalidate(prefix)
+    except Exception:
+        logger.exception("Cache invalidation failed for %s", prefix)
@@ -0,0 +1,220 @@
+"""
+FixMyHyd Response Compression
+WSGI middleware that gzip- or brotli-encodes text responses (HTML, JSON,
+CSS, JavaScript) for clients that accept it.
+
+The encoding is picked from Accept-Encoding (brotli first when the `Brotli`
+package is installed). Responses are left alone when they are already
+encoded (e.g. the precompressed /assets files), partial (206), marked
+`Cache-Control: no-transform`, not a compressible type, or smaller than
+COMPRESSION_MIN_BYTES, since compressing a few hundred bytes costs more CPU
+than it saves on the wire.
+
+Streamed responses (a generator body without Content-Length) are compressed
+chunk by chunk and flushed after every chunk, so clients still receive data
+as it is produced. Bytes in/out and CPU seconds per encoding are exported as
+fixmyhyd_compression_* metrics; `python manage.py compression-bench` compares
+levels on real complaint data.
+"""
+
+import os
+import time
+import zlib
+
+from werkzeug.datastructures import Headers
+from werkzeug.http import parse_accept_header
+
+import metrics
+
+ENABLED = os.getenv('COMPRESSION_ENABLED', '1') == '1'
+MIN_BYTES = int(os.getenv('COMPRESSION_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.getenv('COMPRESSION_GZIP_LEVEL', '6'))
+# Brotli 4-5 compresses better than gzip 6 at similar speed; 11 is for build-time assets only
+BROTLI_QUALITY = int(os.getenv('COMPRESSION_BROTLI_QUALITY', '4'))
+
+COMPRESSIBLE_TYPES = {
+    'text/html', 'text/plain', 'text/css', 'text/csv', 'text/javascript', 'application/javascript',
+    'application/json', 'application/problem+json', 'application/xml', 'image/svg+xml',
+}
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class _Gzip:
+    def __init__(self, level):
+        # wbits 16+ writes the gzip header and trailer
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class _Brotli:
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+def available_encodings():
+    """Encodings this process can produce, preferred first."""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def compressor(encoding, level=None):
+    if encoding == 'br':
+        return _Brotli(BROTLI_QUALITY if level is None else level)
+    return _Gzip(GZIP_LEVEL if level is None else level)
+
+
+def negotiate(accept_encoding):
+    """The encoding to use for an Accept-Encoding header value, or None for identity."""
+    accepted = parse_accept_header(accept_encoding or '')
+    for encoding in available_encodings():
+        if accepted.quality(encoding) > 0:
+            return encoding
+    return None
+
+
+def _compressible(status, headers, environ):
+    if environ.get('REQUEST_METHOD') == 'HEAD' or status[:3] in ('204', '206', '304') or status[0] == '1':
+        return False
+    if headers.get('Content-Encoding') or 'no-transform' in headers.get('Cache-Control', ''):
+        return False
+    mimetype = headers.get('Content-Type', '').split(';')[0].strip().lower()
+    return mimetype in COMPRESSIBLE_TYPES
+
+
+class _Measured:
+    """A compressor that counts input/output bytes and the CPU time it spends."""
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        self._compressor = compressor(encoding)
+        self.bytes_in = self.bytes_out = 0
+        self.cpu = 0.0
+
+    def _run(self, method, *args):
+        start = time.thread_time()
+        output = method(*args)
+        self.cpu += time.thread_time() - start
+        self.bytes_out += len(output)
+        return output
+
+    def compress(self, data):
+        self.bytes_in += len(data)
+        return self._run(self._compressor.compress, data)
+
+    def flush(self):
+        return self._run(self._compressor.flush)
+
+    def finish(self):
+        output = self._run(self._compressor.finish)
+        metrics.record_compression(self.encoding, self.bytes_in, self.bytes_out, self.cpu)
+        return output
+
+
+class CompressionMiddleware:
+    def __init__(self, wsgi_app, min_bytes=MIN_BYTES):
+        self.wsgi_app = wsgi_app
+        self.min_bytes = min_bytes
+
+    def __call__(self, environ, start_response):
+        captured = {}
+        written = []
+
+        def capture(status, headers, exc_info=None):
+            captured['response'] = (status, headers, exc_info)
+            return written.append
+
+        body = self.wsgi_app(environ, capture)
+        status, header_list, exc_info = captured['response']
+        headers = Headers(header_list)
+        if not _compressible(status, headers, environ):
+            start_response(status, header_list, exc_info)
+            return _chain(written, body) if written else body
+        vary = headers.get('Vary')
+        headers['Vary'] = f'{vary}, Accept-Encoding' if vary else 'Accept-Encoding'
+        encoding = negotiate(environ.get('HTTP_ACCEPT_ENCODING'))
+        if encoding is None:
+            start_response(status, headers.to_wsgi_list(), exc_info)
+            return _chain(written, body) if written else body
+
+        # Read up to min_bytes to decide; small bodies go out as they are
+        chunks, size, iterator = list(written), sum(map(len, written)), iter(body)
+        while size < self.min_bytes:
+            chunk = next(iterator, None)
+            if chunk is None:
+                _close(body)
+                start_response(status, headers.to_wsgi_list(), exc_info)
+                return chunks
+            chunks.append(chunk)
+            size += len(chunk)
+
+        headers['Content-Encoding'] = encoding
+        etag = headers.get('ETag')
+        if etag and not etag.startswith('W/'):
+            # The encoded body is not byte-identical to the original
+            headers['ETag'] = f'W/{etag}'
+        measured = _Measured(encoding)
+
+        if 'Content-Length' in headers:
+            try:
+                payload = measured.compress(b''.join(chunks) + b''.join(iterator)) + measured.finish()
+            finally:
+                _close(body)
+            headers['Content-Length'] = str(len(payload))
+            start_response(status, headers.to_wsgi_list(), exc_info)
+            return [payload]
+
+        start_response(status, headers.to_wsgi_list(), exc_info)
+        return self._stream(measured, b''.join(chunks), iterator, body)
+
+    @staticmethod
+    def _stream(measured, head, iterator, body):
+        try:
+            yield measured.compress(head) + measured.flush()
+            for chunk in iterator:
+                # Flush per chunk so streamed responses reach the client as they are produced
+                output = measured.compress(chunk) + measured.flush()
+                if output:
+                    yield output
+            yield measured.finish()
+        finally:
+            _close(body)
+
+
+def _chain(written, body):
+    # Data passed to the legacy write() callable comes before the body
+    try:
+        yield from written
+        yield from body
+    finally:
+        _close(body)
+
+
+def _close(body):
+    if hasattr(body, 'close'):
+        body.close()
+
+
+def init_app(app):
+    """Compress responses of every route (and the ASGI fallback, which wraps app.wsgi_app)."""
+    if ENABLED:
+        app.wsgi_app = CompressionMiddleware(app.wsgi_app)
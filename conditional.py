@@ -0,0 +1,114 @@
+"""
+FixMyHyd Conditional GETs
+ETag / Last-Modified validation for the complaint read APIs.
+
+Every write to complaints bumps a version counter and a last-modified time
+in the shared cache (see touch()). A response's ETag hashes that version
+with the request path, query string and the signed-in user or admin, so
+it changes whenever any complaint changes and is never shared between
+accounts. conditional_get() checks If-None-Match (or If-Modified-Since)
+against it before calling the view, so a revalidation that still matches
+costs one cache read: no database query and no JSON serialization.
+
+Responses are per-user, so they are sent as `private, no-cache`: browsers
+keep them but must revalidate, and shared proxies never store them.
+
+If the cache loses the counter, it restarts from the current time in
+milliseconds, so old ETags cannot match again. With a per-process cache
+(memory://, or the fallback when the shared cache cannot be opened) other
+workers' writes are invisible, so responses are sent without validators
+rather than risk a stale 304.
+"""
+
+import hashlib
+import time
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import make_response, request, session
+
+import cache
+from logging_config import get_logger
+
+logger = get_logger('conditional')
+
+VERSION_KEY = 'http:complaints-version'
+MODIFIED_KEY = 'http:complaints-modified'
+CACHE_CONTROL = 'private, no-cache'
+
+# Counters below this were recreated by incr() after the cache lost them
+_RESEEDED = 10 ** 12
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+def touch():
+    """Record that complaints changed, in every worker; errors are logged, not raised."""
+    try:
+        backend = cache.get_cache()
+        if backend.incr(VERSION_KEY) < _RESEEDED:
+            backend.incr(VERSION_KEY, _now_ms())
+        backend.set(MODIFIED_KEY, int(time.time()))
+    except Exception:
+        logger.exception("Could not record a complaints change")
+
+
+def current():
+    """(version, last-modified datetime) of the complaints table, seeding both if missing."""
+    backend = cache.get_cache()
+    version = backend.get(VERSION_KEY)
+    if version is None:
+        version = backend.incr(VERSION_KEY, _now_ms())
+    modified = backend.get(MODIFIED_KEY)
+    if modified is None:
+        modified = int(time.time())
+        backend.set(MODIFIED_KEY, modified)
+    return version, datetime.fromtimestamp(modified, timezone.utc)
+
+
+def etag(version):
+    viewer = f"{session.get('user_id')}:{session.get('admin_id')}"
+    return hashlib.sha1(f'{version}|{viewer}|{request.full_path}'.encode()).hexdigest()[:20]
+
+
+def _not_modified(tag, modified):
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(tag)
+    since = request.if_modified_since
+    return since is not None and modified.replace(microsecond=0) <= since
+
+
+def _validators(response, tag, modified):
+    # Weak: the body is equivalent, not byte-identical, across content encodings
+    response.set_etag(tag, weak=True)
+    response.last_modified = modified
+    response.headers['Cache-Control'] = CACHE_CONTROL
+    response.vary.add('Cookie')
+    return response
+
+
+def conditional_get(f):
+    """Answer GETs with 304 when the client's copy is current; tag 200 responses with validators.
+
+    Goes under the login decorators, so unauthenticated requests never reach it.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        try:
+            if not cache.get_cache().shared:
+                # Writes handled by other workers would never bump this process's version
+                return f(*args, **kwargs)
+            version, modified = current()
+        except Exception:
+            logger.exception("Complaints version unavailable, serving without validators")
+            return f(*args, **kwargs)
+        tag = etag(version)
+        if _not_modified(tag, modified):
+            return _validators(make_response('', 304), tag, modified)
+        response = make_response(f(*args, **kwargs))
+        if response.status_code == 200:
+            _validators(response, tag, modified)
+        return response
+    return decorated_function
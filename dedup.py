@@ -0,0 +1,77 @@
+"""
+FixMyHyd Duplicate Detection
+Scores whether a new report describes an already-open complaint.
+
+The candidates come from app.find_duplicate_complaint(): open complaints within
+DEDUP_RADIUS_M metres and DEDUP_WINDOW_DAYS days, found through the spatial
+index. A candidate is a duplicate when its photo is perceptually the same
+(difference hash within IMAGE_HASH_MAX_DISTANCE bits) or the citizen's text
+is similar enough (word-set Jaccard >= TEXT_SIMILARITY_THRESHOLD). This runs
+before any Gemini call, so a duplicate costs no AI work.
+"""
+
+import io
+import os
+import re
+
+from logging_config import get_logger
+
+logger = get_logger('dedup')
+
+ENABLED = os.getenv('DEDUP_ENABLED', '1') == '1'
+RADIUS_M = float(os.getenv('DEDUP_RADIUS_M', '75'))
+WINDOW_DAYS = int(os.getenv('DEDUP_WINDOW_DAYS', '14'))
+IMAGE_HASH_MAX_DISTANCE = int(os.getenv('DEDUP_IMAGE_HASH_MAX_DISTANCE', '10'))
+TEXT_SIMILARITY_THRESHOLD = float(os.getenv('DEDUP_TEXT_SIMILARITY', '0.5'))
+
+OPEN_STATUSES = ('Submitted', 'In Progress')
+
+_STOPWORDS = frozenset('''
+    a an the and or of to in on at for is are was were be been it this that there here
+    near my our very please from with has have not no
+'''.split())
+
+
+def image_hash(image_bytes):
+    """64-bit difference hash of an image as 16 hex characters, or None if it cannot be decoded."""
+    from PIL import Image
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            pixels = image.convert('L').resize((9, 8), Image.LANCZOS).tobytes()
+    except Exception:
+        logger.debug("Could not decode image for perceptual hashing")
+        return None
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return f"{bits:016x}"
+
+
+def hash_distance(a, b):
+    return bin(int(a, 16) ^ int(b, 16)).count('1')
+
+
+def _words(text):
+    return {w for w in re.findall(r'[a-z0-9]+', (text or '').lower()) if len(w) > 2 and w not in _STOPWORDS}
+
+
+def text_similarity(a, b):
+    """Jaccard similarity of the two texts' significant words (0..1)."""
+    wa, wb = _words(a), _words(b)
+    if not wa or not wb:
+        return 0.0
+    return len(wa & wb) / len(wa | wb)
+
+
+def match(candidate, image_hash_value, text):
+    """Evidence that candidate (a complaint row) duplicates the new report, or None."""
+    evidence = {}
+    if image_hash_value and candidate.get('image_phash'):
+        distance = hash_distance(image_hash_value, candidate['image_phash'])
+        if distance <= IMAGE_HASH_MAX_DISTANCE:
+            evidence['image_distance'] = distance
+    similarity = text_similarity(text, candidate.get('report_text'))
+    if similarity >= TEXT_SIMILARITY_THRESHOLD:
+        evidence['text_similarity'] = round(similarity, 3)
+    return evidence or None
@@ -8,6 +8,7 @@ import sqlite3
 import random
 from datetime import datetime, timedelta
 from app import get_db_connection, hash_password
+from ids import new_complaint_id
 
 def add_demo_data():
     """Add sample data to the database"""
@@ -114,7 +115,7 @@ def add_demo_data():
             continue
             
         # Create GHMC ID
-        ghmc_id = f"GHMC/HYD/{int(datetime.now().timestamp()) + i}"
+        ghmc_id = new_complaint_id()
         
         # Random status
         status = random.choice(statuses)
@@ -0,0 +1,161 @@
+"""
+FixMyHyd Live Events
+Complaint events for the admin dashboard, streamed as Server-Sent Events.
+
+    complaint.created         a new report (or a duplicate linked to an open one)
+    complaint.status_changed  one or more complaints moved to a new status
+    complaint.reassigned      one or more complaints moved to another zone
+
+publish() sends an event through the shared cache's publish/subscribe
+channel, so every worker hears it, whichever one handled the write. Each
+worker keeps the last BUFFER_SIZE events in an in-process EventBus that its
+open streams wait on; nothing touches the database. Event ids come from a
+counter in the shared cache, so a reconnecting browser can resume from its
+Last-Event-ID on any worker, or is told to reload (`resync`) when the
+buffer does not cover what it missed: it fell more than BUFFER_SIZE events
+behind, or the events were published before this worker subscribed (on its
+first stream).
+
+Each open stream holds a worker thread, so streams are capped per process
+(EVENTS_MAX_STREAMS, a quarter of the gunicorn threads) and end after
+EVENTS_MAX_SECONDS; browsers reconnect on their own. Dashboards close their
+stream while the tab is hidden and resume from the last event id, starting
+from the latest_id() rendered into the page.
+"""
+
+import os
+import json
+import time
+import threading
+from collections import deque
+
+import cache
+from logging_config import get_logger
+
+logger = get_logger('events')
+
+CHANNEL = 'complaint-events'
+SEQUENCE_KEY = 'events:sequence'
+BUFFER_SIZE = int(os.getenv('EVENTS_BUFFER_SIZE', '1000'))
+# Each stream holds a worker thread; gunicorn.conf.py sets this to a quarter of the threads
+MAX_STREAMS = int(os.getenv('EVENTS_MAX_STREAMS', '2'))
+MAX_SECONDS = int(os.getenv('EVENTS_MAX_SECONDS', '300'))
+HEARTBEAT_SECONDS = 15
+RETRY_MS = 3000
+
+
+class EventBus:
+    """Recent events of this process, for streams to wait on."""
+
+    def __init__(self, size=BUFFER_SIZE):
+        self._events = deque(maxlen=size)
+        self._position = 0  # events ever appended; a stream's cursor is a position
+        self._condition = threading.Condition()
+        self._subscribed = False
+        self._horizon = None  # last event id published before this process subscribed
+        self._streams = 0
+
+    def append(self, event):
+        with self._condition:
+            self._events.append(event)
+            self._position += 1
+            self._condition.notify_all()
+
+    def cursor(self, last_event_id=None, latest_id=None):
+        """(position to read from, False) resuming after last_event_id; (now, True) if events were lost.
+
+        latest_id is the shared sequence's current value, for telling a stale id from a cache reset.
+        """
+        with self._condition:
+            if last_event_id is None:
+                return self._position, False
+            if latest_id is not None and last_event_id > latest_id:
+                # The sequence restarted (the cache lost it); ids the client has seen mean nothing now
+                return self._position, True
+            start = self._position - len(self._events)
+            for offset, event in enumerate(self._events):
+                if event['id'] > last_event_id:
+                    # A gap before the oldest buffered event means the client missed some
+                    lost = offset == 0 and event['id'] > last_event_id + 1
+                    return (self._position, True) if lost else (start + offset, False)
+            # Nothing newer is buffered; events published before this process subscribed never reached it
+            lost = self._horizon is None or last_event_id < self._horizon
+            return self._position, lost
+
+    def wait(self, position, timeout):
+        """Events after position (blocking up to timeout for the first one) and the new position."""
+        with self._condition:
+            if position == self._position:
+                self._condition.wait(timeout)
+            start = self._position - len(self._events)
+            if position < start:
+                return None, self._position
+            return list(self._events)[position - start:], self._position
+
+    def open_stream(self):
+        with self._condition:
+            if self._streams >= MAX_STREAMS:
+                return False
+            self._streams += 1
+            return True
+
+    def close_stream(self):
+        with self._condition:
+            self._streams -= 1
+
+    def listen(self):
+        """Subscribe to the shared channel once per process (after fork, on first use)."""
+        with self._condition:
+            if self._subscribed:
+                return
+            self._subscribed = True
+        backend = cache.get_cache()
+        backend.subscribe(CHANNEL, self.append)
+        # Every event after this id reaches the buffer; earlier ones may not have
+        horizon = backend.get(SEQUENCE_KEY) or 0
+        with self._condition:
+            self._horizon = horizon
+
+
+bus = EventBus()
+
+
+def publish(event_type, data):
+    """Announce a complaint change to every worker's streams; errors are logged, not raised."""
+    try:
+        backend = cache.get_cache()
+        event = {'id': backend.incr(SEQUENCE_KEY), 'type': event_type, 'data': data}
+        backend.publish(CHANNEL, event)
+    except Exception:
+        logger.exception("Could not publish %s event", event_type)
+
+
+def latest_id():
+    """Id of the newest published event (0 before the first), or None if the cache cannot say."""
+    try:
+        return cache.get_cache().get(SEQUENCE_KEY) or 0
+    except Exception:
+        return None
+
+
+def format_event(event):
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'], default=str)}\n\n"
+
+
+def stream(last_event_id=None):
+    """SSE text for one client, from after last_event_id until MAX_SECONDS have passed."""
+    deadline = time.monotonic() + MAX_SECONDS
+    position, lost = bus.cursor(last_event_id, latest_id())
+    yield f'retry: {RETRY_MS}\n\n'
+    if lost:
+        yield 'event: resync\ndata: {}\n\n'
+    while time.monotonic() < deadline:
+        events, position = bus.wait(position, min(HEARTBEAT_SECONDS, max(deadline - time.monotonic(), 0)))
+        if events is None:
+            # This client fell more than BUFFER_SIZE events behind
+            yield 'event: resync\ndata: {}\n\n'
+        elif events:
+            yield ''.join(format_event(event) for event in events)
+        else:
+            # Comment line: keeps proxies from timing out and detects closed connections
+            yield ': keepalive\n\n'
@@ -0,0 +1,92 @@
+"""
+FixMyHyd Geo Helpers
+Distance math and the spatial index on complaints.gps_lat / gps_lng.
+
+SQLite: an R*Tree virtual table (complaints_geo) kept in sync by triggers.
+PostgreSQL: a GiST index on point(gps_lng, gps_lat), searched with the
+built-in box containment operator (no PostGIS needed).
+
+Both give a bounding-box pre-filter; callers refine with haversine_m() when
+they need an exact radius.
+"""
+
+import math
+
+EARTH_RADIUS_M = 6371008.8
+
+SQLITE_SPATIAL_SCHEMA = [
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS complaints_geo USING rtree(
+        id, min_lat, max_lat, min_lng, max_lng
+    )''',
+    '''CREATE TRIGGER IF NOT EXISTS complaints_geo_insert AFTER INSERT ON complaints
+       WHEN NEW.gps_lat IS NOT NULL AND NEW.gps_lng IS NOT NULL
+       BEGIN
+           INSERT INTO complaints_geo VALUES (NEW.id, NEW.gps_lat, NEW.gps_lat, NEW.gps_lng, NEW.gps_lng);
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS complaints_geo_update AFTER UPDATE OF gps_lat, gps_lng ON complaints
+       BEGIN
+           DELETE FROM complaints_geo WHERE id = OLD.id;
+           INSERT INTO complaints_geo
+               SELECT NEW.id, NEW.gps_lat, NEW.gps_lat, NEW.gps_lng, NEW.gps_lng
+               WHERE NEW.gps_lat IS NOT NULL AND NEW.gps_lng IS NOT NULL;
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS complaints_geo_delete AFTER DELETE ON complaints
+       BEGIN
+           DELETE FROM complaints_geo WHERE id = OLD.id;
+       END''',
+    # Backfill rows created before the index existed
+    '''INSERT INTO complaints_geo
+           SELECT id, gps_lat, gps_lat, gps_lng, gps_lng FROM complaints
+           WHERE gps_lat IS NOT NULL AND gps_lng IS NOT NULL
+             AND id NOT IN (SELECT id FROM complaints_geo)''',
+]
+
+POSTGRES_SPATIAL_SCHEMA = [
+    '''CREATE INDEX IF NOT EXISTS idx_complaints_geo ON complaints
+       USING gist (point(gps_lng::float8, gps_lat::float8))''',
+]
+
+
+def bbox_filter(postgres):
+    """(join, where) SQL fragments restricting `complaints c` to a bounding box.
+
+    Uses ? placeholders (execute_query converts them for PostgreSQL); pass
+    bbox_params() for the values.
+    """
+    if postgres:
+        return '', 'point(c.gps_lng::float8, c.gps_lat::float8) <@ box(point(?, ?), point(?, ?))'
+    return ('JOIN complaints_geo g ON g.id = c.id',
+            'g.max_lat >= ? AND g.min_lat <= ? AND g.max_lng >= ? AND g.min_lng <= ?')
+
+
+def bbox_params(postgres, min_lat, max_lat, min_lng, max_lng):
+    if postgres:
+        return [min_lng, min_lat, max_lng, max_lat]
+    return [min_lat, max_lat, min_lng, max_lng]
+
+
+def distance_order(lat, lng):
+    """(SQL expression, ? parameters) that sorts `complaints c` by distance from lat/lng.
+
+    An equirectangular approximation: the index cannot answer it, but over the
+    bounding box of a city-sized radius it ranks points as haversine_m() does.
+    """
+    scale = math.cos(math.radians(lat)) ** 2
+    return ('(c.gps_lat - ?) * (c.gps_lat - ?) + (c.gps_lng - ?) * (c.gps_lng - ?) * ?',
+            [lat, lat, lng, lng, scale])
+
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    """Great-circle distance in metres."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+def radius_bbox(lat, lng, radius_m):
+    """(min_lat, max_lat, min_lng, max_lng) enclosing a circle."""
+    dlat = math.degrees(radius_m / EARTH_RADIUS_M)
+    dlng = math.degrees(radius_m / (EARTH_RADIUS_M * max(math.cos(math.radians(lat)), 1e-6)))
+    return lat - dlat, lat + dlat, lng - dlng, lng + dlng
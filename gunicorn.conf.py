@@ -0,0 +1,116 @@
+"""
+FixMyHyd Gunicorn Configuration
+Production server profile for a bimodal workload: millisecond dashboard reads
+next to 10-60s AI submissions that mostly wait on Gemini and Nominatim.
+
+    gunicorn -c gunicorn.conf.py "app:create_app()"
+
+Worker model: threaded (gthread) workers by default, so a worker blocked on a
+slow AI call still serves fast pages from its other threads. Inside each worker
+AI submissions may use at most AI_MAX_CONCURRENCY threads (see app.py), which
+keeps the remaining threads free for dashboards.
+
+GUNICORN_ROLE selects a profile:
+    all  one pool serving every route (default, fits a single Render service)
+    web  fast pages only: short timeout, fewer threads per worker
+    ai   AI submissions only: long timeout, many threads per worker
+Run a `web` and an `ai` instance behind a proxy that sends /api/report-issue
+to the `ai` pool to isolate the two completely.
+
+Environment overrides: WEB_CONCURRENCY (workers), GUNICORN_THREADS,
+GUNICORN_WORKER_CLASS (gthread, gevent, sync), GUNICORN_TIMEOUT,
+WORKER_MEMORY_MB (expected RSS per worker used to cap the worker count).
+"""
+
+import os
+import multiprocessing
+
+ROLE = os.getenv('GUNICORN_ROLE', 'all')
+
+_PROFILES = {
+    #        threads  timeout  ai_max_concurrency
+    'all': (8, 120, 4),
+    'web': (4, 30, 1),
+    'ai': (32, 120, 32),
+}
+_threads, _timeout, _ai_concurrency = _PROFILES.get(ROLE, _PROFILES['all'])
+
+
+def _memory_limit_mb():
+    """Container memory limit (cgroup v2/v1) or physical memory, in MB."""
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+            if value != 'max' and int(value) < 1 << 60:
+                return int(value) // (1024 * 1024)
+        except (OSError, ValueError):
+            continue
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemTotal:'):
+                    return int(line.split()[1]) // 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def default_workers():
+    """2 x CPU + 1, capped so the workers fit in the available memory."""
+    cpu_bound = multiprocessing.cpu_count() * 2 + 1
+    memory_mb = _memory_limit_mb()
+    if memory_mb is None:
+        return cpu_bound
+    # Keep ~25% headroom for the master, page cache and request spikes
+    per_worker = int(os.getenv('WORKER_MEMORY_MB', '150'))
+    memory_bound = max(1, int(memory_mb * 0.75) // per_worker)
+    return max(1, min(cpu_bound, memory_bound))
+
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5001')}"
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.getenv('WEB_CONCURRENCY', default_workers()))
+threads = int(os.getenv('GUNICORN_THREADS', _threads))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', _timeout))
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers periodically to bound slow memory growth from the AI SDKs
+max_requests = 1000
+max_requests_jitter = 100
+
+# Import the app once in the master; workers fork with the code already loaded.
+# app.py does no I/O at import time, so nothing unsafe is shared across the fork.
+preload_app = True
+
+# Shared state for multi-worker metrics aggregation
+raw_env = [
+    f"METRICS_MULTIPROC_DIR={os.getenv('METRICS_MULTIPROC_DIR', '/tmp/fixmyhyd-metrics')}",
+    f"AI_MAX_CONCURRENCY={os.getenv('AI_MAX_CONCURRENCY', _ai_concurrency)}",
+    f"DB_POOL_MAX={os.getenv('DB_POOL_MAX', threads)}",
+    # Live dashboard streams each hold a thread; leave most of them for page requests
+    f"EVENTS_MAX_STREAMS={os.getenv('EVENTS_MAX_STREAMS', max(1, threads // 4))}",
+]
+
+accesslog = None
+errorlog = '-'
+loglevel = os.getenv('LOG_LEVEL', 'info').lower()
+
+
+def on_starting(server):
+    import metrics
+    metrics.clear_multiproc_dir()
+
+
+def post_fork(server, worker):
+    # Per-process resources (DB pool, log listener thread, metric samples) are
+    # created fresh in each worker rather than inherited from the master.
+    import app
+    app.reset_after_fork()
+
+
+def worker_exit(server, worker):
+    import ids
+    import metrics
+    metrics.flush()
+    ids.release()
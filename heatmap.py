@@ -0,0 +1,161 @@
+"""
+FixMyHyd Heatmap Tiles
+Complaint density binned into slippy-map (z/x/y Web Mercator) tiles.
+
+complaint_tiles holds one count per (zoom, x, y, category, status, day) for
+each zoom in TILE_ZOOMS. Triggers on complaints keep it current: an insert
+adds one, a delete removes one, and a change of status, category, location
+or date moves the count from the old key to the new one. A heatmap request
+therefore sums a few pre-aggregated rows instead of scanning complaints.
+
+A request for a zoom that is not stored is answered from the next finer
+stored zoom, shifting its tile coordinates down (x >> shift) to merge tiles.
+"""
+
+import math
+
+TILE_ZOOMS = (5, 8, 11, 14, 17)
+MAX_ZOOM = TILE_ZOOMS[-1]
+MAX_LATITUDE = 85.05112878  # Web Mercator cut-off
+
+_KEY_COLUMNS = 'zoom, x, y, category, status, day'
+
+
+def _tile_expressions(ref, zoom, postgres):
+    """SQL for the tile x and y of ref's (a row alias or NEW/OLD) location at zoom."""
+    n = 1 << zoom
+    least, greatest = ('LEAST', 'GREATEST') if postgres else ('MIN', 'MAX')
+    lat, lng = (f'{ref}.gps_lat::float8', f'{ref}.gps_lng::float8') if postgres else (f'{ref}.gps_lat', f'{ref}.gps_lng')
+    lat = f'radians({greatest}({least}({lat}, {MAX_LATITUDE}), -{MAX_LATITUDE}))'
+    x = f'{least}(CAST(floor(({lng} + 180.0) / 360.0 * {n}) AS INTEGER), {n - 1})'
+    y = f'{least}(CAST(floor((1.0 - ln(tan({lat}) + 1.0 / cos({lat})) / pi()) / 2.0 * {n}) AS INTEGER), {n - 1})'
+    return x, y
+
+
+def _day(ref, postgres):
+    return f'CAST({ref}.created_at AS date)' if postgres else f'date({ref}.created_at)'
+
+
+def _increment(ref, zoom, postgres):
+    x, y = _tile_expressions(ref, zoom, postgres)
+    return f'''INSERT INTO complaint_tiles ({_KEY_COLUMNS}, count)
+               SELECT {zoom}, {x}, {y}, {ref}.category, {ref}.status, {_day(ref, postgres)}, 1
+               WHERE {ref}.gps_lat IS NOT NULL AND {ref}.gps_lng IS NOT NULL AND {ref}.status IS NOT NULL
+               ON CONFLICT ({_KEY_COLUMNS}) DO UPDATE SET count = complaint_tiles.count + 1;'''
+
+
+def _decrement(ref, zoom, postgres):
+    x, y = _tile_expressions(ref, zoom, postgres)
+    key = (f'zoom = {zoom} AND x = {x} AND y = {y} AND category = {ref}.category '
+           f'AND status = {ref}.status AND day = {_day(ref, postgres)}')
+    return (f'UPDATE complaint_tiles SET count = count - 1 WHERE {key};\n'
+            f'DELETE FROM complaint_tiles WHERE {key} AND count <= 0;')
+
+
+def _backfill(zoom, postgres):
+    """Count complaints that existed before the table, once per zoom level."""
+    x, y = _tile_expressions('c', zoom, postgres)
+    return f'''INSERT INTO complaint_tiles ({_KEY_COLUMNS}, count)
+               SELECT {zoom}, {x}, {y}, c.category, c.status, {_day('c', postgres)}, COUNT(*)
+               FROM complaints c
+               WHERE c.gps_lat IS NOT NULL AND c.gps_lng IS NOT NULL AND c.status IS NOT NULL
+                 -- An empty id range once the level is populated, so restarts skip the table scan
+                 AND c.id <= (SELECT CASE WHEN EXISTS (SELECT 1 FROM complaint_tiles WHERE zoom = {zoom})
+                                          THEN 0 ELSE MAX(id) END FROM complaints)
+               GROUP BY 2, 3, 4, 5, 6
+               -- Workers starting together may both backfill; counts from the same rows, not added twice
+               ON CONFLICT ({_KEY_COLUMNS}) DO UPDATE SET count = excluded.count'''
+
+
+def _statements(ref, build, postgres):
+    return '\n'.join(build(ref, zoom, postgres) for zoom in TILE_ZOOMS)
+
+
+_TRACKED = ('gps_lat', 'gps_lng', 'category', 'status', 'created_at')
+
+SQLITE_HEATMAP_SCHEMA = [
+    f'''CREATE TABLE IF NOT EXISTS complaint_tiles (
+        zoom INTEGER NOT NULL,
+        x INTEGER NOT NULL,
+        y INTEGER NOT NULL,
+        category TEXT NOT NULL,
+        status TEXT NOT NULL,
+        day TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY ({_KEY_COLUMNS})
+    ) WITHOUT ROWID''',
+    *[_backfill(zoom, False) for zoom in TILE_ZOOMS],
+    f'''CREATE TRIGGER IF NOT EXISTS complaint_tiles_insert AFTER INSERT ON complaints
+       BEGIN
+           {_statements('NEW', _increment, False)}
+       END''',
+    f'''CREATE TRIGGER IF NOT EXISTS complaint_tiles_update AFTER UPDATE OF {', '.join(_TRACKED)} ON complaints
+       WHEN {' OR '.join(f'OLD.{c} IS NOT NEW.{c}' for c in _TRACKED)}
+       BEGIN
+           {_statements('OLD', _decrement, False)}
+           {_statements('NEW', _increment, False)}
+       END''',
+    f'''CREATE TRIGGER IF NOT EXISTS complaint_tiles_delete AFTER DELETE ON complaints
+       BEGIN
+           {_statements('OLD', _decrement, False)}
+       END''',
+]
+
+POSTGRES_HEATMAP_SCHEMA = [
+    f'''CREATE TABLE IF NOT EXISTS complaint_tiles (
+        zoom SMALLINT NOT NULL,
+        x INTEGER NOT NULL,
+        y INTEGER NOT NULL,
+        category VARCHAR(100) NOT NULL,
+        status VARCHAR(50) NOT NULL,
+        day DATE NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY ({_KEY_COLUMNS})
+    )''',
+    *[_backfill(zoom, True) for zoom in TILE_ZOOMS],
+    f'''CREATE OR REPLACE FUNCTION complaint_tiles_sync() RETURNS trigger AS $$
+       BEGIN
+           IF TG_OP IN ('UPDATE', 'DELETE') THEN
+               {_statements('OLD', _decrement, True)}
+           END IF;
+           IF TG_OP IN ('INSERT', 'UPDATE') THEN
+               {_statements('NEW', _increment, True)}
+           END IF;
+           RETURN NULL;
+       END
+       $$ LANGUAGE plpgsql''',
+    'DROP TRIGGER IF EXISTS complaint_tiles_sync ON complaints',
+    f'''CREATE TRIGGER complaint_tiles_sync
+       AFTER INSERT OR DELETE OR UPDATE OF {', '.join(_TRACKED)} ON complaints
+       FOR EACH ROW EXECUTE FUNCTION complaint_tiles_sync()''',
+]
+
+
+def storage_zoom(zoom):
+    """The stored zoom level that answers a request for zoom."""
+    return next(z for z in TILE_ZOOMS if z >= zoom)
+
+
+def tile_x(lng, zoom):
+    n = 1 << zoom
+    return min(int(math.floor((lng + 180.0) / 360.0 * n)), n - 1)
+
+
+def tile_y(lat, zoom):
+    n = 1 << zoom
+    lat = math.radians(max(min(lat, MAX_LATITUDE), -MAX_LATITUDE))
+    return min(int(math.floor((1.0 - math.log(math.tan(lat) + 1.0 / math.cos(lat)) / math.pi) / 2.0 * n)), n - 1)
+
+
+def tile_range(min_lat, max_lat, min_lng, max_lng, zoom):
+    """(min_x, max_x, min_y, max_y) of the tiles covering a bounding box; y grows southwards."""
+    return (tile_x(min_lng, zoom), tile_x(max_lng, zoom),
+            tile_y(max_lat, zoom), tile_y(min_lat, zoom))
+
+
+def tile_center(x, y, zoom):
+    """(lat, lng) of the centre of tile x/y."""
+    n = 1 << zoom
+    lng = (x + 0.5) / n * 360.0 - 180.0
+    lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 0.5) / n))))
+    return lat, lng
@@ -0,0 +1,160 @@
+"""
+FixMyHyd Idempotent Submissions
+Stops retried report submissions from re-running the AI pipeline.
+
+A submission's key is the client's Idempotency-Key header (or idempotency_key
+form field) when sent, otherwise the user id plus a hash of the image, which
+catches a citizen re-sending the same photo within IDEMPOTENCY_WINDOW seconds.
+Keys live in the shared cache, so a retry that lands on another worker is
+recognised as well:
+
+    NEW        first time: the caller runs the pipeline, then complete() or abandon()
+    DONE       already processed: replay the stored acknowledgement
+    IN_FLIGHT  still processing elsewhere after waiting for it (WAIT_TIMEOUT,
+               or ASYNC_WAIT_TIMEOUT on the ASGI server); answer 409 + Retry-After
+
+claim() / claim_async() resolve a key to one of these states, joining an
+in-flight submission and taking over one whose first attempt failed.
+
+Only successful submissions are stored; a failed one can be retried in full.
+"""
+
+import os
+import time
+import asyncio
+import hashlib
+
+import cache
+import metrics
+from logging_config import get_logger
+
+logger = get_logger('idempotency')
+
+WINDOW = int(os.getenv('IDEMPOTENCY_WINDOW', '600'))
+CLIENT_KEY_TTL = int(os.getenv('IDEMPOTENCY_CLIENT_KEY_TTL', str(24 * 3600)))
+# How long a claim survives a worker that died mid-pipeline
+IN_FLIGHT_TTL = int(os.getenv('IDEMPOTENCY_IN_FLIGHT_TTL', '180'))
+# How long a retry waits for the in-flight original before answering 409. A waiting WSGI
+# request holds a worker thread, so keep it short there; a waiting coroutine costs nothing.
+WAIT_TIMEOUT = float(os.getenv('IDEMPOTENCY_WAIT_TIMEOUT', '3'))
+ASYNC_WAIT_TIMEOUT = float(os.getenv('IDEMPOTENCY_ASYNC_WAIT_TIMEOUT', '90'))
+POLL_INTERVAL = 0.5
+
+NEW, DONE, IN_FLIGHT = 'new', 'done', 'in_flight'
+
+REPLAY_HEADER = 'Idempotent-Replayed'
+
+
+def image_digest(stream):
+    """sha256 of an uploaded file stream, leaving the stream rewound for the pipeline."""
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(65536), b''):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+def submission_key(user_id, client_key=None, image_sha256=None):
+    if client_key:
+        return f"idem:{user_id}:client:{hashlib.sha256(client_key.encode()).hexdigest()}"
+    return f"idem:{user_id}:image:{image_sha256}"
+
+
+def _ttl(key):
+    return CLIENT_KEY_TTL if ':client:' in key else WINDOW
+
+
+def begin(key):
+    """Claim key for this request; returns (state, acknowledgement or None)."""
+    store = cache.get_cache()
+    try:
+        ack = store.get(key + ':ack')
+        if ack is not None:
+            metrics.IDEMPOTENT_REPLAYS.inc(result='replayed')
+            return DONE, ack
+        if store.incr(key + ':claim', ttl=IN_FLIGHT_TTL) == 1:
+            return NEW, None
+    except Exception:
+        # Without the cache we cannot deduplicate; process the request normally
+        logger.exception("Idempotency check failed for %s", key)
+        return NEW, None
+    return IN_FLIGHT, None
+
+
+def complete(key, ack):
+    store = cache.get_cache()
+    try:
+        store.set(key + ':ack', ack, _ttl(key))
+        store.delete(key + ':claim')
+    except Exception:
+        logger.exception("Could not store acknowledgement for %s", key)
+
+
+def abandon(key):
+    """Release the claim after a failed submission so that a retry runs the pipeline."""
+    try:
+        cache.get_cache().delete(key + ':claim')
+    except Exception:
+        logger.exception("Could not release idempotency claim %s", key)
+
+
+def _poll(key):
+    store = cache.get_cache()
+    ack = store.get(key + ':ack')
+    if ack is not None:
+        return DONE, ack
+    if store.get(key + ':claim') is None:
+        # The original request failed and released its claim
+        return NEW, None
+    return IN_FLIGHT, None
+
+
+def wait(key, timeout=None):
+    """Block (at most WAIT_TIMEOUT) until the in-flight submission finishes; returns its acknowledgement or None."""
+    deadline = time.monotonic() + (WAIT_TIMEOUT if timeout is None else timeout)
+    while time.monotonic() < deadline:
+        state, ack = _poll(key)
+        if state != IN_FLIGHT:
+            metrics.IDEMPOTENT_REPLAYS.inc(result='joined' if ack else 'original_failed')
+            return ack
+        time.sleep(POLL_INTERVAL)
+    metrics.IDEMPOTENT_REPLAYS.inc(result='wait_timeout')
+    return None
+
+
+async def wait_async(key, timeout=None):
+    """wait() for the asyncio server, where waiting holds no thread (ASYNC_WAIT_TIMEOUT)."""
+    deadline = time.monotonic() + (ASYNC_WAIT_TIMEOUT if timeout is None else timeout)
+    while time.monotonic() < deadline:
+        state, ack = _poll(key)
+        if state != IN_FLIGHT:
+            metrics.IDEMPOTENT_REPLAYS.inc(result='joined' if ack else 'original_failed')
+            return ack
+        await asyncio.sleep(POLL_INTERVAL)
+    metrics.IDEMPOTENT_REPLAYS.inc(result='wait_timeout')
+    return None
+
+
+def claim(key):
+    """begin(), joining an in-flight submission; returns (state, acknowledgement or None)."""
+    state, ack = begin(key)
+    if state != IN_FLIGHT:
+        return state, ack
+    logger.info("Duplicate submission while the first is processing; waiting for it")
+    ack = wait(key)
+    if ack is not None:
+        return DONE, ack
+    # The first attempt failed (take it over) or is still running
+    return begin(key)
+
+
+async def claim_async(key):
+    """claim() for the asyncio server."""
+    state, ack = begin(key)
+    if state != IN_FLIGHT:
+        return state, ack
+    logger.info("Duplicate submission while the first is processing; waiting for it")
+    ack = await wait_async(key)
+    if ack is not None:
+        return DONE, ack
+    return begin(key)
@@ -0,0 +1,217 @@
+"""
+FixMyHyd ID Generation
+Time-ordered, collision-free complaint IDs generated without a database round trip.
+
+Each ID packs (most significant first):
+    41 bits  milliseconds since ID_EPOCH_MS (good for ~69 years)
+     5 bits  node id        (ID_NODE_ID, one per host/container, or leased with the slot)
+     5 bits  process slot   (leased from the shared cache, unique among live workers on a node)
+    12 bits  sequence       (4096 IDs per millisecond per process)
+
+IDs from one process are strictly increasing, and IDs from different processes
+are ordered by time to the millisecond, so inserts land at the right-hand edge
+of the ghmc_id index. They are rendered as 13 Crockford base32 characters,
+which sort in the same order as the integers.
+
+Process slots are leases in the shared cache (ID_SLOT_LEASE_SECONDS), renewed
+by a heartbeat thread and released when the worker exits, so a recycled
+worker reuses a freed slot instead of wrapping onto a live one. Without
+ID_NODE_ID the node id is leased too, from the same (node, slot) pairs, so
+hosts sharing one cache (redis://) never pick the same pair; hosts with
+separate caches must each set a distinct ID_NODE_ID. Without a shared cache
+no IDs are issued at all; as a last line of defence
+save_complaint() retries with a fresh ID if one is ever already taken.
+"""
+
+import os
+import time
+import atexit
+import socket
+import secrets
+import threading
+
+from logging_config import get_logger
+
+logger = get_logger('ids')
+
+ID_EPOCH_MS = 1704067200000  # 2024-01-01T00:00:00Z
+
+NODE_BITS = 5
+SLOT_BITS = 5
+SEQUENCE_BITS = 12
+
+MAX_NODE = (1 << NODE_BITS) - 1
+MAX_SLOT = (1 << SLOT_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+# A worker that dies without releasing its slot frees it after this long
+SLOT_LEASE_SECONDS = int(os.getenv('ID_SLOT_LEASE_SECONDS', '60'))
+
+_ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+ENCODED_LENGTH = 13
+
+
+def _node_id():
+    """ID_NODE_ID, or None to lease the node id from the shared cache along with the slot."""
+    value = os.getenv('ID_NODE_ID')
+    if value is None:
+        # A hash of the hostname would collide between hosts one time in 32
+        return None
+    node_id = int(value)
+    if not 0 <= node_id <= MAX_NODE:
+        raise ValueError(f"ID_NODE_ID must be between 0 and {MAX_NODE}, got {node_id}")
+    return node_id
+
+
+def _slot_key(node_id, slot):
+    return f'ids:slot:{node_id}:{slot}'
+
+
+def _claim_process_slot(node_id, token):
+    """Lease a free (node id, process slot) pair in the shared cache, on node_id or, when it is
+    None, on any node; raises RuntimeError when none can be leased.
+
+    There is no pid fallback: a slot that is not leased in a cache every worker sees can
+    collide, and colliding slots mean duplicate IDs.
+    """
+    import cache
+    backend = cache.get_cache()
+    if not backend.shared:
+        raise RuntimeError("Complaint IDs need a shared cache (CACHE_URL sqlite:// or redis://) to lease process slots")
+    # Start from a rotating offset so workers do not all probe slot 0 first
+    start = backend.incr('ids:process-slot')
+    mask = MAX_SLOT if node_id is not None else (MAX_NODE << SLOT_BITS) | MAX_SLOT
+    for i in range(mask + 1):
+        worker = (start + i) & mask
+        node, slot = (node_id, worker) if node_id is not None else divmod(worker, MAX_SLOT + 1)
+        if backend.add(_slot_key(node, slot), token, SLOT_LEASE_SECONDS):
+            return node, slot
+    if node_id is None:
+        raise RuntimeError(f"All {mask + 1} ID node/process slot pairs are leased")
+    raise RuntimeError(f"All {MAX_SLOT + 1} ID process slots of node {node_id} are leased")
+
+
+class IdGenerator:
+    """Snowflake-style 63-bit ID generator; thread-safe."""
+
+    def __init__(self, node_id, slot):
+        self._lock = threading.Lock()
+        self._last_ms = -1
+        self._sequence = 0
+        self.set_slot(node_id, slot)
+
+    def set_slot(self, node_id, slot):
+        with self._lock:
+            self.node_id = node_id & MAX_NODE
+            self.slot = slot & MAX_SLOT
+            self.worker = (self.node_id << SLOT_BITS) | self.slot
+
+    def next_int(self):
+        with self._lock:
+            now_ms = int(time.time() * 1000) - ID_EPOCH_MS
+            if now_ms > self._last_ms:
+                self._last_ms = now_ms
+                self._sequence = 0
+            else:
+                # Same millisecond, or the clock stepped back: keep counting from
+                # the last timestamp so IDs never repeat or go backwards
+                self._sequence = (self._sequence + 1) & MAX_SEQUENCE
+                if self._sequence == 0:
+                    self._last_ms += 1
+            return (self._last_ms << (NODE_BITS + SLOT_BITS + SEQUENCE_BITS)) \
+                | (self.worker << SEQUENCE_BITS) | self._sequence
+
+
+def encode(value):
+    """Fixed-width Crockford base32, so string order matches numeric order."""
+    chars = []
+    for _ in range(ENCODED_LENGTH):
+        value, digit = divmod(value, 32)
+        chars.append(_ALPHABET[digit])
+    return ''.join(reversed(chars))
+
+
+def decode(text):
+    value = 0
+    for char in text.upper():
+        value = value * 32 + _ALPHABET.index(char)
+    return value
+
+
+def timestamp_of(value):
+    """Creation time (Unix seconds) encoded in an ID."""
+    if isinstance(value, str):
+        value = decode(value.rsplit('/', 1)[-1])
+    return ((value >> (NODE_BITS + SLOT_BITS + SEQUENCE_BITS)) + ID_EPOCH_MS) / 1000
+
+
+class _SlotLease:
+    """This process's slot lease: renewed by a heartbeat thread, re-claimed if lost, released at exit."""
+
+    def __init__(self, node_id):
+        self.node_id = node_id
+        self.token = f'{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}'
+        self.generator = IdGenerator(*_claim_process_slot(node_id, self.token))
+        self._stop = threading.Event()
+        self._pid = os.getpid()
+        threading.Thread(target=self._heartbeat, name='fixmyhyd-id-slot', daemon=True).start()
+        atexit.register(self.release)
+
+    def _key(self):
+        return _slot_key(self.generator.node_id, self.generator.slot)
+
+    def _heartbeat(self):
+        import cache
+        while not self._stop.wait(SLOT_LEASE_SECONDS / 3) and os.getpid() == self._pid:
+            try:
+                backend = cache.get_cache()
+                if backend.get(self._key()) == self.token:
+                    backend.set(self._key(), self.token, SLOT_LEASE_SECONDS)
+                    continue
+                # Expired while the cache was unreachable, and possibly taken since
+                logger.error("Lost ID process slot %d; claiming another", self.generator.slot)
+                self.generator.set_slot(*_claim_process_slot(self.node_id, self.token))
+            except Exception:
+                logger.exception("Could not renew the ID process slot lease")
+
+    def release(self):
+        self._stop.set()
+        if os.getpid() != self._pid:
+            return
+        try:
+            import cache
+            backend = cache.get_cache()
+            if backend.get(self._key()) == self.token:
+                backend.delete(self._key())
+        except Exception:
+            logger.warning("Could not release ID process slot %d", self.generator.slot)
+
+
+_lease = None
+_lease_lock = threading.Lock()
+
+
+def _get_generator():
+    global _lease
+    if _lease is None:
+        with _lease_lock:
+            if _lease is None:
+                _lease = _SlotLease(_node_id())
+    return _lease.generator
+
+
+def new_complaint_id():
+    """Public complaint reference, e.g. GHMC/HYD/0E3M9K5T80G01"""
+    return f"GHMC/HYD/{encode(_get_generator().next_int())}"
+
+
+def release():
+    """Give this process's slot back (gunicorn worker_exit; also registered with atexit)."""
+    if _lease is not None:
+        _lease.release()
+
+
+def reset_after_fork():
+    # Each worker must lease its own process slot; the master's lease (if any) stays the master's
+    global _lease
+    _lease = None
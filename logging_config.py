@@ -0,0 +1,157 @@
+"""
+FixMyHyd Logging
+Leveled, JSON-structured logging with a non-blocking queue handler.
+
+Application code logs through get_logger(). Records are put on an in-memory
+queue and written to stdout by a single background listener thread, so request
+threads never block on stdout. Use %-style arguments (logger.debug("x=%s", x))
+so disabled debug lines cost only a level check.
+
+Environment:
+    LOG_LEVEL               DEBUG/INFO/WARNING/ERROR (default INFO)
+    LOG_FORMAT              json or text (default json)
+    LOG_DEBUG_SAMPLE_RATE   fraction of DEBUG records kept, 0.0-1.0 (default 1.0)
+    LOG_QUEUE_SIZE          max queued records before new ones are dropped (default 10000)
+"""
+
+import os
+import sys
+import json
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+import threading
+from datetime import datetime, timezone
+
+ROOT_LOGGER_NAME = 'fixmyhyd'
+
+# Attributes every LogRecord has; anything else was passed via `extra=` and is emitted as a field
+_STANDARD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'sample_rate'}
+
+_lock = threading.Lock()
+_listener = None
+_queue_handler = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg plus any `extra` fields."""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'pid': record.process,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of DEBUG records.
+
+    A call site can override the global rate with extra={'sample_rate': 0.01}
+    for especially chatty lines. INFO and above are never sampled.
+    """
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        rate = getattr(record, 'sample_rate', self.rate)
+        return rate >= 1.0 or random.random() < rate
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full."""
+
+    dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DroppingQueueHandler.dropped += 1
+
+    def prepare(self, record):
+        # JSON formatting happens in the listener thread; only resolve the message
+        # and exception text here so the record no longer references caller state.
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _new_queue():
+    return queue.Queue(maxsize=int(os.getenv('LOG_QUEUE_SIZE', '10000')))
+
+
+def _build_stream_handler():
+    handler = logging.StreamHandler(sys.stdout)
+    if os.getenv('LOG_FORMAT', 'json').lower() == 'text':
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s [%(name)s] %(message)s'))
+    else:
+        handler.setFormatter(JsonFormatter())
+    return handler
+
+
+def configure_logging(level=None):
+    """Install the queue handler on the 'fixmyhyd' logger (safe to call repeatedly)."""
+    global _listener, _queue_handler
+    with _lock:
+        root = logging.getLogger(ROOT_LOGGER_NAME)
+        root.setLevel((level or os.getenv('LOG_LEVEL', 'INFO')).upper())
+        root.propagate = False
+        if _queue_handler is not None:
+            return root
+
+        log_queue = _new_queue()
+        _queue_handler = DroppingQueueHandler(log_queue)
+        _queue_handler.addFilter(SamplingFilter(float(os.getenv('LOG_DEBUG_SAMPLE_RATE', '1.0'))))
+        root.addHandler(_queue_handler)
+
+        _listener = logging.handlers.QueueListener(log_queue, _build_stream_handler(), respect_handler_level=True)
+        _listener.start()
+        return root
+
+
+def reset_after_fork():
+    """Restart the listener thread in a forked worker (threads do not survive fork)."""
+    global _listener
+    with _lock:
+        if _queue_handler is None:
+            return
+        # The parent's queue may have been mid-operation at fork time; start clean
+        _queue_handler.queue = _new_queue()
+        _listener = logging.handlers.QueueListener(_queue_handler.queue, _build_stream_handler(), respect_handler_level=True)
+        _listener.start()
+
+
+def shutdown():
+    """Flush queued records and stop the listener thread."""
+    with _lock:
+        if _listener is not None and _listener._thread is not None:
+            _listener.stop()
+
+
+def get_logger(name):
+    """Return a child of the 'fixmyhyd' logger, configuring logging on first use."""
+    configure_logging()
+    return logging.getLogger(f"{ROOT_LOGGER_NAME}.{name}")
+
+
+atexit.register(shutdown)
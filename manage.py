@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+FixMyHyd Management Commands
+One-off setup and maintenance tasks that must not run at import time.
+
+Usage:
+    python manage.py init-db          Create tables and the default admin (deploy/release step)
+    python manage.py check-keys       Report which Google API keys are configured
+    python manage.py startup-time     Measure cold import time of app.py against the budget
+    python manage.py db-maintenance   Checkpoint the SQLite WAL and run ANALYZE
+    python manage.py build-assets     Fingerprint, minify and precompress static CSS/JS (build step)
+    python manage.py compression-bench [FILE]  Compare gzip/brotli levels on complaint JSON or FILE
+    python manage.py test             Run the application test suite
+"""
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+# Cold-start budget for `import app; app.create_app()` in a fresh interpreter
+COLD_START_BUDGET_MS = int(os.getenv('COLD_START_BUDGET_MS', '1000'))
+
+# SDKs that must only be imported on first use, never at startup
+LAZY_MODULES = ['google.generativeai', 'PIL', 'geopy']
+
+_COLD_START_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import app
+app.create_app()
+elapsed_ms = (time.perf_counter() - start) * 1000
+print(json.dumps({
+    'elapsed_ms': elapsed_ms,
+    'eager_modules': [m for m in %r if m in sys.modules],
+}))
+"""
+
+
+def measure_cold_start():
+    """Import app.py in a fresh interpreter; returns {'elapsed_ms', 'eager_modules'}"""
+    env = dict(os.environ, LOG_LEVEL='ERROR')
+    output = subprocess.check_output(
+        [sys.executable, '-c', _COLD_START_PROBE % (LAZY_MODULES,)],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env, text=True)
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def cmd_init_db(args):
+    from app import init_database
+    init_database()
+    print("Database initialized successfully")
+    return 0
+
+
+def cmd_check_keys(args):
+    from app import check_api_keys
+    return 0 if check_api_keys() else 1
+
+
+def cmd_startup_time(args):
+    result = measure_cold_start()
+    print(f"Cold start: {result['elapsed_ms']:.0f} ms (budget {COLD_START_BUDGET_MS} ms)")
+    if result['eager_modules']:
+        print(f"Heavy modules imported at startup: {', '.join(result['eager_modules'])}")
+    ok = result['elapsed_ms'] <= COLD_START_BUDGET_MS and not result['eager_modules']
+    print("Within budget" if ok else "Over budget")
+    return 0 if ok else 1
+
+
+def cmd_db_maintenance(args):
+    import app
+    if os.getenv('DATABASE_URL', '').startswith('postgres'):
+        print("DATABASE_URL points at PostgreSQL; autovacuum handles checkpoints and statistics there")
+        return 0
+    result = app.sqlite_maintenance(app.sqlite_database_path())
+    print(f"Checkpointed {result['checkpointed']}/{result['wal_pages']} WAL pages, statistics refreshed")
+    return 0
+
+
+def cmd_build_assets(args):
+    import assets
+    manifest = assets.build()
+    for source, target in sorted(manifest.items()):
+        print(f"{source} -> {target}")
+    print(f"Built {len(manifest)} asset(s) into {assets.BUILD_DIR}")
+    return 0
+
+
+BENCH_LEVELS = {'gzip': (1, 6, 9), 'br': (1, 4, 5, 8, 11)}
+
+
+def cmd_compression_bench(args):
+    import time
+    import compression
+    if args.file:
+        with open(args.file, 'rb') as f:
+            payload = f.read()
+        source = args.file
+    else:
+        import app
+        conn = app.get_db_connection()
+        try:
+            rows = conn.execute('SELECT * FROM complaints ORDER BY id DESC LIMIT 500').fetchall()
+        finally:
+            conn.close()
+        payload = app.app.json.dumps([dict(row) for row in rows]).encode()
+        source = f"{len(rows)} complaints as JSON"
+    print(f"{source}: {len(payload)} bytes")
+    for encoding in compression.available_encodings():
+        for level in BENCH_LEVELS[encoding]:
+            runs, start = 0, time.perf_counter()
+            while runs < 3 or time.perf_counter() - start < 0.5:
+                compressor = compression.compressor(encoding, level)
+                output = compressor.compress(payload) + compressor.finish()
+                runs += 1
+            ms = (time.perf_counter() - start) * 1000 / runs
+            print(f"  {encoding:<4} level {level:>2}: {len(output):>8} bytes "
+                  f"({len(output) / max(len(payload), 1):.1%}), {ms:7.2f} ms, "
+                  f"{len(payload) / 1e6 / max(ms / 1000, 1e-9):6.1f} MB/s")
+    return 0
+
+
+def cmd_test(args):
+    import test_app
+    return 0 if test_app.main() else 1
+
+
+COMMANDS = {
+    'init-db': (cmd_init_db, 'Create tables and the default admin user'),
+    'check-keys': (cmd_check_keys, 'Report which Google API keys are configured'),
+    'startup-time': (cmd_startup_time, 'Measure cold import time against COLD_START_BUDGET_MS'),
+    'db-maintenance': (cmd_db_maintenance, 'Checkpoint the SQLite WAL and refresh planner statistics'),
+    'build-assets': (cmd_build_assets, 'Fingerprint, minify and precompress static CSS and JavaScript'),
+    'compression-bench': (cmd_compression_bench, 'Compare gzip/brotli levels by size and CPU time'),
+    'test': (cmd_test, 'Run the application test suite'),
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='FixMyHyd management commands')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for name, (func, help_text) in COMMANDS.items():
+        subparsers.add_parser(name, help=help_text).set_defaults(func=func)
+    subparsers.choices['compression-bench'].add_argument('file', nargs='?', help='Payload to compress')
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,169 @@
+"""
+FixMyHyd Media Store
+Complaint photos on disk, content-addressed by SHA-256.
+
+    <MEDIA_ROOT>/originals/ab/cd/abcd…           the uploaded bytes
+    <MEDIA_ROOT>/thumbs/<size>/ab/cd/abcd…       JPEG thumbnails, one per THUMBNAIL_SIZES entry
+
+save() writes a file once per distinct content (a re-sent photo costs no
+extra space) by renaming a temporary file into place, so readers never see a
+partial file and concurrent writers of the same photo cannot clash. The
+complaint row keeps only the digest (complaints.image_sha256).
+
+Thumbnails are made in a small background thread pool after the original is
+written; if one is missing when requested (a restart dropped the queue) it is
+made on the spot.
+
+Files are served without passing their bytes through Python: with
+MEDIA_ACCEL_PREFIX set, nginx serves them from an internal location named by
+X-Accel-Redirect; otherwise the WSGI server's file wrapper (sendfile under
+gunicorn) does, with Range and conditional requests handled by Werkzeug.
+"""
+
+import io
+import os
+import hashlib
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from logging_config import get_logger
+
+logger = get_logger('media')
+
+MEDIA_ROOT = os.getenv('MEDIA_ROOT', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'media'))
+# e.g. /protected-media/ for an nginx `internal` location aliased to MEDIA_ROOT
+ACCEL_PREFIX = os.getenv('MEDIA_ACCEL_PREFIX', '')
+THUMBNAIL_WORKERS = int(os.getenv('MEDIA_THUMBNAIL_WORKERS', '2'))
+
+# Read once at import, while single-threaded: os.umask() can only be read by setting it
+_UMASK = os.umask(0o022)
+os.umask(_UMASK)
+FILE_MODE = 0o644 & ~_UMASK
+
+ORIGINAL = 'original'
+THUMBNAIL_SIZES = {'small': 320, 'large': 1280}
+THUMBNAIL_QUALITY = 80
+
+# Leading bytes of the image formats phones produce
+_SIGNATURES = [
+    (0, b'\xff\xd8\xff', 'image/jpeg'),
+    (0, b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (0, b'GIF87a', 'image/gif'),
+    (0, b'GIF89a', 'image/gif'),
+    (8, b'WEBP', 'image/webp'),
+    (4, b'ftypheic', 'image/heic'),
+    (4, b'ftypmif1', 'image/heif'),
+]
+
+
+def sniff_image(head):
+    """MIME type of an image from its first bytes, or None if it is not a known image format."""
+    for offset, signature, mimetype in _SIGNATURES:
+        if head[offset:offset + len(signature)] == signature:
+            return mimetype
+    return None
+
+
+def _relative(digest, size=ORIGINAL):
+    shards = os.path.join(digest[:2], digest[2:4], digest)
+    if size == ORIGINAL:
+        return os.path.join('originals', shards)
+    return os.path.join('thumbs', size, shards)
+
+
+def path(digest, size=ORIGINAL):
+    return os.path.join(MEDIA_ROOT, _relative(digest, size))
+
+
+def accel_path(digest, size=ORIGINAL):
+    """X-Accel-Redirect target for nginx."""
+    return ACCEL_PREFIX.rstrip('/') + '/' + _relative(digest, size).replace(os.sep, '/')
+
+
+def _write_atomic(destination, data):
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(destination), prefix='.tmp-')
+    try:
+        # mkstemp makes the file 0600; nginx (another user) must be able to read it via X-Accel-Redirect
+        os.fchmod(fd, FILE_MODE)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, destination)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def save(data):
+    """Store image bytes; returns their hex SHA-256. Thumbnails follow in the background."""
+    digest = hashlib.sha256(data).hexdigest()
+    destination = path(digest)
+    if os.path.exists(destination):
+        logger.debug("Image %s already stored", digest)
+        return digest
+    _write_atomic(destination, data)
+    logger.info("Stored image %s (%d bytes)", digest, len(data), extra={'sha256': digest})
+    _executor().submit(make_thumbnails, digest)
+    return digest
+
+
+def make_thumbnail(digest, size):
+    """Write (or rewrite) one thumbnail; returns its path, or None if the original cannot be decoded."""
+    from PIL import Image, ImageOps
+    try:
+        with Image.open(path(digest)) as image:
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((THUMBNAIL_SIZES[size],) * 2)
+            output = io.BytesIO()
+            image.convert('RGB').save(output, 'JPEG', quality=THUMBNAIL_QUALITY, optimize=True, progressive=True)
+    except Exception:
+        logger.warning("Could not make %s thumbnail of image %s", size, digest)
+        return None
+    destination = path(digest, size)
+    _write_atomic(destination, output.getvalue())
+    return destination
+
+
+def make_thumbnails(digest):
+    for size in THUMBNAIL_SIZES:
+        if not os.path.exists(path(digest, size)):
+            make_thumbnail(digest, size)
+
+
+def locate(digest, size=ORIGINAL):
+    """(path, MIME type) of a stored image or thumbnail, making a missing thumbnail; None if unavailable."""
+    if size == ORIGINAL:
+        try:
+            with open(path(digest), 'rb') as f:
+                return path(digest), sniff_image(f.read(16)) or 'application/octet-stream'
+        except FileNotFoundError:
+            return None
+    if not os.path.exists(path(digest, size)) and (not os.path.exists(path(digest)) or
+                                                    make_thumbnail(digest, size) is None):
+        return None
+    return path(digest, size), 'image/jpeg'
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def _executor():
+    global _pool, _pool_pid
+    with _pool_lock:
+        # Threads do not survive fork; each worker makes its own pool
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS, thread_name_prefix='fixmyhyd-thumbnails')
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def wait_for_thumbnails():
+    """Block until queued thumbnails are written (for tests and shutdown)."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=True)
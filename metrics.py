@@ -0,0 +1,332 @@
+"""
+FixMyHyd Metrics
+Prometheus-style counters and histograms for request, pipeline, Gemini, DB and cache timings.
+
+Every process keeps its samples in memory. When METRICS_MULTIPROC_DIR is set
+(the gunicorn deployment sets it), each worker also writes a JSON snapshot of
+its samples into that directory so /metrics can sum them across all workers:
+from a background thread every METRICS_FLUSH_INTERVAL seconds, and at exit.
+"""
+
+import os
+import json
+import time
+import atexit
+import threading
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '5'))
+
+_KEY_SEP = '\x1f'
+_registry = {}
+_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_flusher_pid = None
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        _registry[name] = self
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+
+class Counter(_Metric):
+    """Monotonically increasing counter."""
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        _maybe_flush()
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    """Cumulative histogram with fixed upper bounds (seconds by convention)."""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, amount, **labels):
+        key = self._key(labels)
+        with _lock:
+            sample = self._values.get(key)
+            if sample is None:
+                # Per-bucket (non-cumulative) counts, then +Inf, sum and count
+                sample = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if amount <= bound:
+                    sample[0][i] += 1
+                    break
+            else:
+                sample[0][-1] += 1
+            sample[1] += amount
+            sample[2] += 1
+        _maybe_flush()
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        sample = self._values.get(self._key(labels))
+        return sample[2] if sample else 0
+
+
+# ==================== METRIC DEFINITIONS ====================
+
+HTTP_REQUEST_DURATION = Histogram(
+    'fixmyhyd_http_request_duration_seconds', 'HTTP request latency by route',
+    ('method', 'route', 'status'))
+PIPELINE_STAGE_DURATION = Histogram(
+    'fixmyhyd_pipeline_stage_duration_seconds', 'Report submission pipeline stage durations',
+    ('stage',))
+GEMINI_REQUESTS = Counter(
+    'fixmyhyd_gemini_requests_total', 'Gemini API calls by API and outcome',
+    ('api', 'outcome'))
+GEMINI_RETRIES = Counter(
+    'fixmyhyd_gemini_retries_total', 'Gemini API retries after quota errors', ('api',))
+GEMINI_RATE_LIMITED = Counter(
+    'fixmyhyd_gemini_rate_limited_total', 'Gemini API 429/quota responses', ('api',))
+DB_CONNECTIONS = Counter(
+    'fixmyhyd_db_connections_total', 'Database connections opened', ('backend',))
+DB_QUERY_DURATION = Histogram(
+    'fixmyhyd_db_query_duration_seconds', 'Database statement execution time',
+    ('backend',), buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+CACHE_REQUESTS = Counter(
+    'fixmyhyd_cache_requests_total', 'Cache lookups by cache and result (hit/miss)',
+    ('cache', 'result'))
+COMPRESSION_BYTES = Counter(
+    'fixmyhyd_compression_bytes_total', 'Response bytes before (in) and after (out) compression',
+    ('encoding', 'direction'))
+COMPRESSION_CPU = Counter(
+    'fixmyhyd_compression_cpu_seconds_total', 'CPU time spent compressing responses', ('encoding',))
+IDEMPOTENT_REPLAYS = Counter(
+    'fixmyhyd_idempotent_submissions_total',
+    'Retried report submissions answered without re-running the pipeline', ('result',))
+
+
+def stage_timer(stage):
+    """Time one stage of the report submission pipeline."""
+    return PIPELINE_STAGE_DURATION.time(stage=stage)
+
+
+def record_gemini_call(api, outcome):
+    GEMINI_REQUESTS.inc(api=api, outcome=outcome)
+
+
+def record_cache_lookup(cache, hit):
+    CACHE_REQUESTS.inc(cache=cache, result='hit' if hit else 'miss')
+
+
+def record_compression(encoding, bytes_in, bytes_out, cpu_seconds):
+    COMPRESSION_BYTES.inc(bytes_in, encoding=encoding, direction='in')
+    COMPRESSION_BYTES.inc(bytes_out, encoding=encoding, direction='out')
+    COMPRESSION_CPU.inc(cpu_seconds, encoding=encoding)
+
+
+# ==================== MULTI-PROCESS AGGREGATION ====================
+
+def _multiproc_dir():
+    return os.getenv('METRICS_MULTIPROC_DIR')
+
+
+def _snapshot():
+    with _lock:
+        return {
+            name: {_KEY_SEP.join(key): value for key, value in metric._values.items()}
+            for name, metric in _registry.items()
+        }
+
+
+def flush():
+    """Write this process's samples to METRICS_MULTIPROC_DIR (no-op when unset)."""
+    directory = _multiproc_dir()
+    if not directory:
+        return
+    # One writer at a time: they all share the same temporary file
+    with _flush_lock:
+        try:
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"metrics_{os.getpid()}.json")
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(_snapshot(), f)
+            os.replace(tmp_path, path)
+        except OSError:
+            # Metrics must never break request handling
+            pass
+
+
+def _flush_periodically():
+    pid = os.getpid()
+    while os.getpid() == pid:
+        time.sleep(FLUSH_INTERVAL)
+        flush()
+
+
+def _maybe_flush():
+    """Start this process's flusher thread on its first sample, so idle workers still publish their last ones."""
+    global _flusher_pid
+    if _flusher_pid == os.getpid() or not _multiproc_dir():
+        return
+    with _flush_lock:
+        if _flusher_pid != os.getpid():
+            _flusher_pid = os.getpid()
+            threading.Thread(target=_flush_periodically, name='fixmyhyd-metrics-flush', daemon=True).start()
+
+
+def clear_multiproc_dir():
+    """Remove snapshots left by a previous server run (call once in the master)."""
+    directory = _multiproc_dir()
+    if not directory or not os.path.isdir(directory):
+        return
+    for filename in os.listdir(directory):
+        if filename.startswith('metrics_'):
+            try:
+                os.remove(os.path.join(directory, filename))
+            except OSError:
+                pass
+
+
+def reset_after_fork():
+    """Drop samples inherited from the parent process so they are not counted twice."""
+    global _flush_lock
+    with _lock:
+        for metric in _registry.values():
+            metric._values.clear()
+    # The parent's flusher thread did not survive the fork, and may have held the lock
+    _flush_lock = threading.Lock()
+
+
+def _merge(target, name, key, value):
+    metric = _registry.get(name)
+    if metric is None:
+        return
+    values = target.setdefault(name, {})
+    if metric.kind == 'counter':
+        values[key] = values.get(key, 0) + value
+    else:
+        current = values.get(key)
+        if current is None:
+            values[key] = [list(value[0]), value[1], value[2]]
+        else:
+            current[0] = [a + b for a, b in zip(current[0], value[0])]
+            current[1] += value[1]
+            current[2] += value[2]
+
+
+def collect():
+    """Return {metric_name: {label_key: value}} summed over all worker processes."""
+    merged = {}
+    own = _snapshot()
+    directory = _multiproc_dir()
+    own_file = f"metrics_{os.getpid()}.json"
+    if directory and os.path.isdir(directory):
+        for filename in os.listdir(directory):
+            if not filename.startswith('metrics_') or not filename.endswith('.json') or filename == own_file:
+                continue
+            try:
+                with open(os.path.join(directory, filename)) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name, values in data.items():
+                for key, value in values.items():
+                    _merge(merged, name, key, value)
+    for name, values in own.items():
+        for key, value in values.items():
+            _merge(merged, name, key, value)
+    return merged
+
+
+# ==================== PROMETHEUS EXPOSITION ====================
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labelnames, key, extra=None):
+    pairs = list(zip(labelnames, key.split(_KEY_SEP) if labelnames else []))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_bound(bound):
+    return '+Inf' if bound == float('inf') else repr(float(bound))
+
+
+def render_prometheus():
+    """Render all metrics in the Prometheus text exposition format (version 0.0.4)."""
+    merged = collect()
+    lines = []
+    for name, metric in _registry.items():
+        lines.append(f"# HELP {name} {metric.documentation}")
+        lines.append(f"# TYPE {name} {metric.kind}")
+        for key, value in sorted(merged.get(name, {}).items()):
+            if metric.kind == 'counter':
+                lines.append(f"{name}{_format_labels(metric.labelnames, key)} {value}")
+                continue
+            bucket_counts, total, count = value
+            cumulative = 0
+            for bound, bucket_count in zip(metric.buckets + (float('inf'),), bucket_counts):
+                cumulative += bucket_count
+                labels = _format_labels(metric.labelnames, key, ('le', _format_bound(bound)))
+                lines.append(f"{name}_bucket{labels} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(metric.labelnames, key)} {total}")
+            lines.append(f"{name}_count{_format_labels(metric.labelnames, key)} {count}")
+    return '\n'.join(lines) + '\n'
+
+
+# ==================== FLASK INTEGRATION ====================
+
+def init_app(app):
+    """Record per-route latency for every request and expose GET /metrics."""
+    from flask import Response, g, request
+
+    @app.before_request
+    def _start_request_timer():
+        g._metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _record_request_latency(response):
+        start = g.pop('_metrics_start', None)
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule else '<unmatched>'
+            HTTP_REQUEST_DURATION.observe(
+                time.perf_counter() - start,
+                method=request.method, route=route, status=response.status_code)
+        return response
+
+    @app.route('/metrics')
+    def metrics_endpoint():
+        token = os.getenv('METRICS_TOKEN')
+        if token and request.headers.get('Authorization') != f"Bearer {token}":
+            return Response('Unauthorized\n', status=401, mimetype='text/plain')
+        return Response(render_prometheus(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
+atexit.register(flush)
@@ -0,0 +1,184 @@
+"""
+FixMyHyd Profiling
+Opt-in, per-request span trees for the report pipeline and database calls.
+
+A request is traced when it carries `X-Profile: 1` (admins only, or any client
+sending `X-Profile: <PROFILE_TOKEN>`), or when it is picked by PROFILE_SAMPLE_RATE.
+Traced requests get an `X-Trace-Id` response header; finished traces are kept
+in an in-memory ring buffer and, when PROFILE_TRACE_FILE is set, appended to
+that file as JSON lines for offline analysis.
+
+span() is a no-op when the current request is not being traced, so the hooks
+can stay in hot paths permanently.
+"""
+
+import os
+import json
+import time
+import uuid
+import random
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+BUFFER_SIZE = int(os.getenv('PROFILE_BUFFER_SIZE', '200'))
+
+_current_span = ContextVar('fixmyhyd_current_span', default=None)
+_recent_traces = deque(maxlen=BUFFER_SIZE)
+_file_lock = threading.Lock()
+
+
+class Span:
+    __slots__ = ('name', 'attrs', 'start', 'end', 'children', 'trace_id')
+
+    def __init__(self, name, trace_id, attrs=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.attrs = attrs or {}
+        self.start = time.perf_counter()
+        self.end = None
+        self.children = []
+
+    def finish(self):
+        self.end = time.perf_counter()
+
+    def to_dict(self, origin=None):
+        origin = self.start if origin is None else origin
+        end = self.end if self.end is not None else time.perf_counter()
+        data = {
+            'name': self.name,
+            'offset_ms': round((self.start - origin) * 1000, 3),
+            'duration_ms': round((end - self.start) * 1000, 3),
+        }
+        if self.attrs:
+            data['attrs'] = self.attrs
+        if self.children:
+            data['children'] = [child.to_dict(origin) for child in self.children]
+        return data
+
+
+def is_active():
+    return _current_span.get() is not None
+
+
+@contextmanager
+def span(name, **attrs):
+    """Record a child span of the current trace (no-op when not tracing)."""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(name, parent.trace_id, attrs)
+    parent.children.append(child)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.attrs['error'] = type(e).__name__
+        raise
+    finally:
+        child.finish()
+        _current_span.reset(token)
+
+
+def start_trace(name, **attrs):
+    """Begin a new root span in the current context; returns (root, token)."""
+    root = Span(name, uuid.uuid4().hex[:16], attrs)
+    return root, _current_span.set(root)
+
+
+def finish_trace(root, token):
+    """Close a root span, reset the context and store the finished trace."""
+    root.finish()
+    try:
+        _current_span.reset(token)
+    except ValueError:
+        # Token created in a different context (e.g. another thread); just clear it
+        _current_span.set(None)
+    trace = {
+        'trace_id': root.trace_id,
+        'recorded_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime()),
+        'pid': os.getpid(),
+        'root': root.to_dict(),
+    }
+    _recent_traces.append(trace)
+    _write_trace_file(trace)
+    return trace
+
+
+def _write_trace_file(trace):
+    path = os.getenv('PROFILE_TRACE_FILE')
+    if not path:
+        return
+    line = json.dumps(trace, default=str) + '\n'
+    try:
+        with _file_lock, open(path, 'a') as f:
+            f.write(line)
+    except OSError:
+        pass
+
+
+def recent_traces(limit=50):
+    """Most recent traces, newest first (from PROFILE_TRACE_FILE when set, so all workers are included)."""
+    path = os.getenv('PROFILE_TRACE_FILE')
+    if path and os.path.exists(path):
+        traces = []
+        with open(path, 'rb') as f:
+            # Read only the tail of the file; traces are a few KB each
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - limit * 16384))
+            for raw in f.read().splitlines():
+                try:
+                    traces.append(json.loads(raw))
+                except ValueError:
+                    continue
+        return list(reversed(traces[-limit:]))
+    return list(reversed(list(_recent_traces)[-limit:]))
+
+
+def find_trace(trace_id):
+    for trace in recent_traces(limit=BUFFER_SIZE):
+        if trace['trace_id'] == trace_id:
+            return trace
+    return None
+
+
+def _should_trace(request, session):
+    header = request.headers.get('X-Profile')
+    if header:
+        token = os.getenv('PROFILE_TOKEN')
+        if header == '1' and 'admin_id' in session:
+            return True
+        if token and header == token:
+            return True
+    return SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE
+
+
+def init_app(app):
+    """Trace opted-in requests from before_request to the end of the response."""
+    from flask import g, request, session
+
+    @app.before_request
+    def _start_profiling():
+        if request.path.startswith('/static/') or not _should_trace(request, session):
+            return
+        g._profile_root, g._profile_token = start_trace(
+            f"{request.method} {request.path}", endpoint=request.endpoint)
+
+    @app.after_request
+    def _tag_trace_id(response):
+        root = g.get('_profile_root')
+        if root is not None:
+            root.attrs['status'] = response.status_code
+            response.headers['X-Trace-Id'] = root.trace_id
+        return response
+
+    @app.teardown_request
+    def _finish_profiling(exc):
+        root = g.pop('_profile_root', None)
+        if root is not None:
+            if exc is not None:
+                root.attrs['error'] = type(exc).__name__
+            finish_trace(root, g.pop('_profile_token'))
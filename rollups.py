@@ -0,0 +1,158 @@
+"""
+FixMyHyd Trend Rollups
+Hourly complaint activity per zone, category and status, for the trends API.
+
+complaint_rollups holds, for each (hour, zone, category, status):
+
+    opened              complaints created in that hour with that initial status
+    entered             status changes into that status during the hour
+    resolution_seconds  summed submission-to-resolution time of those changes
+                        (only for status 'Resolved')
+
+Triggers on complaints (creation) and status_history (changes) keep it up to
+date in the same transaction as the write, so trend queries sum at most
+24 rows a day per zone/category/status instead of grouping raw complaints and
+history. Rows record the zone and category a complaint had when the event
+happened; later reassignment does not rewrite history, and the history rows it
+writes (which keep the status) are not counted as entering it again.
+"""
+
+_KEY_COLUMNS = 'bucket, zone, category, status'
+
+INTERVALS = ('hour', 'day', 'week')
+
+
+def _bucket(expr, postgres):
+    return f"date_trunc('hour', {expr})" if postgres else f"strftime('%Y-%m-%d %H:00:00', {expr})"
+
+
+def _seconds_between(start, end, postgres):
+    if postgres:
+        return f'EXTRACT(EPOCH FROM ({end} - {start}))'
+    return f'(julianday({end}) - julianday({start})) * 86400.0'
+
+
+def _status_changed(row, postgres):
+    distinct = 'IS DISTINCT FROM' if postgres else 'IS NOT'
+    return f'{row}.new_status IS NOT NULL AND {row}.old_status {distinct} {row}.new_status'
+
+
+def _opened_columns(ref, postgres):
+    return f"{_bucket(f'{ref}.created_at', postgres)}, COALESCE({ref}.zone, ''), {ref}.category, {ref}.status, 1, 0, 0.0"
+
+
+def _entered_columns(ref, postgres):
+    """Columns for a status_history row ref joined to its complaint as c."""
+    seconds = _seconds_between('c.created_at', f'{ref}.created_at', postgres)
+    return (f"{_bucket(f'{ref}.created_at', postgres)}, COALESCE(c.zone, ''), c.category, {ref}.new_status, "
+            f"0, 1, CASE WHEN {ref}.new_status = 'Resolved' THEN {seconds} ELSE 0.0 END")
+
+
+def _upsert(select):
+    return f'''INSERT INTO complaint_rollups ({_KEY_COLUMNS}, opened, entered, resolution_seconds)
+               {select}
+               ON CONFLICT ({_KEY_COLUMNS}) DO UPDATE SET
+                   opened = complaint_rollups.opened + excluded.opened,
+                   entered = complaint_rollups.entered + excluded.entered,
+                   resolution_seconds = complaint_rollups.resolution_seconds + excluded.resolution_seconds;'''
+
+
+def _opened(postgres):
+    return _upsert(f'SELECT {_opened_columns("NEW", postgres)} WHERE true')
+
+
+def _entered(postgres):
+    return _upsert(f'SELECT {_entered_columns("NEW", postgres)} FROM complaints c WHERE c.id = NEW.complaint_id')
+
+
+def _backfill(postgres):
+    """Roll up existing complaints and history once, while the table is still empty."""
+    empty = 'NOT EXISTS (SELECT 1 FROM complaint_rollups)'
+    return f'''WITH events (b, z, cat, s, o, e, r) AS (
+                   SELECT {_opened_columns('c', postgres)} FROM complaints c
+                   WHERE c.status IS NOT NULL AND {empty}
+                   UNION ALL
+                   SELECT {_entered_columns('h', postgres)}
+                   FROM status_history h JOIN complaints c ON c.id = h.complaint_id
+                   WHERE {_status_changed('h', postgres)} AND {empty}
+               )
+               INSERT INTO complaint_rollups ({_KEY_COLUMNS}, opened, entered, resolution_seconds)
+               SELECT b, z, cat, s, SUM(o), SUM(e), SUM(r) FROM events GROUP BY b, z, cat, s'''
+
+
+SQLITE_ROLLUP_SCHEMA = [
+    f'''CREATE TABLE IF NOT EXISTS complaint_rollups (
+        bucket TEXT NOT NULL,
+        zone TEXT NOT NULL,
+        category TEXT NOT NULL,
+        status TEXT NOT NULL,
+        opened INTEGER NOT NULL DEFAULT 0,
+        entered INTEGER NOT NULL DEFAULT 0,
+        resolution_seconds REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY ({_KEY_COLUMNS})
+    ) WITHOUT ROWID''',
+    _backfill(False),
+    f'''CREATE TRIGGER IF NOT EXISTS complaint_rollups_opened AFTER INSERT ON complaints
+       WHEN NEW.status IS NOT NULL
+       BEGIN
+           {_opened(False)}
+       END''',
+    # Recreated so that databases from before the status check get it
+    'DROP TRIGGER IF EXISTS complaint_rollups_entered',
+    f'''CREATE TRIGGER complaint_rollups_entered AFTER INSERT ON status_history
+       WHEN {_status_changed('NEW', False)}
+       BEGIN
+           {_entered(False)}
+       END''',
+]
+
+POSTGRES_ROLLUP_SCHEMA = [
+    f'''CREATE TABLE IF NOT EXISTS complaint_rollups (
+        bucket TIMESTAMP NOT NULL,
+        zone VARCHAR(100) NOT NULL,
+        category VARCHAR(100) NOT NULL,
+        status VARCHAR(50) NOT NULL,
+        opened INTEGER NOT NULL DEFAULT 0,
+        entered INTEGER NOT NULL DEFAULT 0,
+        resolution_seconds DOUBLE PRECISION NOT NULL DEFAULT 0,
+        PRIMARY KEY ({_KEY_COLUMNS})
+    )''',
+    _backfill(True),
+    f'''CREATE OR REPLACE FUNCTION complaint_rollups_opened() RETURNS trigger AS $$
+       BEGIN
+           IF NEW.status IS NOT NULL THEN
+               {_opened(True)}
+           END IF;
+           RETURN NULL;
+       END
+       $$ LANGUAGE plpgsql''',
+    f'''CREATE OR REPLACE FUNCTION complaint_rollups_entered() RETURNS trigger AS $$
+       BEGIN
+           IF {_status_changed('NEW', True)} THEN
+               {_entered(True)}
+           END IF;
+           RETURN NULL;
+       END
+       $$ LANGUAGE plpgsql''',
+    'DROP TRIGGER IF EXISTS complaint_rollups_opened ON complaints',
+    '''CREATE TRIGGER complaint_rollups_opened AFTER INSERT ON complaints
+       FOR EACH ROW EXECUTE FUNCTION complaint_rollups_opened()''',
+    'DROP TRIGGER IF EXISTS complaint_rollups_entered ON status_history',
+    '''CREATE TRIGGER complaint_rollups_entered AFTER INSERT ON status_history
+       FOR EACH ROW EXECUTE FUNCTION complaint_rollups_entered()''',
+]
+
+
+def period_expression(interval, postgres):
+    """SQL turning complaint_rollups.bucket into the period label for interval (weeks start on Monday)."""
+    if postgres:
+        return {
+            'hour': "to_char(bucket, 'YYYY-MM-DD HH24:00')",
+            'day': "to_char(bucket, 'YYYY-MM-DD')",
+            'week': "to_char(date_trunc('week', bucket), 'YYYY-MM-DD')",
+        }[interval]
+    return {
+        'hour': 'substr(bucket, 1, 16)',
+        'day': 'substr(bucket, 1, 10)',
+        'week': "date(bucket, '-6 days', 'weekday 1')",
+    }[interval]
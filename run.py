@@ -6,7 +6,7 @@ Startup script for the application
 
 import os
 import sys
-from app import app, init_database
+from app import create_app, init_database
 
 def main():
     """Main startup function"""
@@ -59,6 +59,7 @@ def main():
     print("Default admin: admin / admin123")
     print("=" * 60)
     
+    app = create_app()
     try:
         app.run(debug=debug, port=port, host='0.0.0.0')
     except KeyboardInterrupt:
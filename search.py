@@ -0,0 +1,140 @@
+"""
+FixMyHyd Complaint Search
+Full-text search over complaint subject, description and location.
+
+SQLite: an FTS5 table (complaints_fts) over the complaints rows, kept in sync
+by triggers and ranked with bm25().
+PostgreSQL: a GIN index on a weighted tsvector of the same columns, ranked
+with ts_rank().
+
+Matches in subject count most, then location, then description. Every word
+of the query must match; the last one also matches as a prefix, so
+"manhole kukat" finds "Manhole near Kukatpally". Only the newest RANK_WINDOW
+matches are ranked, so a query matching most of the table ("road") costs
+about as much as a selective one.
+"""
+
+import re
+from html import escape
+
+# Broad queries rank only the newest matches, which keeps them fast on large tables
+RANK_WINDOW = 1000
+SNIPPET_WORDS = 30
+
+_STOPWORDS = frozenset('a an the and or of to in on at near by for is are with from'.split())
+
+SQLITE_SEARCH_SCHEMA = [
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS complaints_fts USING fts5(
+        subject, description, location,
+        content='complaints', content_rowid='id',
+        tokenize='porter unicode61 remove_diacritics 2', prefix='2 3'
+    )''',
+    '''CREATE TRIGGER IF NOT EXISTS complaints_fts_insert AFTER INSERT ON complaints
+       BEGIN
+           INSERT INTO complaints_fts (rowid, subject, description, location)
+           VALUES (NEW.id, NEW.subject, NEW.description, NEW.location);
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS complaints_fts_update AFTER UPDATE OF subject, description, location ON complaints
+       BEGIN
+           INSERT INTO complaints_fts (complaints_fts, rowid, subject, description, location)
+           VALUES ('delete', OLD.id, OLD.subject, OLD.description, OLD.location);
+           INSERT INTO complaints_fts (rowid, subject, description, location)
+           VALUES (NEW.id, NEW.subject, NEW.description, NEW.location);
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS complaints_fts_delete AFTER DELETE ON complaints
+       BEGIN
+           INSERT INTO complaints_fts (complaints_fts, rowid, subject, description, location)
+           VALUES ('delete', OLD.id, OLD.subject, OLD.description, OLD.location);
+       END''',
+    # Backfill rows created before the index existed (the triggers cover everything newer)
+    '''INSERT INTO complaints_fts (rowid, subject, description, location)
+           SELECT id, subject, description, location FROM complaints
+           WHERE id > (SELECT COALESCE(MAX(id), 0) FROM complaints_fts_docsize)''',
+]
+
+# Must match the indexed expression exactly for PostgreSQL to use the index
+_POSTGRES_DOCUMENT = '''(setweight(to_tsvector('english', coalesce(c.subject, '')), 'A')
+    || setweight(to_tsvector('english', coalesce(c.location, '')), 'B')
+    || setweight(to_tsvector('english', coalesce(c.description, '')), 'C'))'''
+
+POSTGRES_SEARCH_SCHEMA = [
+    f'''CREATE INDEX IF NOT EXISTS idx_complaints_search ON complaints
+       USING gin ({_POSTGRES_DOCUMENT.replace('c.', '')})''',
+]
+
+
+def query_terms(text):
+    """Lower-cased search words without punctuation and filler words."""
+    words = re.findall(r'\w+', (text or '').lower())
+    return [w for w in words if w not in _STOPWORDS] or words
+
+
+def match_expression(terms, postgres):
+    """FTS5 MATCH string or to_tsquery() input for terms (all required, last one as a prefix)."""
+    if postgres:
+        return ' & '.join(terms[:-1] + [terms[-1] + ':*'])
+    return ' '.join([f'"{t}"' for t in terms[:-1]] + [f'"{terms[-1]}"*'])
+
+
+def _window_sql(postgres, select, extra, limit):
+    if postgres:
+        return f"""SELECT {select}
+            FROM complaints c, to_tsquery('english', ?) q WHERE {_POSTGRES_DOCUMENT} @@ q{extra}
+            ORDER BY c.id DESC LIMIT {limit}"""
+    return f"""SELECT {select}
+            FROM complaints_fts JOIN complaints c ON c.id = complaints_fts.rowid
+            WHERE complaints_fts MATCH ?{extra}
+            ORDER BY complaints_fts.rowid DESC LIMIT {limit}"""
+
+
+def search_sql(postgres, columns, where=''):
+    """Ranked search of `complaints c`, newest RANK_WINDOW matches only.
+
+    Parameters: the match expression, values for `where` (extra conditions on
+    c with ? placeholders), LIMIT and OFFSET.
+    """
+    extra = f' AND {where}' if where else ''
+    if postgres:
+        inner = _window_sql(postgres, f'c.*, ts_rank({_POSTGRES_DOCUMENT}, q) AS score', extra, RANK_WINDOW)
+        order = 'score DESC, id DESC'
+    else:
+        inner = _window_sql(postgres, 'c.*, bm25(complaints_fts, 10.0, 1.0, 5.0) AS score', extra, RANK_WINDOW)
+        order = 'score, id DESC'  # bm25() is lower for better matches
+    return f"SELECT {', '.join(columns)} FROM ({inner}) ranked ORDER BY {order} LIMIT ? OFFSET ?"
+
+
+def count_sql(postgres, where=''):
+    """Number of matches, counted up to RANK_WINDOW + 1 so that a larger count shows the window was cut.
+
+    Same parameters as search_sql() without LIMIT and OFFSET; the row has `total`.
+    """
+    extra = f' AND {where}' if where else ''
+    return f"SELECT COUNT(*) AS total FROM ({_window_sql(postgres, 'c.id', extra, RANK_WINDOW + 1)}) matches"
+
+
+def _term_pattern(terms):
+    # Prefix match so that stemmed forms ("potholes" for "pothole") are marked too
+    return re.compile(r'\b(' + '|'.join(re.escape(t) for t in sorted(terms, key=len, reverse=True)) + r')\w*',
+                      re.IGNORECASE)
+
+
+def highlight(text, terms):
+    """HTML-escaped text with matching words wrapped in <mark>."""
+    pattern = _term_pattern(terms)
+    parts, last = [], 0
+    for found in pattern.finditer(text or ''):
+        parts += [escape(text[last:found.start()]), '<mark>', escape(found.group()), '</mark>']
+        last = found.end()
+    return ''.join(parts) + escape((text or '')[last:])
+
+
+def snippet(text, terms, words=SNIPPET_WORDS):
+    """highlight() of about `words` words of text around the first match."""
+    tokens = (text or '').split()
+    if len(tokens) <= words:
+        return highlight(text, terms)
+    pattern = _term_pattern(terms)
+    first = next((i for i, token in enumerate(tokens) if pattern.search(token)), 0)
+    start = max(0, min(first - words // 3, len(tokens) - words))
+    fragment = ' '.join(tokens[start:start + words])
+    return ('… ' if start else '') + highlight(fragment, terms) + (' …' if start + words < len(tokens) else '')
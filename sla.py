@@ -0,0 +1,171 @@
+"""
+FixMyHyd SLA Analytics
+Time-to-resolve and time-in-state percentiles derived from status_history.
+
+Durations go into log-bucketed histograms (the DDSketch scheme) in
+sla_sketches, one per (metric, zone, category):
+
+    resolve          submission to each change into 'Resolved'
+    state:<status>   time spent in <status>, recorded when the complaint leaves it
+
+A duration d lands in bucket ceil(log_gamma(d)), so every quantile read back is
+within RELATIVE_ACCURACY of the true value, whatever the range of durations,
+with at most a few hundred buckets per sketch. Sketches merge by adding
+bucket counts, so a city-wide or per-zone percentile is one small GROUP BY.
+
+A trigger on status_history updates the sketches in the same transaction as
+the status change; existing history is replayed once when the table is new.
+History rows that keep the status (zone reassignments) are not status
+changes and record nothing.
+"""
+
+import math
+
+RELATIVE_ACCURACY = 0.02
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+
+RESOLVE = 'resolve'
+QUANTILES = (0.5, 0.9, 0.99)
+
+_KEY_COLUMNS = 'metric, zone, category, bucket'
+
+
+def status_changed(row, postgres):
+    """SQL condition: the status_history row `row` moved the complaint to a different status."""
+    return f"{row}.old_status {'IS DISTINCT FROM' if postgres else 'IS NOT'} {row}.new_status"
+
+
+def _seconds_between(start, end, postgres):
+    if postgres:
+        return f'EXTRACT(EPOCH FROM ({end} - {start}))'
+    return f'(julianday({end}) - julianday({start})) * 86400.0'
+
+
+def _bucket(seconds, postgres):
+    greatest = 'GREATEST' if postgres else 'MAX'
+    return f'CAST(ceil(ln({greatest}({seconds}, 1.0)) / {math.log(GAMMA)!r}) AS INTEGER)'
+
+
+def _samples(postgres):
+    """(metric, zone, category, seconds) for the status_history row NEW, joined to its complaint as c."""
+    previous = ('(SELECT MAX(p.created_at) FROM status_history p '
+                f'WHERE p.complaint_id = NEW.complaint_id AND p.id < NEW.id AND {status_changed("p", postgres)})')
+    concat = "'state:' || NEW.old_status"
+    return f'''SELECT {concat} AS metric, COALESCE(c.zone, '') AS zone, c.category AS category,
+                      {_seconds_between(f'COALESCE({previous}, c.created_at)', 'NEW.created_at', postgres)} AS seconds
+               FROM complaints c WHERE c.id = NEW.complaint_id AND NEW.old_status IS NOT NULL
+               UNION ALL
+               SELECT '{RESOLVE}', COALESCE(c.zone, ''), c.category,
+                      {_seconds_between('c.created_at', 'NEW.created_at', postgres)}
+               FROM complaints c WHERE c.id = NEW.complaint_id AND NEW.new_status = 'Resolved\''''
+
+
+def _record(postgres):
+    return f'''INSERT INTO sla_sketches ({_KEY_COLUMNS}, count)
+               SELECT metric, zone, category, {_bucket('seconds', postgres)}, 1
+               FROM ({_samples(postgres)}) samples
+               WHERE true
+               ON CONFLICT ({_KEY_COLUMNS}) DO UPDATE SET count = sla_sketches.count + 1;'''
+
+
+def _backfill(postgres):
+    """Replay existing history once, while the table is still empty."""
+    return f'''WITH history AS (
+                   SELECT h.old_status, h.new_status, h.created_at, c.created_at AS opened_at,
+                          COALESCE(c.zone, '') AS zone, c.category,
+                          LAG(h.created_at) OVER (PARTITION BY h.complaint_id ORDER BY h.id) AS previous_at
+                   FROM status_history h JOIN complaints c ON c.id = h.complaint_id
+                   WHERE {status_changed('h', postgres)} AND NOT EXISTS (SELECT 1 FROM sla_sketches)
+               ), samples (metric, zone, category, seconds) AS (
+                   SELECT 'state:' || old_status, zone, category,
+                          {_seconds_between('COALESCE(previous_at, opened_at)', 'created_at', postgres)}
+                   FROM history WHERE old_status IS NOT NULL
+                   UNION ALL
+                   SELECT '{RESOLVE}', zone, category, {_seconds_between('opened_at', 'created_at', postgres)}
+                   FROM history WHERE new_status = 'Resolved'
+               )
+               INSERT INTO sla_sketches ({_KEY_COLUMNS}, count)
+               SELECT metric, zone, category, {_bucket('seconds', postgres)}, COUNT(*)
+               FROM samples GROUP BY 1, 2, 3, 4'''
+
+
+SQLITE_SLA_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS sla_sketches (
+        metric TEXT NOT NULL,
+        zone TEXT NOT NULL,
+        category TEXT NOT NULL,
+        bucket INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (metric, zone, category, bucket)
+    ) WITHOUT ROWID''',
+    'CREATE INDEX IF NOT EXISTS idx_status_history_complaint ON status_history (complaint_id, id)',
+    _backfill(False),
+    # Recreated so that databases from before the WHEN clause get it
+    'DROP TRIGGER IF EXISTS sla_sketches_record',
+    f'''CREATE TRIGGER sla_sketches_record AFTER INSERT ON status_history
+       WHEN {status_changed('NEW', False)}
+       BEGIN
+           {_record(False)}
+       END''',
+]
+
+POSTGRES_SLA_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS sla_sketches (
+        metric VARCHAR(60) NOT NULL,
+        zone VARCHAR(100) NOT NULL,
+        category VARCHAR(100) NOT NULL,
+        bucket INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (metric, zone, category, bucket)
+    )''',
+    'CREATE INDEX IF NOT EXISTS idx_status_history_complaint ON status_history (complaint_id, id)',
+    _backfill(True),
+    f'''CREATE OR REPLACE FUNCTION sla_sketches_record() RETURNS trigger AS $$
+       BEGIN
+           {_record(True)}
+           RETURN NULL;
+       END
+       $$ LANGUAGE plpgsql''',
+    'DROP TRIGGER IF EXISTS sla_sketches_record ON status_history',
+    f'''CREATE TRIGGER sla_sketches_record AFTER INSERT ON status_history
+       FOR EACH ROW WHEN ({status_changed('NEW', True)}) EXECUTE FUNCTION sla_sketches_record()''',
+]
+
+
+def bucket_value(bucket):
+    """Representative duration (seconds) of a bucket, within RELATIVE_ACCURACY of any value in it."""
+    return 2 * GAMMA ** bucket / (GAMMA + 1)
+
+
+def summarize(buckets):
+    """count, mean and QUANTILES (seconds) of a sketch given as (bucket, count) pairs in bucket order."""
+    total = sum(count for _, count in buckets)
+    summary = {'count': total, 'mean': None, **{f'p{round(q * 100)}': None for q in QUANTILES}}
+    if not total:
+        return summary
+    summary['mean'] = sum(bucket_value(b) * count for b, count in buckets) / total
+    seen, pending = 0, list(QUANTILES)
+    for bucket, count in buckets:
+        seen += count
+        while pending and seen > pending[0] * (total - 1):
+            summary[f'p{round(pending.pop(0) * 100)}'] = bucket_value(bucket)
+    return summary
+
+
+def time_in_state(opened_at, current_status, history, now):
+    """Per-state durations for one complaint from its status_history rows (oldest first).
+
+    Returns dicts of status, entered_at, left_at (None while current) and seconds.
+    Rows that kept the status (reassignments) do not end a period.
+    """
+    history = [change for change in history if change['old_status'] != change['new_status']]
+    periods, entered_at = [], opened_at
+    status = (history[0]['old_status'] if history else None) or current_status
+    for change in history:
+        periods.append({'status': change['old_status'] or status, 'entered_at': entered_at,
+                        'left_at': change['created_at'],
+                        'seconds': (change['created_at'] - entered_at).total_seconds()})
+        status, entered_at = change['new_status'], change['created_at']
+    periods.append({'status': status, 'entered_at': entered_at, 'left_at': None,
+                    'seconds': (now - entered_at).total_seconds()})
+    return periods
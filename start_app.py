@@ -8,7 +8,9 @@ import os
 import sys
 import subprocess
 import time
-from app import app, init_database
+from app import create_app, init_database
+
+app = create_app()
 
 def check_dependencies():
     """Check if all required dependencies are installed"""
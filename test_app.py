@@ -6,7 +6,14 @@ Tests all functionality to ensure everything is working properly
 
 import os
 import sys
+import sqlite3
 import tempfile
+from datetime import datetime
+
+# Keep test runs independent of the shared cache file used by a running server. A shared
+# backend, not memory://, since complaint IDs refuse per-process caches.
+os.environ.setdefault('CACHE_URL', f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'cache.db')}")
+
 from app import app, init_database, get_db_connection, hash_password
 
 def test_database():
@@ -31,6 +38,18 @@ def test_database():
         ''', ("admin", admin_password, "Test Admin"))
         
         conn.commit()
+
+        # SQLite engine profile: readers must not block behind writers
+        if isinstance(conn, sqlite3.Connection):
+            assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+            assert conn.execute('PRAGMA busy_timeout').fetchone()[0] > 0
+            assert conn.execute('PRAGMA foreign_keys').fetchone()[0] == 1
+            print("SQLite WAL profile applied")
+
+        # Timestamps come back typed, not as strings
+        created_at = conn.execute('SELECT created_at FROM users LIMIT 1').fetchone()[0]
+        assert isinstance(created_at, datetime), type(created_at)
+        print("Timestamps are datetimes")
         conn.close()
         print("Database test passed")
         return True
@@ -130,6 +149,1171 @@ def test_api_endpoints():
         print(f"API endpoints test failed: {e}")
         return False
 
+def test_metrics_endpoint():
+    """Test Prometheus metrics exposition"""
+    print("Testing metrics endpoint...")
+    try:
+        with app.test_client() as client:
+            client.get('/')
+            client.get('/user/login')
+            response = client.get('/metrics')
+            assert response.status_code == 200
+            body = response.get_data(as_text=True)
+            assert '# TYPE fixmyhyd_http_request_duration_seconds histogram' in body
+            assert 'route="/user/login"' in body
+            assert 'fixmyhyd_db_query_duration_seconds_count' in body
+            print("Metrics endpoint working")
+
+        # Worker snapshots are written in the background, without further samples
+        import json
+        import time
+        import metrics
+        directory = tempfile.mkdtemp()
+        os.environ['METRICS_MULTIPROC_DIR'] = directory
+        interval, metrics.FLUSH_INTERVAL = metrics.FLUSH_INTERVAL, 0.05
+        try:
+            metrics.CACHE_REQUESTS.inc(cache='test', result='hit')
+            snapshot = os.path.join(directory, f"metrics_{os.getpid()}.json")
+            deadline = time.monotonic() + 2
+            while not os.path.exists(snapshot) and time.monotonic() < deadline:
+                time.sleep(0.02)
+            with open(snapshot) as f:
+                assert json.load(f)['fixmyhyd_cache_requests_total']['test\x1fhit'] >= 1
+        finally:
+            metrics.FLUSH_INTERVAL = interval
+            del os.environ['METRICS_MULTIPROC_DIR']
+        print("Background metrics flush working")
+
+        print("Metrics test passed")
+        return True
+    except Exception as e:
+        print(f"Metrics test failed: {e}")
+        return False
+
+def test_profiling_traces():
+    """Test opt-in request profiling"""
+    print("Testing profiling...")
+    try:
+        with app.test_client() as client:
+            # Untraced requests get no trace id
+            response = client.get('/')
+            assert 'X-Trace-Id' not in response.headers
+
+            with client.session_transaction() as sess:
+                sess['admin_id'] = 1
+                sess['admin_name'] = 'Test Admin'
+            response = client.get('/admin/dashboard', headers={'X-Profile': '1'})
+            trace_id = response.headers.get('X-Trace-Id')
+            assert trace_id
+            print("Profiling header working")
+
+            response = client.get(f'/debug/traces/{trace_id}')
+            assert response.status_code == 200
+            root = response.get_json()['root']
+            assert any(child['name'] == 'db.execute' for child in root.get('children', []))
+            print("Trace view working")
+
+        print("Profiling test passed")
+        return True
+    except Exception as e:
+        print(f"Profiling test failed: {e}")
+        return False
+
+def test_cold_start():
+    """Test that importing the app stays lazy and within the cold-start budget"""
+    print("Testing cold start...")
+    try:
+        from manage import measure_cold_start, COLD_START_BUDGET_MS
+        result = measure_cold_start()
+        assert not result['eager_modules'], f"eagerly imported: {result['eager_modules']}"
+        assert result['elapsed_ms'] <= COLD_START_BUDGET_MS
+        print(f"Cold start: {result['elapsed_ms']:.0f} ms")
+
+        print("Cold start test passed")
+        return True
+    except Exception as e:
+        print(f"Cold start test failed: {e}")
+        return False
+
+def test_async_report_endpoint():
+    """Test the ASGI report endpoint's auth and validation before any AI call"""
+    print("Testing async report endpoint...")
+    try:
+        import asyncio
+        import asgi
+
+        def call(body, cookie=''):
+            messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+            sent = []
+
+            async def receive():
+                if messages:
+                    return messages.pop(0)
+                await asyncio.sleep(3600)
+
+            async def send(message):
+                sent.append(message)
+
+            scope = {'type': 'http', 'method': 'POST', 'path': '/api/report-issue', 'query_string': b'',
+                     'headers': [(b'content-type', b'multipart/form-data; boundary=XyZ'),
+                                 (b'cookie', cookie.encode())]}
+            asyncio.run(asgi.application(scope, receive, send))
+            return sent[0]['status']
+
+        body = (b'--XyZ\r\nContent-Disposition: form-data; name="description"\r\n\r\npothole\r\n--XyZ--\r\n')
+        assert call(body) == 302
+        print("Unauthenticated submission redirected")
+
+        serializer = app.session_interface.get_signing_serializer(app)
+        cookie = f"{app.config['SESSION_COOKIE_NAME']}={serializer.dumps({'user_id': 1})}"
+        assert call(body, cookie) == 400
+        print("Missing image rejected")
+
+        # A client that disconnects while its complaint is being inserted gets it on retry
+        import async_pipeline
+        import idempotency
+        from werkzeug.datastructures import MultiDict
+
+        async def insert():
+            await asyncio.sleep(0.05)
+            return 7, 'GHMC/TEST/7'
+
+        async def pipeline(**kwargs):
+            return await async_pipeline._commit(insert(), lambda cid, ghmc_id: {'id': cid, 'ghmc_id': ghmc_id})
+
+        async def disconnect():
+            await asyncio.sleep(0.01)
+            return {'type': 'http.disconnect'}
+
+        async def ignore(message):
+            pass
+
+        key = idempotency.submission_key(1, 'disconnect-during-insert')
+        assert idempotency.begin(key)[0] == idempotency.NEW
+        original_pipeline = asgi.run_report_pipeline
+        asgi.run_report_pipeline = pipeline
+        try:
+            asyncio.run(asgi._process_report(ignore, disconnect, MultiDict(), MultiDict(), b'', 1, key))
+        finally:
+            asgi.run_report_pipeline = original_pipeline
+        assert idempotency.begin(key) == (idempotency.DONE, {'id': 7, 'ghmc_id': 'GHMC/TEST/7'})
+        print("Disconnect during the insert keeps the acknowledgement")
+
+        # Gemini is called through the SDK's public clients and types
+        import app as fixmyhyd
+        request = fixmyhyd.gemini_request(['prompt', {'mime_type': 'image/jpeg', 'data': b'\xff\xd8'}])
+        assert request.model.startswith('models/') and request.contents[0].parts[1].inline_data.mime_type == 'image/jpeg'
+        print("Gemini requests built without SDK internals")
+
+        # Voice notes go inline through the audio key's async client, never genai.configure()
+        from google.ai import generativelanguage as glm
+        requests_seen = []
+
+        class Client:
+            async def generate_content(self, request):
+                requests_seen.append(request)
+                return glm.GenerateContentResponse(candidates=[{'content': {'parts': [{'text': ' Pothole \n'}]}}])
+
+        original_client, original_key = async_pipeline._async_client, os.environ.get('GOOGLE_API_KEY_AUDIO')
+        async_pipeline._async_client = lambda api_key: Client() if api_key == 'audio-key' else None
+        os.environ['GOOGLE_API_KEY_AUDIO'] = 'audio-key'
+        try:
+            assert asyncio.run(async_pipeline._transcribe(b'OggS\x00', 'audio/ogg')) == 'Pothole'
+        finally:
+            async_pipeline._async_client = original_client
+            if original_key is None:
+                os.environ.pop('GOOGLE_API_KEY_AUDIO')
+            else:
+                os.environ['GOOGLE_API_KEY_AUDIO'] = original_key
+        assert requests_seen[0].contents[0].parts[1].inline_data.data == b'OggS\x00'
+        print("Voice notes transcribed inline by the async client")
+
+        # Threads of one worker each call with their own key's client, never genai.configure()
+        assert fixmyhyd.gemini_client('key-a') is fixmyhyd.gemini_client('key-a')
+        assert fixmyhyd.gemini_client('key-a') is not fixmyhyd.gemini_client('key-b')
+
+        class SyncClient:
+            def generate_content(self, request):
+                requests_seen.append(request)
+                return glm.GenerateContentResponse(candidates=[{'content': {'parts': [{'text': 'Pothole'}]}}])
+
+        fixmyhyd._gemini_clients['audio-key'] = SyncClient()
+        os.environ['GOOGLE_API_KEY_AUDIO'] = 'audio-key'
+        try:
+            result = fixmyhyd.transcribe_audio_with_gemini(b'OggS\x01', 'audio/ogg')
+        finally:
+            fixmyhyd._gemini_clients.clear()
+            if original_key is None:
+                os.environ.pop('GOOGLE_API_KEY_AUDIO')
+            else:
+                os.environ['GOOGLE_API_KEY_AUDIO'] = original_key
+        assert result == {'transcription': 'Pothole'}
+        assert requests_seen[-1].contents[0].parts[1].inline_data.data == b'OggS\x01'
+        print("Sync Gemini calls use per-key clients")
+
+        print("Async report endpoint test passed")
+        return True
+    except Exception as e:
+        print(f"Async report endpoint test failed: {e}")
+        return False
+
+def test_shared_cache():
+    """Test the cross-worker cache backend and cache-backed sessions"""
+    print("Testing shared cache...")
+    try:
+        import time
+        import cache
+        path = os.path.join(tempfile.mkdtemp(), 'cache.db')
+        # Two instances on one file behave like two gunicorn workers
+        worker_a, worker_b = cache.SQLiteCache(path), cache.SQLiteCache(path)
+
+        worker_a.set('stats:home', {'total_complaints': 3}, ttl=60)
+        assert worker_b.get('stats:home') == {'total_complaints': 3}
+        worker_a.set('short', 1, ttl=0.05)
+        time.sleep(0.1)
+        assert worker_b.get('short') is None
+        print("TTL working")
+
+        assert [worker_a.incr('hits'), worker_b.incr('hits', 5), worker_a.incr('hits')] == [1, 6, 7]
+        print("Atomic increments working")
+
+        received = []
+        worker_b.subscribe(cache.INVALIDATE_CHANNEL, received.append)
+        worker_a.invalidate('stats:')
+        time.sleep(cache.POLL_INTERVAL * 3)
+        assert received == ['stats:'] and worker_b.get('stats:home') is None
+        print("Invalidation messages working")
+
+        for _ in range(100):
+            worker_b.invalidate('stats:')
+        time.sleep(cache.POLL_INTERVAL * 3)
+        assert not worker_a._own_events and not worker_b._own_events
+        print("Published ids not retained")
+
+        lru = cache.MemoryCache(max_entries=2)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+        assert lru.get('a') == 1 and lru.get('b') is None
+        print("LRU eviction working")
+
+        import threading
+        racing = cache.MemoryCache()
+        winners = []
+        threads = [threading.Thread(target=lambda n=n: winners.append(racing.add('lock', n, ttl=60)))
+                   for n in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert winners.count(True) == 1
+        print("Only one concurrent add wins")
+
+        original = app.session_interface
+        app.session_interface = cache.CacheSessionInterface()
+        try:
+            with app.test_client() as client:
+                def session_id():
+                    cookie = client.get_cookie(app.config['SESSION_COOKIE_NAME'])
+                    return app.session_interface._signer(app).loads(cookie.value)
+
+                with client.session_transaction() as sess:
+                    sess['visited'] = True
+                anonymous = session_id()
+                with client.session_transaction() as sess:
+                    sess['admin_id'] = 1
+                    sess['admin_name'] = 'Test Admin'
+                # Logging in issues a new id, so an id planted before login is useless
+                assert session_id() != anonymous and cache.get_cache().get(f"session:{anonymous}") is None
+                assert client.get('/admin/dashboard').status_code == 200
+                client.get('/logout')
+                assert client.get('/admin/dashboard').status_code == 302
+        finally:
+            app.session_interface = original
+        print("Cache-backed sessions working, rotated on login")
+
+        print("Shared cache test passed")
+        return True
+    except Exception as e:
+        print(f"Shared cache test failed: {e}")
+        return False
+
+def test_status_transitions():
+    """Test atomic single and bulk complaint status transitions"""
+    print("Testing status transitions...")
+    original_path = os.environ.get('DATABASE_PATH')
+    os.environ['DATABASE_PATH'] = os.path.join(tempfile.mkdtemp(), 'transitions.db')
+    try:
+        from app import transition_complaint_status, InvalidTransition
+        init_database()
+        conn = get_db_connection()
+        conn.execute("INSERT INTO users (name, email, password_hash) VALUES ('T', 't@example.com', 'x')")
+        for i in range(6):
+            conn.execute('''
+                INSERT INTO complaints (ghmc_id, category, priority, subject, description, location, zone, user_id)
+                VALUES (?, 'Other', 'Low', 's', 'd', 'l', ?, 1)
+            ''', (f"GHMC/TEST/{i}", 'Zone X' if i % 2 else 'Zone Y'))
+        conn.commit()
+
+        changed = transition_complaint_status(conn, 'Resolved', 'Admin', filters={'zone': 'Zone X'})
+        assert len(changed) == 3 and all(c['old_status'] == 'Submitted' for c in changed)
+        history = conn.execute('SELECT COUNT(*) FROM status_history WHERE new_status = ?', ('Resolved',)).fetchone()[0]
+        assert history == 3
+        print("Bulk transition working")
+
+        # Resolved -> Submitted is not an allowed move; nothing changes
+        assert transition_complaint_status(conn, 'Submitted', 'Admin', ids=[changed[0]['complaint_id']]) == []
+        try:
+            transition_complaint_status(conn, 'Unknown', 'Admin', ids=[1])
+            assert False, "unknown status accepted"
+        except InvalidTransition:
+            pass
+        conn.close()
+        print("State machine enforced")
+
+        with app.test_client() as client:
+            with client.session_transaction() as sess:
+                sess['admin_id'] = 1
+            response = client.put('/api/admin/complaints/1/status', json={'status': 'In Progress'})
+            assert response.get_json()['old_status'] == 'Submitted'
+            response = client.put('/api/admin/complaints/1/status', json={'status': 'Submitted'})
+            assert response.status_code == 409
+            print("Status update API working")
+
+            response = client.post('/api/admin/complaints/bulk', json={
+                'ids': [1, 2, 9999], 'status': 'Closed', 'comments': 'Backlog cleared'})
+            results = response.get_json()['results']
+            assert [r['result'] for r in results] == ['updated', 'updated', 'not_found']
+            response = client.post('/api/admin/complaints/bulk', json={
+                'action': 'reassign', 'filter': {'zone': 'Zone Y'}, 'zone': 'Zone Z'})
+            assert response.get_json()['summary'] == {'updated': 3}
+        print("Bulk actions API working")
+
+        print("Status transitions test passed")
+        return True
+    except Exception as e:
+        print(f"Status transitions test failed: {e}")
+        return False
+    finally:
+        if original_path is None:
+            os.environ.pop('DATABASE_PATH', None)
+        else:
+            os.environ['DATABASE_PATH'] = original_path
+
+def test_complaint_ids():
+    """Test that complaint IDs are unique across workers and time-ordered"""
+    print("Testing complaint IDs...")
+    try:
+        import time
+        import ids
+        # Two workers on the same node generating in the same milliseconds
+        worker_a, worker_b = ids.IdGenerator(node_id=1, slot=1), ids.IdGenerator(node_id=1, slot=2)
+        values = [gen.next_int() for _ in range(5000) for gen in (worker_a, worker_b)]
+        assert len(set(values)) == len(values)
+        own = [worker_a.next_int() for _ in range(5000)]
+        assert own == sorted(own)
+        assert [ids.encode(v) for v in own] == sorted(ids.encode(v) for v in own)
+        print("IDs unique and ordered")
+
+        ghmc_id = ids.new_complaint_id()
+        assert ghmc_id.startswith('GHMC/HYD/') and abs(ids.timestamp_of(ghmc_id) - time.time()) < 5
+        print(f"Generated {ghmc_id}")
+
+        # Slots are leased: a live lease is never handed out twice, a released one is reused
+        import cache
+        backend = cache.get_cache()
+        claimed = [ids._claim_process_slot(30, f'worker-{i}')[1] for i in range(ids.MAX_SLOT + 1)]
+        assert sorted(claimed) == list(range(ids.MAX_SLOT + 1))
+        try:
+            ids._claim_process_slot(30, 'one-too-many')
+            assert False, "every slot is leased"
+        except RuntimeError:
+            pass
+        backend.delete(ids._slot_key(30, claimed[0]))
+        assert ids._claim_process_slot(30, 'recycled') == (30, claimed[0])
+        # Without ID_NODE_ID the node is leased too, never landing on a pair already taken
+        leased = [ids._claim_process_slot(None, f'host-{i}') for i in range(2 * (ids.MAX_SLOT + 1))]
+        assert len(set(leased)) == len(leased) and all(node != 30 for node, _ in leased)
+        for node, slot in leased:
+            backend.delete(ids._slot_key(node, slot))
+        original_cache = cache._cache
+        cache._cache = cache.MemoryCache()
+        try:
+            ids._claim_process_slot(30, 'per-process')
+            assert False, "a per-process cache cannot lease slots"
+        except RuntimeError:
+            pass
+        finally:
+            cache._cache = original_cache
+        print("Node ids and process slots leased, reused after release, refused without a shared cache")
+
+        from app import insert_with_fresh_ghmc_id
+        conn = sqlite3.connect(':memory:')
+        conn.execute('CREATE TABLE complaints (ghmc_id TEXT UNIQUE NOT NULL)')
+        taken = ids.new_complaint_id()
+        conn.execute('INSERT INTO complaints VALUES (?)', (taken,))
+        conn.commit()
+        original_new = ids.new_complaint_id
+        issued = iter([taken])
+        ids.new_complaint_id = lambda: next(issued, None) or original_new()
+        try:
+            ghmc_id, _ = insert_with_fresh_ghmc_id(
+                conn, lambda value: conn.execute('INSERT INTO complaints VALUES (?)', (value,)))
+        finally:
+            ids.new_complaint_id = original_new
+        assert ghmc_id != taken and conn.execute('SELECT COUNT(*) FROM complaints').fetchone()[0] == 2
+        print("Insert retried with a fresh ID after a collision")
+
+        print("Complaint ID test passed")
+        return True
+    except Exception as e:
+        print(f"Complaint ID test failed: {e}")
+        return False
+
+def test_idempotent_submissions():
+    """Test that retried report submissions are answered without re-running the pipeline"""
+    print("Testing idempotent submissions...")
+    try:
+        import io
+        import time
+        import hashlib
+        import idempotency
+        image = b'\xff\xd8\xfftest-image'
+        key = idempotency.submission_key(1, None, hashlib.sha256(image).hexdigest())
+
+        with app.test_client() as client:
+            with client.session_transaction() as sess:
+                sess['user_id'] = 1
+
+            # A rejected submission must not block its retry
+            response = client.post('/api/report-issue', data={'image': (io.BytesIO(image), 'a.jpg')})
+            assert response.status_code == 400
+            assert idempotency.begin(key)[0] == idempotency.NEW
+            print("Failed submission released its key")
+
+            ack = {'status': 'success', 'acknowledgement': {'ghmc_id': 'GHMC/HYD/TEST'}}
+            idempotency.complete(key, ack)
+            response = client.post('/api/report-issue', data={
+                'image': (io.BytesIO(image), 'a.jpg'), 'description': 'Pothole', 'location_text': 'Ameerpet'})
+            assert response.status_code == 201 and response.get_json() == ack
+            assert response.headers.get(idempotency.REPLAY_HEADER) == 'true'
+            print("Duplicate submission replayed")
+
+            # A retry of a submission still in flight is answered quickly, not held for the whole pipeline
+            busy = b'\xff\xd8\xffbusy-image'
+            busy_key = idempotency.submission_key(1, None, hashlib.sha256(busy).hexdigest())
+            assert idempotency.begin(busy_key)[0] == idempotency.NEW
+            started = time.monotonic()
+            response = client.post('/api/report-issue', data={
+                'image': (io.BytesIO(busy), 'a.jpg'), 'description': 'Pothole', 'location_text': 'Ameerpet'})
+            assert response.status_code == 409 and response.headers['Retry-After']
+            assert time.monotonic() - started < idempotency.WAIT_TIMEOUT + 2
+            idempotency.abandon(busy_key)
+            print("In-flight retry answered 409 after a short wait")
+
+        print("Idempotent submissions test passed")
+        return True
+    except Exception as e:
+        print(f"Idempotent submissions test failed: {e}")
+        return False
+
+def test_duplicate_detection():
+    """Test that a nearby report of the same issue is linked without AI processing"""
+    print("Testing duplicate detection...")
+    original_path = os.environ.get('DATABASE_PATH')
+    os.environ['DATABASE_PATH'] = os.path.join(tempfile.mkdtemp(), 'dedup.db')
+    try:
+        import io
+        import random
+        from PIL import Image, ImageFilter
+        import dedup
+        from app import save_complaint
+
+        init_database()
+        conn = get_db_connection()
+        conn.execute("INSERT INTO users (name, email, password_hash) VALUES ('T', 't@example.com', 'x')")
+        conn.commit()
+
+        rng = random.Random(7)
+        photo = Image.new('L', (64, 48))
+        photo.putdata([rng.randint(0, 255) for _ in range(64 * 48)])
+        photo = photo.resize((640, 480)).filter(ImageFilter.GaussianBlur(20))
+        original, resent = io.BytesIO(), io.BytesIO()
+        photo.save(original, 'JPEG')
+        photo.resize((320, 240)).save(resent, 'JPEG', quality=40)
+
+        save_complaint('Pothole/Damaged Road', 'High', 'Pothole on main road', 'desc', 'Ameerpet', 'Zone 1',
+                       17.4375, 78.4483, 1, image_phash=dedup.image_hash(original.getvalue()),
+                       report_text='Deep pothole on the main road')
+
+        with app.test_client() as client:
+            with client.session_transaction() as sess:
+                sess['user_id'] = 1
+            # ~20 m away, same photo re-compressed: linked before any Gemini call
+            response = client.post('/api/report-issue', data={
+                'image': (io.BytesIO(resent.getvalue()), 'b.jpg'), 'description': 'Road damaged',
+                'device_latitude': '17.4377', 'device_longitude': '78.4484'})
+            assert response.status_code == 201
+            assert response.get_json()['acknowledgement']['duplicate_of']
+        print("Duplicate linked")
+
+        rows = conn.execute('SELECT duplicate_of, report_count FROM complaints ORDER BY id').fetchall()
+        assert [tuple(r) for r in rows] == [(None, 2), (1, 1)]
+        conn.close()
+        print("Report count updated")
+
+        print("Duplicate detection test passed")
+        return True
+    except Exception as e:
+        print(f"Duplicate detection test failed: {e}")
+        return False
+    finally:
+        if original_path is None:
+            os.environ.pop('DATABASE_PATH', None)
+        else:
+            os.environ['DATABASE_PATH'] = original_path
+
+def test_geo_queries():
+    """Test the nearby, bounding-box and heatmap complaint queries"""
+    print("Testing geospatial queries...")
+    original_path = os.environ.get('DATABASE_PATH')
+    os.environ['DATABASE_PATH'] = os.path.join(tempfile.mkdtemp(), 'geo.db')
+    try:
+        from app import save_complaint
+
+        init_database()
+        conn = get_db_connection()
+        conn.execute("INSERT INTO users (name, email, password_hash) VALUES ('T', 't@example.com', 'x')")
+        conn.commit()
+        conn.close()
+        # Ameerpet, ~150 m north of it, and Secunderabad (~6 km away)
+        for subject, lat, lng in [('A', 17.4375, 78.4483), ('B', 17.4389, 78.4483), ('C', 17.4399, 78.4983)]:
+            save_complaint('Other', 'Low', subject, 'desc', 'loc', 'Zone 1', lat, lng, 1)
+
+        with app.test_client() as client:
+            with client.session_transaction() as sess:
+                sess['admin_id'] = 1
+            data = client.get('/api/admin/complaints/nearby?lat=17.4375&lng=78.4483&radius_m=500').get_json()
+            assert [c['subject'] for c in data['complaints']] == ['A', 'B']
+            assert data['complaints'][1]['distance_m'] > 100
+            assert not data['truncated']
+            data = client.get('/api/admin/complaints/nearby?lat=17.4375&lng=78.4483&radius_m=500&limit=1').get_json()
+            assert [c['subject'] for c in data['complaints']] == ['A'] and data['truncated']
+            print("Nearby query sorted by distance")
+
+            data = client.get('/api/admin/complaints/bbox?min_lat=17.43&max_lat=17.45'
+                              '&min_lng=78.44&max_lng=78.50&limit=2').get_json()
+            assert data['count'] == 2 and data['truncated']
+            assert client.get('/api/admin/complaints/bbox?min_lat=17.45&max_lat=17.43'
+                              '&min_lng=78.44&max_lng=78.50').status_code == 400
+            print("Bounding-box query works")
+
+            data = client.get('/api/admin/heatmap?zoom=12').get_json()
+            assert data['total'] == 3 and data['tiles'][0]['count'] == 2
+            conn = get_db_connection()
+            conn.execute("UPDATE complaints SET status = 'Resolved' WHERE subject = 'A'")
+            conn.commit()
+            conn.close()
+            data = client.get('/api/admin/heatmap?zoom=12&status=Submitted').get_json()
+            assert data['total'] == 2 and data['count'] == 2
+            print("Heatmap tiles follow status changes")
+
+        print("Geospatial query test passed")
+        return True
+    except Exception as e:
+        print(f"Geospatial query test failed: {e}")
+        return False
+    finally:
+        if original_path is None:
+            os.environ.pop('DATABASE_PATH', None)
+        else:
+            os.environ['DATABASE_PATH'] = original_path
+
+def test_search():
+    """Test ranked full-text search with highlighting"""
+    print("Testing complaint search...")
+    original_path = os.environ.get('DATABASE_PATH')
+    os.environ['DATABASE_PATH'] = os.path.join(tempfile.mkdtemp(), 'search.db')
+    try:
+        from app import save_complaint
+
+        init_database()
+        conn = get_db_connection()
+        conn.execute("INSERT INTO users (name, email, password_hash) VALUES ('T', 't@example.com', 'x')")
+        conn.commit()
+        conn.close()
+        for subject, description, location in [
+                ('Open manhole', 'Manhole cover missing near the bus stop', 'Kukatpally Housing Board'),
+                ('Garbage pile', 'Garbage not collected; open manhole nearby', 'Ameerpet'),
+                ('Streetlight <off>', 'Light not working', 'Kukatpally')]:
+            save_complaint('Other', 'Low', subject, description, location, 'Zone 1', None, None, 1)
+
+        with app.test_client() as client:
+            with client.session_transaction() as sess:
+                sess['admin_id'] = 1
+            data = client.get('/api/admin/complaints/search?q=manhole near Kukat').get_json()
+            assert data['total'] == 1
+            assert data['complaints'][0]['subject_highlight'] == 'Open <mark>manhole</mark>'
+            data = client.get('/api/admin/complaints/search?q=manhole&per_page=1&page=2').get_json()
+            assert data['total'] == 2 and data['pages'] == 2 and data['complaints'][0]['subject'] == 'Garbage pile'
+            data = client.get('/api/admin/complaints/search?q=manhole&page=5').get_json()
+            assert data['total'] == 2 and data['pages'] == 1 and data['complaints'] == []
+            assert data['window_limited'] is False
+            import search
+            window, search.RANK_WINDOW = search.RANK_WINDOW, 1
+            try:
+                data = client.get('/api/admin/complaints/search?q=manhole').get_json()
+                assert data['total'] == 1 and data['window_limited'] is True
+            finally:
+                search.RANK_WINDOW = window
+            print("Search is ranked and paginated")
+
+            data = client.get('/api/admin/complaints/search?q=streetlight').get_json()
+            assert data['complaints'][0]['subject_highlight'] == '<mark>Streetlight</mark> &lt;off&gt;'
+            assert client.get('/api/admin/complaints/search?q=').status_code == 400
+            print("Highlights are escaped")
+
+        print("Complaint search test passed")
+        return True
+    except Exception as e:
+        print(f"Complaint search test failed: {e}")
+        return False
+    finally:
+        if original_path is None:
+            os.environ.pop('DATABASE_PATH', None)
+        else:
+            os.environ['DATABASE_PATH'] = original_path
+
+def test_trends():
+    """Test that the trends API reads volumes and resolution times from the rollups"""
+    print("Testing trends...")
+    original_path = os.environ.get('DATABASE_PATH')
+    os.environ['DATABASE_PATH'] = os.path.join(tempfile.mkdtemp(), 'trends.db')
+    try:
+        from app import save_complaint, transition_complaint_status, _bulk_reassign_batch
+
+        init_database()
+        conn = get_db_connection()
+        conn.execute("INSERT INTO users (name, email, password_hash) VALUES ('T', 't@example.com', 'x')")
+        conn.commit()
+        for category in ('Roads', 'Roads', 'Water'):
+            save_complaint(category, 'Low', 'subject', 'desc', 'loc', 'Zone 1', None, None, 1)
+        conn.execute("UPDATE complaints SET created_at = datetime(created_at, '-1 day') WHERE id = 1")
+        conn.commit()
+        transition_complaint_status(conn, 'Resolved', 'admin', ids=[1])
+        # Reassignments keep the status and must not count as resolutions again
+        _bulk_reassign_batch(conn, [1], 'Zone 2', 'admin', '')
+        _bulk_reassign_batch(conn, [1], 'Zone 3', 'admin', '')
+        conn.close()
+
+        with app.test_client() as client:
+            with client.session_transaction() as sess:
+                sess['admin_id'] = 1
+            series = client.get('/api/admin/trends?group_by=category').get_json()['series']
+            roads = next(row for row in series if row['category'] == 'Roads')
+            assert roads['opened'] == 2 and roads['resolved'] == 1
+            assert 23.9 <= roads['avg_resolution_hours'] <= 24.1
+            print("Daily trends by category")
+            zones = client.get('/api/admin/trends?group_by=zone').get_json()['series']
+            assert [(row['zone'], row['resolved']) for row in zones if row['resolved']] == [('Zone 1', 1)]
+
+            # Replaying the history skips the reassignments too
+            conn = get_db_connection()
+            conn.execute('DELETE FROM complaint_rollups')
+            conn.commit()
+            conn.close()
+            init_database()
+            series = client.get('/api/admin/trends?group_by=category').get_json()['series']
+            assert sum(row['resolved'] for row in series if row['category'] == 'Roads') == 1
+            print("Reassignments are not counted as status changes")
+            assert client.get('/api/admin/trends?interval=month').status_code == 400
+
+        print("Trends test passed")
+        return True
+    except Exception as e:
+        print(f"Trends test failed: {e}")
+        return False
+    finally:
+        if original_path is None:
+            os.environ.pop('DATABASE_PATH', None)
+        else:
+            os.environ['DATABASE_PATH'] = original_path
+
+def test_sla():
+    """Test SLA percentiles and time in state from the status history"""
+    print("Testing SLA analytics...")
+    original_path = os.environ.get('DATABASE_PATH')
+    os.environ['DATABASE_PATH'] = os.path.join(tempfile.mkdtemp(), 'sla.db')
+    try:
+        from app import save_complaint, transition_complaint_status, compute_home_stats, _bulk_reassign_batch
+
+        init_database()
+        conn = get_db_connection()
+        conn.execute("INSERT INTO users (name, email, password_hash) VALUES ('T', 't@example.com', 'x')")
+        conn.commit()
+        for _ in range(3):
+            save_complaint('Roads', 'Low', 'subject', 'desc', 'loc', 'Zone 1', None, None, 1)
+        # Opened 1, 2 and 3 days ago
+        conn.execute("UPDATE complaints SET created_at = datetime(created_at, '-' || id || ' days')")
+        conn.commit()
+        transition_complaint_status(conn, 'Resolved', 'admin', ids=[1, 2, 3])
+        # Reassignments keep the status and must not count as resolutions again
+        _bulk_reassign_batch(conn, [1], 'Zone 2', 'admin', '')
+        _bulk_reassign_batch(conn, [1], 'Zone 1', 'admin', '')
+        # A later edit must not change the resolution time
+        conn.execute("UPDATE complaints SET updated_at = datetime(updated_at, '+30 days')")
+        conn.commit()
+        conn.close()
+
+        assert compute_home_stats()['avg_days'] == 2.0
+        with app.test_client() as client:
+            with client.session_transaction() as sess:
+                sess['admin_id'] = 1
+            group = client.get('/api/admin/sla?group_by=zone').get_json()['groups'][0]
+            assert group['zone'] == 'Zone 1' and group['count'] == 3
+            assert abs(group['p50_hours'] - 48) <= 48 * 0.02
+            print("Time-to-resolve percentiles")
+
+            # Replaying the history skips the reassignments too
+            conn = get_db_connection()
+            conn.execute('DELETE FROM sla_sketches')
+            conn.commit()
+            conn.close()
+            init_database()
+            assert client.get('/api/admin/sla').get_json()['groups'][0]['count'] == 3
+            print("SLA backfill skips reassignments")
+
+            periods = client.get('/api/admin/complaints/1/sla').get_json()['time_in_state']
+            assert [p['status'] for p in periods] == ['Submitted', 'Resolved']
+            assert periods[0]['hours'] == 24.0
+            print("Time in state")
+
+        print("SLA test passed")
+        return True
+    except Exception as e:
+        print(f"SLA test failed: {e}")
+        return False
+    finally:
+        if original_path is None:
+            os.environ.pop('DATABASE_PATH', None)
+        else:
+            os.environ['DATABASE_PATH'] = original_path
+
+def test_conditional_get():
+    """Test ETag revalidation of the complaint APIs"""
+    print("Testing conditional GETs...")
+    original_path = os.environ.get('DATABASE_PATH')
+    os.environ['DATABASE_PATH'] = os.path.join(tempfile.mkdtemp(), 'conditional.db')
+    try:
+        from app import save_complaint, transition_complaint_status
+
+        init_database()
+        conn = get_db_connection()
+        conn.execute("INSERT INTO users (name, email, password_hash) VALUES ('T', 't@example.com', 'x')")
+        conn.commit()
+        save_complaint('Roads', 'Low', 'subject', 'desc', 'loc', 'Zone 1', None, None, 1)
+        with app.test_client() as client:
+            with client.session_transaction() as sess:
+                sess['user_id'] = 1
+            first = client.get('/api/user/complaints')
+            assert first.status_code == 200 and first.headers['ETag'].startswith('W/')
+            assert first.headers['Cache-Control'] == 'private, no-cache'
+            assert 'Cookie' in first.headers['Vary'] and first.headers['Last-Modified']
+            again = client.get('/api/user/complaints', headers={'If-None-Match': first.headers['ETag']})
+            assert again.status_code == 304 and not again.data
+            print("Unchanged list answered with 304")
+
+            other = client.get('/api/user/complaints/1', headers={'If-None-Match': first.headers['ETag']})
+            assert other.status_code == 200
+            transition_complaint_status(conn, 'Resolved', 'admin', ids=[1])
+            changed = client.get('/api/user/complaints', headers={'If-None-Match': first.headers['ETag']})
+            assert changed.status_code == 200 and changed.get_json()[0]['status'] == 'Resolved'
+            assert changed.headers['ETag'] != first.headers['ETag']
+            print("Status change invalidates the ETag")
+
+            with client.session_transaction() as sess:
+                sess['user_id'] = 2
+            assert client.get('/api/user/complaints',
+                              headers={'If-None-Match': changed.headers['ETag']}).status_code == 200
+            print("ETags are per user")
+
+            import cache
+            original_cache = cache._cache
+            cache._cache = cache.MemoryCache()
+            try:
+                response = client.get('/api/user/complaints', headers={'If-None-Match': changed.headers['ETag']})
+                assert response.status_code == 200 and 'ETag' not in response.headers
+            finally:
+                cache._cache = original_cache
+            print("No validators without a shared cache")
+        conn.close()
+
+        print("Conditional GET test passed")
+        return True
+    except Exception as e:
+        print(f"Conditional GET test failed: {e}")
+        return False
+    finally:
+        if original_path is None:
+            os.environ.pop('DATABASE_PATH', None)
+        else:
+            os.environ['DATABASE_PATH'] = original_path
+
+def test_static_assets():
+    """Test fingerprinted, precompressed static assets"""
+    print("Testing static asset build...")
+    import assets
+    original_dir = assets.BUILD_DIR
+    assets.BUILD_DIR = tempfile.mkdtemp()
+    try:
+        manifest = assets.build(output_dir=assets.BUILD_DIR)
+        assets.reload()
+        hashed = manifest['css/style.css']
+        assert hashed.startswith('css/style.') and hashed != 'css/style.css'
+        print(f"Built {len(manifest)} assets")
+
+        with app.test_client() as client:
+            page = client.get('/').get_data(as_text=True)
+            assert f'/assets/{hashed}' in page and f"/assets/{manifest['js/main.js']}" in page
+            response = client.get(f'/assets/{hashed}', headers={'Accept-Encoding': 'gzip, br'})
+            assert response.status_code == 200
+            assert response.headers['Content-Encoding'] in ('br', 'gzip')
+            assert 'immutable' in response.headers['Cache-Control']
+            assert 'max-age=31536000' in response.headers['Cache-Control']
+            plain = client.get(f'/assets/{hashed}', headers={'Accept-Encoding': 'identity'})
+            assert 'Content-Encoding' not in plain.headers and b'{' in plain.data
+            assert client.get('/assets/manifest.json').status_code == 404
+            print("Hashed URLs served with immutable caching")
+
+        # Strings inside template substitutions are copied verbatim too
+        source = "const a = `x  ${ok ? `b   c` : '  '} ${ {k: '}'}.k }  y`;\nlet   b = 1 / 2;"
+        assert assets.minify_js(source) == "const a = `x  ${ok ? `b   c` : '  '} ${ {k: '}'}.k }  y`;\nlet b = 1 / 2;"
+        print("Nested template literals preserved")
+
+        print("Static asset test passed")
+        return True
+    except Exception as e:
+        print(f"Static asset test failed: {e}")
+        return False
+    finally:
+        assets.BUILD_DIR = original_dir
+        assets.reload()
+
+def test_compression():
+    """Test gzip/brotli response compression"""
+    print("Testing response compression...")
+    import gzip
+    import zlib
+    import compression
+    from werkzeug.test import Client
+    from werkzeug.wrappers import Response
+    try:
+        with app.test_client() as client:
+            page = client.get('/', headers={'Accept-Encoding': 'gzip'})
+            assert page.headers['Content-Encoding'] == 'gzip' and 'Accept-Encoding' in page.headers['Vary']
+            assert b'FixMyHyd' in gzip.decompress(page.data)
+            assert int(page.headers['Content-Length']) == len(page.data)
+            plain = client.get('/')
+            assert 'Content-Encoding' not in plain.headers and b'FixMyHyd' in plain.data
+            print("HTML compressed when accepted")
+
+            for encoding in compression.available_encodings():
+                negotiated = compression.negotiate(f'{encoding}, identity;q=0.5')
+                assert negotiated == encoding
+            assert compression.negotiate('gzip;q=0, br;q=0') is None
+
+        def small(environ, start_response):
+            return Response('{"ok": true}', mimetype='application/json')(environ, start_response)
+
+        def streamed(environ, start_response):
+            return Response((f'line {i}\n' * 50 for i in range(20)), mimetype='text/plain')(environ, start_response)
+
+        def image(environ, start_response):
+            return Response(b'\x89PNG' * 1000, mimetype='image/png')(environ, start_response)
+
+        headers = {'Accept-Encoding': 'gzip'}
+        response = Client(compression.CompressionMiddleware(small)).get('/', headers=headers)
+        assert 'Content-Encoding' not in response.headers
+        print("Small responses left alone")
+
+        response = Client(compression.CompressionMiddleware(streamed)).get('/', headers=headers)
+        assert response.headers['Content-Encoding'] == 'gzip' and 'Content-Length' not in response.headers
+        chunks = list(response.iter_encoded())
+        assert len(chunks) > 2
+        body = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(b''.join(chunks))
+        assert body == ''.join(f'line {i}\n' * 50 for i in range(20)).encode()
+        print("Streamed responses compressed chunk by chunk")
+
+        response = Client(compression.CompressionMiddleware(image)).get('/', headers=headers)
+        assert 'Content-Encoding' not in response.headers
+        print("Binary content skipped")
+
+        print("Compression test passed")
+        return True
+    except Exception as e:
+        print(f"Compression test failed: {e}")
+        return False
+
+def test_live_events():
+    """Test the Server-Sent Events feed for the admin dashboard"""
+    print("Testing live dashboard events...")
+    import events
+    original_path = os.environ.get('DATABASE_PATH')
+    original_max_streams = events.MAX_STREAMS
+    os.environ['DATABASE_PATH'] = os.path.join(tempfile.mkdtemp(), 'events.db')
+    try:
+        from app import save_complaint, transition_complaint_status
+
+        init_database()
+        conn = get_db_connection()
+        conn.execute("INSERT INTO users (name, email, password_hash) VALUES ('T', 't@example.com', 'x')")
+        conn.commit()
+        with app.test_client() as client:
+            with client.session_transaction() as sess:
+                sess['admin_id'] = 1
+            response = client.get('/api/admin/events', buffered=False)
+            assert response.status_code == 200 and response.mimetype == 'text/event-stream'
+            stream = iter(response.response)
+            assert next(stream).startswith(b'retry:')
+
+            complaint_id, _ = save_complaint('Roads', 'Low', 'Pothole', 'desc', 'loc', 'Zone 1', None, None, 1)
+            created = next(stream).decode()
+            assert 'event: complaint.created' in created and '"Pothole"' in created
+            transition_complaint_status(conn, 'Resolved', 'admin', ids=[complaint_id])
+            changed = next(stream).decode()
+            assert 'event: complaint.status_changed' in changed and '"old_status": "Submitted"' in changed
+            print("Created and status-changed events delivered")
+
+            last_id = int(created.split('\n')[0].split(': ')[1])
+            position, lost = events.bus.cursor(last_id)
+            replay, _ = events.bus.wait(position, 0)
+            assert not lost and [e['type'] for e in replay] == ['complaint.status_changed']
+            print("Streams resume after Last-Event-ID")
+
+            # A worker that subscribed after these events cannot replay them
+            fresh = events.EventBus()
+            fresh.listen()
+            latest_id = last_id + 1
+            assert fresh.cursor(last_id, latest_id)[1] and not fresh.cursor(latest_id, latest_id)[1]
+            assert events.bus.cursor(latest_id + 100, latest_id)[1]
+            print("Unreplayable gaps answered with resync")
+
+            # The dashboard starts from the id current at render, even if no event arrives before it hides
+            page = client.get('/admin/dashboard').get_data(as_text=True)
+            assert f'let lastEventId = {latest_id};' in page
+            print("Dashboard resumes from the event id it was rendered at")
+
+            events.MAX_STREAMS = 1
+            assert client.get('/api/admin/events').status_code == 503
+            response.close()
+            assert events.bus.open_stream()
+            events.bus.close_stream()
+            print("Open streams are capped and released on close")
+        conn.close()
+
+        print("Live events test passed")
+        return True
+    except Exception as e:
+        print(f"Live events test failed: {e}")
+        return False
+    finally:
+        events.MAX_STREAMS = original_max_streams
+        if original_path is None:
+            os.environ.pop('DATABASE_PATH', None)
+        else:
+            os.environ['DATABASE_PATH'] = original_path
+
+def test_media_store():
+    """Test content-addressed photo storage, thumbnails and the image route"""
+    print("Testing media store...")
+    import io
+    import media
+    from PIL import Image
+    original_path = os.environ.get('DATABASE_PATH')
+    original_root = media.MEDIA_ROOT
+    os.environ['DATABASE_PATH'] = os.path.join(tempfile.mkdtemp(), 'media.db')
+    media.MEDIA_ROOT = tempfile.mkdtemp()
+    try:
+        from app import save_complaint
+
+        photo = io.BytesIO()
+        Image.new('RGB', (1600, 1200), (200, 40, 40)).save(photo, 'JPEG')
+        digest = media.save(photo.getvalue())
+        assert media.save(photo.getvalue()) == digest
+        originals = [f for _, _, files in os.walk(os.path.join(media.MEDIA_ROOT, 'originals')) for f in files]
+        assert originals == [digest], originals
+        # Not mkstemp's 0600: nginx runs as another user
+        mode = os.stat(media.path(digest)).st_mode & 0o777
+        assert mode == 0o644 & ~media._UMASK and (media._UMASK & 0o044 or mode & 0o044 == 0o044), oct(mode)
+        print("Identical photos are stored once")
+
+        media.wait_for_thumbnails()
+        with Image.open(media.path(digest, 'small')) as thumbnail:
+            assert max(thumbnail.size) == media.THUMBNAIL_SIZES['small']
+        print("Thumbnails written in the background")
+
+        init_database()
+        conn = get_db_connection()
+        conn.execute("INSERT INTO users (name, email, password_hash) VALUES ('A', 'a@example.com', 'x')")
+        conn.execute("INSERT INTO users (name, email, password_hash) VALUES ('B', 'b@example.com', 'x')")
+        conn.commit()
+        conn.close()
+        complaint_id, _ = save_complaint('Roads', 'Low', 'Pothole', 'desc', 'loc', 'Zone 1', None, None, 1,
+                                         image_sha256=digest)
+        with app.test_client() as client:
+            with client.session_transaction() as sess:
+                sess['user_id'] = 1
+            response = client.get(f'/api/complaints/{complaint_id}/image', headers={'Range': 'bytes=0-99'})
+            assert response.status_code == 206 and len(response.data) == 100
+            assert response.mimetype == 'image/jpeg'
+            etag = response.headers['ETag']
+            response = client.get(f'/api/complaints/{complaint_id}/image', headers={'If-None-Match': etag})
+            assert response.status_code == 304
+            print("Owner gets range and conditional requests")
+
+            with client.session_transaction() as sess:
+                sess['user_id'] = 2
+            assert client.get(f'/api/complaints/{complaint_id}/image').status_code == 404
+            with client.session_transaction() as sess:
+                sess.pop('user_id')
+                sess['admin_id'] = 1
+            response = client.get(f'/api/complaints/{complaint_id}/image?size=large')
+            assert response.status_code == 200 and response.mimetype == 'image/jpeg'
+            assert client.get(f'/api/complaints/{complaint_id}/image?size=huge').status_code == 400
+            print("Other citizens are refused; admins see every photo")
+
+            media.ACCEL_PREFIX = '/protected-media/'
+            try:
+                response = client.get(f'/api/complaints/{complaint_id}/image?size=small')
+                assert response.headers['X-Accel-Redirect'] == (
+                    f'/protected-media/thumbs/small/{digest[:2]}/{digest[2:4]}/{digest}')
+                assert response.data == b''
+            finally:
+                media.ACCEL_PREFIX = ''
+            print("X-Accel-Redirect hands files to nginx")
+
+        print("Media store test passed")
+        return True
+    except Exception as e:
+        print(f"Media store test failed: {e}")
+        return False
+    finally:
+        media.MEDIA_ROOT = original_root
+        if original_path is None:
+            os.environ.pop('DATABASE_PATH', None)
+        else:
+            os.environ['DATABASE_PATH'] = original_path
+
+def test_upload_limits():
+    """Test the bounded multipart reader and early rejection of report uploads"""
+    print("Testing upload limits...")
+    import uploads
+    original_fields = dict(uploads.FILE_FIELDS)
+    original_max = uploads.MAX_CONTENT_LENGTH
+    try:
+        import io
+        import asyncio
+        import asgi
+        from werkzeug.exceptions import BadRequest, UnsupportedMediaType
+
+        jpeg = b'\xff\xd8\xff\xe0' + os.urandom(400 * 1024)
+        webm = b'\x1a\x45\xdf\xa3' + b'\x00' * 100
+
+        def part(name, data, filename=None):
+            disposition = f'form-data; name="{name}"' + (f'; filename="{filename}"' if filename is not None else '')
+            return f'--XyZ\r\nContent-Disposition: {disposition}\r\n\r\n'.encode() + data + b'\r\n'
+
+        body = (part('location_text', b'Ameerpet') + part('image', jpeg, 'a.jpg') +
+                part('audio', webm, '../../etc/passwd') + part('description', b'Pothole') + b'--XyZ--\r\n')
+        reader = uploads.MultipartReader(b'XyZ')
+        for start in range(0, len(body), 1000):
+            reader.feed(body[start:start + 1000])
+        form, files = reader.finish()
+        assert form['description'] == 'Pothole' and files['image'].read() == jpeg
+        assert files['image'].stream._rolled, "large files should be spooled to disk"
+        assert files['audio'].mimetype == 'audio/webm'
+        reader.close()
+        print("Fields parsed, files spooled and typed from their bytes")
+
+        reader = uploads.MultipartReader(b'XyZ')
+        try:
+            reader.feed(part('image', b'<html><script>alert(1)</script>', 'a.jpg'))
+            assert False, "a non-image should be refused as soon as its first bytes arrive"
+        except UnsupportedMediaType:
+            pass
+        empty = uploads.MultipartReader(b'XyZ')
+        empty.feed(part('audio', b'', '') + b'--XyZ--\r\n')
+        assert not empty.finish()[1]
+        print("Wrong types refused mid-stream; blank file inputs ignored")
+
+        # Text fields sent ahead of the files are checked before any file data is read
+        early = uploads.MultipartReader(b'XyZ', check_fields=uploads.check_report_fields)
+        try:
+            early.feed(part('description', b'Pothole') + b'--XyZ\r\nContent-Disposition: form-data; name="image"; '
+                       b'filename="a.jpg"\r\n\r\n')
+            assert False, "a report without a location should be refused at its first file"
+        except BadRequest as e:
+            assert 'Location' in e.description
+        files_first = uploads.MultipartReader(b'XyZ', check_fields=uploads.check_report_fields)
+        files_first.feed(part('image', jpeg, 'a.jpg') + part('location_text', b'Ameerpet') + b'--XyZ--\r\n')
+        assert files_first.finish()[0]['location_text'] == 'Ameerpet'
+        files_first.close()
+        print("Incomplete reports refused before their files")
+
+        with app.test_client() as client:
+            with client.session_transaction() as sess:
+                sess['user_id'] = 1
+            response = client.post('/api/report-issue', data={
+                'image': (io.BytesIO(b'GIF8not really'), 'a.jpg'), 'description': 'x', 'location_text': 'y'})
+            assert response.status_code == 415 and 'image' in response.get_json()['error']
+            response = client.post('/api/report-issue', data={
+                'image': (io.BytesIO(jpeg), 'a.jpg'), 'description': 'Pothole'})
+            assert response.status_code == 400 and 'Location' in response.get_json()['error']
+            response = client.post('/api/report-issue', data={
+                'image': (io.BytesIO(jpeg), 'a.jpg'), 'description': 'x' * (uploads.MAX_FIELD_BYTES + 1),
+                'location_text': 'y'})
+            assert response.status_code == 413
+            uploads.FILE_FIELDS['image'] = (1024, original_fields['image'][1])
+            response = client.post('/api/report-issue', data={
+                'image': (io.BytesIO(jpeg), 'a.jpg'), 'description': 'x', 'location_text': 'y'})
+            assert response.status_code == 413 and 'image' in response.get_json()['error']
+            uploads.MAX_CONTENT_LENGTH = 100
+            response = client.post('/api/report-issue', data={
+                'image': (io.BytesIO(jpeg), 'a.jpg'), 'description': 'x', 'location_text': 'y'})
+            assert response.status_code == 413
+            print("Size limits and missing fields rejected before the pipeline")
+
+        serializer = app.session_interface.get_signing_serializer(app)
+        cookie = f"{app.config['SESSION_COOKIE_NAME']}={serializer.dumps({'user_id': 1})}".encode()
+        messages = [{'type': 'http.request', 'body': part('image', b'%PDF-1.7 not a photo', 'a.jpg'),
+                     'more_body': True},
+                    {'type': 'http.request', 'body': b'x' * 100000, 'more_body': True}]
+        sent = []
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            await asyncio.sleep(3600)
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {'type': 'http', 'method': 'POST', 'path': '/api/report-issue', 'query_string': b'',
+                 'headers': [(b'content-type', b'multipart/form-data; boundary=XyZ'), (b'cookie', cookie)]}
+        asyncio.run(asgi.application(scope, receive, send))
+        assert sent[0]['status'] == 415 and len(messages) == 1
+        print("ASGI upload refused before the rest of the body was read")
+
+        print("Upload limits test passed")
+        return True
+    except Exception as e:
+        print(f"Upload limits test failed: {e}")
+        return False
+    finally:
+        uploads.FILE_FIELDS.update(original_fields)
+        uploads.MAX_CONTENT_LENGTH = original_max
+
 def main():
     """Run all tests"""
     print("FixMyHyd Application Test Suite")
@@ -139,7 +1323,26 @@ def main():
         test_database,
         test_routes,
         test_authentication,
-        test_api_endpoints
+        test_api_endpoints,
+        test_metrics_endpoint,
+        test_profiling_traces,
+        test_cold_start,
+        test_async_report_endpoint,
+        test_shared_cache,
+        test_status_transitions,
+        test_complaint_ids,
+        test_idempotent_submissions,
+        test_duplicate_detection,
+        test_geo_queries,
+        test_search,
+        test_trends,
+        test_sla,
+        test_conditional_get,
+        test_static_assets,
+        test_compression,
+        test_live_events,
+        test_media_store,
+        test_upload_limits
     ]
     
     passed = 0
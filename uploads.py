@@ -0,0 +1,272 @@
+"""
+FixMyHyd Uploads
+Bounded, streaming multipart parsing for report submissions.
+
+Werkzeug's form parser keeps text fields in memory however long they are
+and accepts files of any size and type. MultipartReader is fed the request
+body chunk by chunk (from the WSGI input stream, or from ASGI receive
+messages as they arrive) and enforces while it reads:
+
+    - UPLOAD_MAX_IMAGE_BYTES / UPLOAD_MAX_AUDIO_BYTES per file and
+      UPLOAD_MAX_FIELD_BYTES per text field (413)
+    - the file's type from its first bytes, not the client's Content-Type:
+      the photo must be JPEG, PNG, GIF, WebP or HEIC and the voice note a
+      known audio container (415)
+    - no file fields other than `image` and `audio` (400)
+
+It stops at the first violation, without reading the rest of the body.
+Files are spooled: held in memory up to UPLOAD_SPOOL_BYTES, then moved to a
+temporary file, so a worker's memory does not grow with the upload. The
+whole body is capped at MAX_CONTENT_LENGTH, which is checked against
+Content-Length before anything is read.
+
+validate_report() needs only the text fields and which files are present,
+so an incomplete report is refused before the pipeline loads the photo. When
+the client sends its text fields ahead of the files (the report form does),
+a missing or malformed location is refused at the first file part, before
+any file data is read; clients that send files first are checked once the
+body has been read.
+"""
+
+import os
+import tempfile
+from functools import wraps
+
+from flask import jsonify, request
+from werkzeug.datastructures import FileStorage, Headers, MultiDict
+from werkzeug.exceptions import BadRequest, HTTPException, RequestEntityTooLarge, UnsupportedMediaType
+from werkzeug.formparser import FormDataParser
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+
+import media
+from logging_config import get_logger
+
+logger = get_logger('uploads')
+
+MB = 1024 * 1024
+MAX_IMAGE_BYTES = int(os.getenv('UPLOAD_MAX_IMAGE_BYTES', str(10 * MB)))
+MAX_AUDIO_BYTES = int(os.getenv('UPLOAD_MAX_AUDIO_BYTES', str(10 * MB)))
+MAX_FIELD_BYTES = int(os.getenv('UPLOAD_MAX_FIELD_BYTES', str(16 * 1024)))
+SPOOL_BYTES = int(os.getenv('UPLOAD_SPOOL_BYTES', str(256 * 1024)))
+# Both files at their limits, plus the text fields and multipart framing
+MAX_CONTENT_LENGTH = MAX_IMAGE_BYTES + MAX_AUDIO_BYTES + MB
+MAX_PARTS = 16
+CHUNK_BYTES = 64 * 1024
+SNIFF_BYTES = 16
+
+# Leading bytes of the audio formats browsers record and phones save
+_AUDIO_SIGNATURES = [
+    (0, b'\x1a\x45\xdf\xa3', 'audio/webm'),
+    (0, b'OggS', 'audio/ogg'),
+    (8, b'WAVE', 'audio/wav'),
+    (0, b'ID3', 'audio/mpeg'),
+    (0, b'fLaC', 'audio/flac'),
+    (0, b'#!AMR', 'audio/amr'),
+    (4, b'ftyp', 'audio/mp4'),  # M4A and 3GP voice memos
+]
+
+
+def sniff_audio(head):
+    """MIME type of an audio file from its first bytes, or None if it is not a known audio format."""
+    if media.sniff_image(head):
+        # HEIC photos are ftyp containers too
+        return None
+    for offset, signature, mimetype in _AUDIO_SIGNATURES:
+        if head[offset:offset + len(signature)] == signature:
+            return mimetype
+    if len(head) > 1 and head[0] == 0xff and head[1] & 0xe0 == 0xe0:
+        # MPEG frame sync without an ID3 tag: layer bits 00 mean ADTS AAC
+        return 'audio/aac' if head[1] & 0x06 == 0 else 'audio/mpeg'
+    return None
+
+
+# File field: (size limit, type sniffer)
+FILE_FIELDS = {
+    'image': (MAX_IMAGE_BYTES, media.sniff_image),
+    'audio': (MAX_AUDIO_BYTES, sniff_audio),
+}
+
+
+class _FilePart:
+    def __init__(self, event):
+        self.limit, self._sniff = FILE_FIELDS[event.name]
+        self.event = event
+        self.size = 0
+        self.head = b''
+        self.mimetype = None
+        self.spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES, prefix='fixmyhyd-upload-')
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.limit:
+            raise RequestEntityTooLarge(f"The {self.event.name} file is larger than {self.limit // MB} MB.")
+        if self.mimetype is None and len(self.head) < SNIFF_BYTES:
+            self.head += data[:SNIFF_BYTES - len(self.head)]
+            if len(self.head) == SNIFF_BYTES:
+                self.sniff()
+        self.spool.write(data)
+
+    def sniff(self):
+        self.mimetype = self._sniff(self.head)
+        if self.mimetype is None:
+            raise UnsupportedMediaType(f"The {self.event.name} file is not a supported {self.event.name} format.")
+
+    def finish(self):
+        if self.mimetype is None:
+            self.sniff()
+        self.spool.seek(0)
+        return FileStorage(self.spool, self.event.filename, self.event.name, content_type=self.mimetype,
+                           content_length=self.size, headers=Headers(self.event.headers))
+
+
+class MultipartReader:
+    """Incremental multipart/form-data parser enforcing the upload limits: feed() chunks, then finish()."""
+
+    def __init__(self, boundary, check_fields=None):
+        # The decoder only buffers what it cannot emit yet (part headers, a partial boundary)
+        self._decoder = MultipartDecoder(boundary, max_form_memory_size=2 * CHUNK_BYTES, max_parts=MAX_PARTS)
+        # Called with the text fields that precede the first file, if any do; raises to refuse the form
+        self._check_fields = check_fields
+        self._fields = []
+        self._files = []
+        self._spools = []
+        self._part = None
+        self._value = None
+        self._complete = False
+
+    def feed(self, data):
+        try:
+            for start in range(0, len(data), CHUNK_BYTES):
+                self._decoder.receive_data(data[start:start + CHUNK_BYTES])
+                self._drain()
+        except BaseException:
+            self.close()
+            raise
+
+    def finish(self):
+        """(form, files) MultiDicts, once the whole body has been fed."""
+        try:
+            self._decoder.receive_data(None)
+            self._drain()
+            if not self._complete:
+                raise BadRequest("The upload ended before the form was complete.")
+        except BaseException:
+            self.close()
+            raise
+        return MultiDict(self._fields), MultiDict(self._files)
+
+    def close(self):
+        for spool in self._spools:
+            spool.close()
+
+    def _drain(self):
+        try:
+            event = self._decoder.next_event()
+            while not isinstance(event, (NeedData, Epilogue)):
+                if isinstance(event, File):
+                    if event.name not in FILE_FIELDS:
+                        raise BadRequest(f"Unexpected file field '{event.name}'.")
+                    if self._check_fields and self._fields and not self._spools:
+                        self._check_fields(MultiDict(self._fields))
+                    self._part = _FilePart(event)
+                    self._spools.append(self._part.spool)
+                elif isinstance(event, Field):
+                    self._part, self._value = event, bytearray()
+                elif isinstance(event, Data):
+                    self._write(event.data)
+                    if not event.more_data:
+                        self._end_part()
+                event = self._decoder.next_event()
+        except ValueError as e:
+            raise BadRequest(f"Malformed form data: {e}")
+        if isinstance(event, Epilogue):
+            self._complete = True
+
+    def _write(self, data):
+        if isinstance(self._part, _FilePart):
+            self._part.write(data)
+            return
+        self._value += data
+        if len(self._value) > MAX_FIELD_BYTES:
+            raise RequestEntityTooLarge(f"The {self._part.name} field is longer than {MAX_FIELD_BYTES} bytes.")
+
+    def _end_part(self):
+        part = self._part
+        if isinstance(part, _FilePart):
+            # Browsers send an empty, unnamed part for a file input left blank
+            if part.size or part.event.filename:
+                self._files.append((part.event.name, part.finish()))
+        else:
+            self._fields.append((part.name, self._value.decode('utf-8', 'replace')))
+        self._part = self._value = None
+
+
+class UploadParser(FormDataParser):
+    """Request form parser that reads multipart bodies through MultipartReader."""
+
+    def _parse_multipart(self, stream, mimetype, content_length, options):
+        boundary = options.get('boundary', '').encode('ascii')
+        if not boundary:
+            raise ValueError("Missing boundary")
+        reader = MultipartReader(boundary, check_fields=check_report_fields)
+        for chunk in iter(lambda: stream.read(CHUNK_BYTES), b''):
+            reader.feed(chunk)
+        form, files = reader.finish()
+        return stream, form, files
+
+
+def validate_report(form, files):
+    """Why a report submission is incomplete, or None; looks only at text fields and which files are present."""
+    if not files.get('image'):
+        return "Validation failed: An image file is mandatory."
+    if not form.get('description') and not files.get('audio'):
+        return "Validation failed: Either a text or voice description is mandatory."
+    return validate_location(form)
+
+
+def validate_location(form):
+    """Why a report's location is missing or malformed, or None; needs only the text fields."""
+    lat, lng = form.get('device_latitude'), form.get('device_longitude')
+    if lat and lng:
+        try:
+            float(lat), float(lng)
+        except ValueError:
+            return "Validation failed: Device coordinates must be numbers."
+    elif not form.get('location_text'):
+        return "Location data is required but was not provided."
+    return None
+
+
+def check_report_fields(form):
+    """MultipartReader check_fields hook: refuse a report without a usable location before reading its files."""
+    error = validate_location(form)
+    if error:
+        raise BadRequest(error)
+
+
+def report_upload(f):
+    """Read and validate the report form before the view and its other decorators run.
+
+    Goes under @user_required, so anonymous uploads are refused before their body is read.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if request.content_length is not None and request.content_length > MAX_CONTENT_LENGTH:
+            logger.info("Upload rejected: %d bytes declared", request.content_length)
+            return jsonify({"error": f"Upload too large (limit {MAX_CONTENT_LENGTH // MB} MB)."}), 413
+        request.form_data_parser_class = UploadParser
+        try:
+            error = validate_report(request.form, request.files)
+        except HTTPException as e:
+            logger.info("Upload rejected: %s", e.description)
+            return jsonify({"error": e.description}), e.code
+        if error:
+            logger.info("Report rejected: %s", error)
+            return jsonify({"error": error}), 400
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def init_app(app):
+    """Cap request bodies on every route; Flask answers 413 from Content-Length before reading."""
+    app.config.setdefault('MAX_CONTENT_LENGTH', MAX_CONTENT_LENGTH)